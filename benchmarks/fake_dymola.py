@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Fake translator used by the tests and the benchmarks in place of Dymola.
+
+It interprets the statements of the *mos* scripts written by modfmu: ``cd``, ``translateModelFMU`` (writes a dummy
+FMU), ``importFMU`` (writes a dummy model), ``savelog``, ``clearlog``, ``RunScript``,
+``Modelica.Utilities.Streams.print`` and the job loop of the sessions of :class:`modfmu.pool.TranslatorPool`.
+Anything else is ignored. Without a script argument, the statements are read from the standard input.
+The ``MODFMU_BENCH_COMPILE_TIME`` environment variable sets the time spent in each translation, in seconds.
+"""
+
+import os
+import re
+import sys
+import time
+import zipfile
+
+_statement = re.compile(r'^\s*([\w.]+)\((.*?)\);?\s*$', re.M)
+_string = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_session_loop = re.compile(r'^while not Modelica\.Utilities\.Files\.exist\("(.*?)"\) loop\n'
+                           r'\s*if Modelica\.Utilities\.Files\.exist\("(.*?)"\) then\n'
+                           r'\s*Modelica\.Utilities\.Files\.move\(".*?", "(.*?)", true\);\n'
+                           r'(?:.*\n)*?end while;\n', re.M)
+
+_model_description = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<fmiModelDescription fmiVersion="2.0" modelName="{model}" guid="{{bench-{name}}}">\n'
+                      '<CoSimulation modelIdentifier="{name}"/>\n<ModelVariables>\n'
+                      '<ScalarVariable name="k" valueReference="1" causality="parameter" variability="tunable">'
+                      '<Real start="1"/></ScalarVariable>\n'
+                      '<ScalarVariable name="x" valueReference="2" causality="output"><Real/></ScalarVariable>\n'
+                      '</ModelVariables>\n</fmiModelDescription>\n')
+
+_translation_log = ('Translation of {model}:\n\nStatistics\n\n  Original Model\n    Number of components: 3\n'
+                    '    Equations: 2\n  Translated Model\n    Continuous time states: 1\n'
+                    'Translation time: {time} s\n\nFMU generated {name}.fmu\n')
+
+
+class _Interpreter(object):
+    """State of the fake translator: its log, kept from one script to the next one
+    """
+
+    def __init__(self):
+        self.compile_time = float(os.environ.get('MODFMU_BENCH_COMPILE_TIME', '0'))
+        self.log = list()
+        self.exited = False
+
+    def run(self, script):
+        """ Runs the statements of a script, and the job loop of a session script
+        """
+        loop = _session_loop.search(script)
+        self.statements(script[:loop.start()] if loop else script)
+        if loop:
+            stop, job, running = loop.groups()
+            while not os.path.exists(stop) and not self.exited:
+                if os.path.exists(job):
+                    os.replace(job, running)
+                    self.run_file(running)
+                else:
+                    time.sleep(0.005)
+            self.statements(script[loop.end():])
+
+    def run_file(self, path):
+        with open(path, 'r') as f:
+            self.run(f.read())
+
+    def statements(self, script):
+        for function, arguments in _statement.findall(script):
+            if self.exited:
+                return
+            self.statement(function, [s.replace('\\\\', '\\') for s in _string.findall(arguments)])
+
+    def statement(self, function, strings):
+        if function == 'cd' and strings:
+            os.makedirs(strings[0], exist_ok=True)
+            os.chdir(strings[0])
+        elif function == 'translateModelFMU' and len(strings) >= 2:
+            model, name = strings[0], strings[1]
+            time.sleep(self.compile_time)
+            with zipfile.ZipFile(name + '.fmu', 'w', compression=zipfile.ZIP_DEFLATED) as z:
+                z.writestr('modelDescription.xml', _model_description.format(model=model, name=name))
+                z.writestr('binaries/linux64/{}.so'.format(name), b'\0' * 4096)
+            self.log.append(_translation_log.format(model=model, name=name, time=self.compile_time))
+        elif function == 'importFMU' and strings:
+            name = os.path.splitext(os.path.basename(strings[0]))[0] + '_fmu'
+            with open(name + '.mo', 'w') as f:
+                f.write('within {0};\nmodel {1}\nend {1};\n'.format(strings[-1], name))
+            self.log.append('Importing {}'.format(strings[0]))
+        elif function == 'savelog' and strings:
+            with open(strings[0], 'w') as f:
+                f.write('\n'.join(self.log) + '\n')
+        elif function == 'clearlog':
+            self.log = list()
+        elif function == 'RunScript' and strings:
+            self.run_file(strings[0])
+        elif function == 'Modelica.Utilities.Streams.print' and len(strings) >= 2:
+            with open(strings[1], 'a') as f:
+                f.write(strings[0] + '\n')
+        elif function == 'Modelica.Utilities.Streams.print' and strings:
+            self.log.append(strings[0])
+        elif function == 'Modelica.Utilities.System.exit':
+            self.exited = True
+
+
+def main(mos_file=None):
+    interpreter = _Interpreter()
+    if mos_file is not None:
+        interpreter.run_file(mos_file)
+        return 0
+    for line in sys.stdin:
+        interpreter.run(line)
+        if interpreter.exited:
+            break
+    return 0
+
+
+if __name__ == "__main__":
+    # the script is the first argument, if any. Other arguments, such as /nowindow, are ignored.
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 and os.path.isfile(sys.argv[1]) else None))
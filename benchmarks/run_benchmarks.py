@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the orchestration overhead of modfmu.
+
+Synthetic libraries are translated with a fake translator (see ``fake_dymola.py``) which writes dummy FMUs and logs
+at once, so that the measured time is the time spent by modfmu itself: package scans, script generation, process
+supervision, log reading and reporting.
+
+Each case runs in a fresh interpreter, so that its peak memory is not hidden by the previous ones. The results are
+appended to a JSON lines file, one line per case and size, tagged with the version of modfmu, so that regressions
+between releases can be seen with ``--compare``.
+
+Usage:
+
+    python benchmarks/run_benchmarks.py --cases package translate_package --sizes 10 100 1000 --compare
+
+Measures: wall time, CPU time of the benchmark process and of the translator processes it started, read and write
+system calls of the benchmark process (``/proc/self/io``, Linux only) and peak resident memory.
+"""
+
+import os
+import sys
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_default_sizes = {'package': [10, 100, 1000, 10000],
+                  'index': [10, 100, 1000, 10000],
+                  'script_generation': [10, 100, 1000, 10000],
+                  'translate_package': [10, 100, 1000],
+                  'import': [10, 100, 1000],
+                  'startup': [1, 100]}
+
+
+def _proc_io():
+    """ I/O counters of the current process, or None if not available
+    """
+    try:
+        with open('/proc/self/io', 'r') as f:
+            return {k: int(v) for k, v in (l.split(':') for l in f if ':' in l)}
+    except OSError:
+        return None
+
+
+def _fake_translator(directory):
+    """ Writes an executable named ``Dymola`` running ``fake_dymola.py`` in ``directory``, and puts it first on the PATH
+    """
+    import stat
+
+    fake = os.path.join(_here, 'fake_dymola.py')
+    if sys.platform == 'win32':
+        with open(os.path.join(directory, 'Dymola.bat'), 'w') as f:
+            f.write('@"{0}" "{1}" %*\n'.format(sys.executable, fake))
+    path = os.path.join(directory, 'Dymola')
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\nexec "{0}" "{1}" "$@"\n'.format(sys.executable, fake))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ['PATH'] = directory + os.pathsep + os.environ.get('PATH', '')
+
+
+def _setup_package(directory, size, options):
+    from benchmarks.synthetic import make_library
+
+    root, packages = make_library(directory, size)
+
+    def run():
+        from modfmu.modelica import Package
+        library = Package(root)
+        library.models, library.children
+        for d in packages:
+            Package(d).models
+    return run
+
+
+def _setup_index(directory, size, options):
+    from benchmarks.synthetic import make_library
+
+    root, packages = make_library(directory, size)
+
+    def run():
+        from modfmu.library_index import LibraryIndex
+        index = LibraryIndex(root)
+        index.refresh()  # builds the index
+        index = LibraryIndex(root)
+        index.refresh()  # reads the index and checks the library for changes
+        index.children(index.name)
+    return run
+
+
+def _setup_script_generation(directory, size, options):
+    from modfmu.reporter import Reporter
+    from modfmu.fmu_translator import FMUTranslator, FMUBatchTranslator
+    from benchmarks.synthetic import make_library
+
+    root, packages = make_library(directory, 1)
+    report = Reporter(os.path.join(directory, 'bench.log'))
+    translators = [FMUTranslator('BenchLib.P0.M{}'.format(i), 'Dymola', output_directory=os.path.join(directory, 'M{}'.format(i)),
+                                 package_path=[os.path.join(root, 'package.mo')], reporter=report) for i in range(size)]
+    batch = FMUBatchTranslator(translators, 'Dymola', output_directory=directory, reporter=report)
+
+    def run():
+        for t in translators:
+            t._get_dymola_commands()
+        batch._get_dymola_commands()
+    return run
+
+
+def _setup_translate_package(directory, size, options):
+    from benchmarks.synthetic import make_library
+
+    root, packages = make_library(directory, size, models_per_package=size)
+
+    def run():
+        from modfmu.modelica import Package
+        from modfmu.fmu_translator import translate_package
+        from modfmu.pool import TranslatorPool
+
+        pool = TranslatorPool('Dymola', size=options['jobs'], packages=[os.path.join(root, 'package.mo')]) \
+            if options.get('pool') else None
+        try:
+            results = translate_package(Package(packages[0]), jobs=options['jobs'], batch_size=options['batch_size'],
+                                        history=False, pool=pool)
+        finally:
+            if pool is not None:
+                pool.close()
+        failed = [m for m, r in results.items() if not r.success]
+        if failed:
+            raise RuntimeError('{} models failed, e.g. {}'.format(len(failed), failed[0]))
+    return run
+
+
+def _setup_import(directory, size, options):
+    import zipfile
+    from benchmarks.synthetic import make_library
+    from modfmu.modelica import Package
+
+    root, packages = make_library(directory, 1)
+    fmu_pck = Package(os.path.join(root, 'FMUs'))
+    fmus = list()
+    for i in range(size):
+        fmus.append(os.path.join(directory, 'M{}.fmu'.format(i)))
+        with zipfile.ZipFile(fmus[-1], 'w') as z:
+            z.writestr('modelDescription.xml', '<fmiModelDescription fmiVersion="2.0" modelName="M{}"/>'.format(i))
+
+    def run():
+        from modfmu.fmu_translator import FMUImport, FMUBatchImport
+        if options['batch_size'] is None:
+            for f in fmus:
+                if not FMUImport(fmu_pck, f).import_fmu():
+                    raise RuntimeError('Import of {} failed'.format(f))
+            return
+        for i in range(0, len(fmus), options['batch_size']):
+            results = FMUBatchImport(fmu_pck, fmus[i:i + options['batch_size']]).import_fmus()
+            failed = [r.fmu_path for r in results if not r]
+            if failed:
+                raise RuntimeError('{} imports failed, e.g. {}'.format(len(failed), failed[0]))
+    return run
+
+
+# modules that importing modfmu and constructing its translators must not load
+_heavy_modules = ('buildingspy', 'matplotlib', 'numpy', 'pandas', 'tkinter')
+
+
+def _setup_startup(directory, size, options):
+    from benchmarks.synthetic import make_library
+
+    root, packages = make_library(directory, 1)
+
+    def run():
+        import modfmu
+        from modfmu.modelica import Package
+        from modfmu.fmu_translator import FMUTranslator, translate_package
+
+        pck = Package(packages[0])
+        for i in range(size):
+            FMUTranslator('BenchLib.P0.M{}'.format(i), 'Dymola', output_directory=os.path.join(directory, 'M{}'.format(i)),
+                          package_path=[os.path.join(root, 'package.mo')])
+        loaded = [m for m in _heavy_modules if m in sys.modules]
+        if loaded:
+            raise RuntimeError('modfmu loaded {} at startup'.format(', '.join(loaded)))
+    return run
+
+
+_cases = {'package': _setup_package,
+          'index': _setup_index,
+          'script_generation': _setup_script_generation,
+          'translate_package': _setup_translate_package,
+          'import': _setup_import,
+          'startup': _setup_startup}
+
+
+def measure(case, size, options):
+    """ Runs a case in the current process and measures it
+
+    :return: dictionary of the measures
+    """
+    import resource
+    import shutil
+    import tempfile
+    import time
+
+    directory = tempfile.mkdtemp(prefix='modfmu_bench_')
+    try:
+        _fake_translator(directory)
+        run = _cases[case](os.path.join(directory, 'work'), size, options)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        io_before = _proc_io()
+        self_before = resource.getrusage(resource.RUSAGE_SELF)
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+
+        run()
+
+        wall = time.perf_counter() - start
+        self_after = resource.getrusage(resource.RUSAGE_SELF)
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        io_after = _proc_io()
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        rss_unit = 1 if sys.platform == 'darwin' else 1024
+        return {'wall': wall,
+                'cpu': self_after.ru_utime - self_before.ru_utime + self_after.ru_stime - self_before.ru_stime,
+                'cpu_translator': children_after.ru_utime - children_before.ru_utime +
+                                  children_after.ru_stime - children_before.ru_stime,
+                'syscalls_read': io_after['syscr'] - io_before['syscr'] if io_before else None,
+                'syscalls_write': io_after['syscw'] - io_before['syscw'] if io_before else None,
+                'peak_rss': self_after.ru_maxrss * rss_unit,
+                'peak_rss_increase': (self_after.ru_maxrss - rss_before) * rss_unit}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _version():
+    """ Version of modfmu and commit of the working tree, if any
+    """
+    import subprocess
+
+    try:
+        from importlib.metadata import version
+        modfmu_version = version('modfmu')
+    except Exception:
+        modfmu_version = 'unknown'
+    try:
+        root = os.path.dirname(_here)
+        commit = subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=root,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return modfmu_version, commit
+
+
+def _run_isolated(case, size, options):
+    """ Runs a case in a fresh interpreter
+    """
+    import json
+    import subprocess
+
+    cmd = [sys.executable, os.path.abspath(__file__), '--single', case, str(size), '--jobs', str(options['jobs'])]
+    if options['batch_size'] is not None:
+        cmd += ['--batch-size', str(options['batch_size'])]
+    if options.get('pool'):
+        cmd += ['--pool']
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(_here)] + [p for p in [env.get('PYTHONPATH')] if p])
+    out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    if out.returncode != 0:
+        raise RuntimeError('Benchmark {} {} failed:\n{}'.format(case, size, out.stderr.decode(errors='replace')))
+    return json.loads(out.stdout.decode().strip().splitlines()[-1])
+
+
+def _previous(results_file, case, size, options, commit):
+    """ Last result of the same case recorded for another commit, or None
+    """
+    import json
+
+    previous = None
+    try:
+        with open(results_file, 'r') as f:
+            for line in f:
+                r = json.loads(line)
+                if r['case'] == case and r['size'] == size and r['options'] == options and r['commit'] != commit:
+                    previous = r
+    except (OSError, ValueError):
+        pass
+    return previous
+
+
+def main(argv=None):
+    import argparse
+    import datetime
+    import json
+    import platform
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the orchestration overhead of modfmu.')
+    parser.add_argument('--cases', nargs='+', choices=sorted(_cases), default=sorted(_cases))
+    parser.add_argument('--sizes', nargs='+', type=int, default=None, help='numbers of models. Default depends on the case.')
+    parser.add_argument('--jobs', type=int, default=1, help='jobs of translate_package')
+    parser.add_argument('--batch-size', type=int, default=None, help='batch_size of translate_package, and FMUs per session of import')
+    parser.add_argument('--pool', action='store_true', help='translate_package with a pool of translator sessions')
+    parser.add_argument('--output', default=os.path.join(_here, 'results.jsonl'), help='file the results are appended to')
+    parser.add_argument('--compare', action='store_true', help='compare with the last results of another commit')
+    parser.add_argument('--single', nargs=2, metavar=('CASE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    options = {'jobs': args.jobs, 'batch_size': args.batch_size}
+    if args.pool:
+        options['pool'] = True
+
+    if args.single:
+        print(json.dumps(measure(args.single[0], int(args.single[1]), options)))
+        return 0
+
+    modfmu_version, commit = _version()
+    print('{:<18} {:>6} {:>9} {:>8} {:>15} {:>10} {:>10} {:>8}'.format('case', 'size', 'wall [s]', 'cpu [s]',
+                                                                      'translator cpu', 'syscalls', 'peak [MB]', 'vs prev'))
+    for case in args.cases:
+        for size in args.sizes or _default_sizes[case]:
+            metrics = _run_isolated(case, size, options)
+            previous = _previous(args.output, case, size, options, commit) if args.compare else None
+            record = {'case': case, 'size': size, 'options': options, 'version': modfmu_version, 'commit': commit,
+                      'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                      'python': platform.python_version(), 'platform': platform.platform()}
+            record.update(metrics)
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+            syscalls = metrics['syscalls_read'] + metrics['syscalls_write'] if metrics['syscalls_read'] is not None else '-'
+            ratio = '{:.2f}x'.format(metrics['wall'] / previous['wall']) if previous and previous['wall'] > 0 else '-'
+            print('{:<18} {:>6} {:>9.3f} {:>8.3f} {:>15.3f} {:>10} {:>10.1f} {:>8}'.format(
+                case, size, metrics['wall'], metrics['cpu'], metrics['cpu_translator'], syscalls,
+                metrics['peak_rss'] / 1024 ** 2, ratio))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(_here))
+    sys.exit(main())
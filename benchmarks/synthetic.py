@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Generation of synthetic Modelica libraries for the tests and the benchmarks.
+"""
+
+
+def make_library(directory, n_models, models_per_package=100, name='BenchLib'):
+    """ Writes a library of ``n_models`` models, split into sub packages of at most ``models_per_package`` models.
+
+    Every model extends a partial base model and uses a component of the previous model of its package, so that the
+    dependency graph is not trivial.
+
+    :param directory: directory in which the library directory is created
+    :param n_models: number of models
+    :param models_per_package: maximum number of models per sub package
+    :param name: name of the library
+    :return: tuple ``(root directory of the library, list of the sub package directories)``
+    """
+    import os
+
+    root = os.path.join(directory, name)
+    os.makedirs(root)
+    n_packages = max(1, -(-n_models // models_per_package))
+    packages = ['P{}'.format(p) for p in range(n_packages)]
+
+    with open(os.path.join(root, 'package.mo'), 'w') as f:
+        f.write('package {0}\n  partial model Base\n    parameter Real k = 1;\n  end Base;\nend {0};\n'.format(name))
+    with open(os.path.join(root, 'package.order'), 'w') as f:
+        f.write(''.join(p + '\n' for p in packages))
+
+    directories = list()
+    for p, package in enumerate(packages):
+        pck_dir = os.path.join(root, package)
+        os.makedirs(pck_dir)
+        directories.append(pck_dir)
+        models = ['M{}'.format(i) for i in range(p * models_per_package, min(n_models, (p + 1) * models_per_package))]
+        with open(os.path.join(pck_dir, 'package.mo'), 'w') as f:
+            f.write('within {0};\npackage {1}\n  extends Modelica.Icons.Package;\nend {1};\n'.format(name, package))
+        with open(os.path.join(pck_dir, 'package.order'), 'w') as f:
+            f.write(''.join(m + '\n' for m in models))
+        for i, model in enumerate(models):
+            with open(os.path.join(pck_dir, model + '.mo'), 'w') as f:
+                f.write('within {0}.{1};\nmodel {2} "Synthetic model"\n  extends {0}.Base(k={3});\n'.format(
+                    name, package, model, i))
+                if i > 0:
+                    f.write('  {} previous;\n'.format(models[i - 1]))
+                f.write('  Real x(start=1);\nequation\n  der(x) = -k*x;\nend {};\n'.format(model))
+    return root, directories
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of translated FMUs.
+
+An FMU is stored under a key hashing the Modelica sources of the model, the translation script
+and the identity of the translator, so that an unchanged model is restored instead of being translated again.
+"""
+
+
+class FMUCache(object):
+    """Size-bounded store of FMUs, with least recently used eviction.
+
+    Entries are stored as ``<directory>/<key[:2]>/<key>.fmu``. The modification time of an entry is
+    updated each time it is used, so that the cache can be shared between runs and between processes
+    without any index file.
+
+    Usage:
+        >>> cache = FMUCache('/var/cache/modfmu', max_size=20 * 1024 ** 3)
+        >>> results = translate_package(pck, jobs=8, cache=cache)
+        >>> cache.stats
+    """
+    _stats_file = 'stats.json'
+    _suffix = '.fmu'
+
+    def __init__(self, directory, max_size=10 * 1024 ** 3, translator_id=None):
+        """
+
+        :param directory: directory of the cache, created if it does not exist
+        :param max_size: maximum size of the cache in bytes
+        :param translator_id: string identifying the translator (e.g. its version). If None, the
+            translator is identified from its executable.
+        """
+        import os
+        import threading
+
+        if max_size <= 0:
+            raise ValueError('max_size must be a positive number of bytes. Got {} instead'.format(max_size))
+
+        self._directory = os.path.realpath(directory)
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+        self._max_size = max_size
+        self._translator_id = translator_id
+        self._lock = threading.RLock()
+        self._digests = dict()  # path -> (mtime_ns, size, digest)
+        self._entries = dict()  # key -> [size, last access]
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._scan()
+        self._evict()
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value):
+        if value <= 0:
+            raise ValueError('max_size must be a positive number of bytes. Got {} instead'.format(value))
+        self._max_size = value
+        with self._lock:
+            self._evict()
+
+    @property
+    def size(self):
+        """Total size of the cached FMUs in bytes
+        """
+        with self._lock:
+            return sum(e[0] for e in self._entries.values())
+
+    @property
+    def stats(self):
+        """Hit/miss statistics of the current session, and of all the sessions using this cache directory
+
+        :return: dictionary with the keys ``hits``, ``misses``, ``evictions``, ``entries``, ``size``
+            and ``total_hits``, ``total_misses``, ``total_evictions``
+        """
+        with self._lock:
+            totals = self._load_stats()
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'evictions': self._evictions,
+                    'entries': len(self._entries),
+                    'size': self.size,
+                    'total_hits': totals['hits'] + self._hits,
+                    'total_misses': totals['misses'] + self._misses,
+                    'total_evictions': totals['evictions'] + self._evictions}
+
+    def _entry_path(self, key):
+        import os
+        return os.path.join(self._directory, key[:2], key + self._suffix)
+
+    def _scan(self):
+        """ Lists the entries already present in the cache directory
+        """
+        import os
+
+        for d in os.scandir(self._directory):
+            if not d.is_dir():
+                continue
+            for f in os.scandir(d.path):
+                if f.name.endswith(self._suffix):
+                    st = f.stat()
+                    self._entries[f.name[:-len(self._suffix)]] = [st.st_size, st.st_mtime]
+
+    def _load_stats(self):
+        import json
+        import os
+
+        try:
+            with open(os.path.join(self._directory, self._stats_file), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def save_stats(self):
+        """ Adds the statistics of the current session to the totals stored in the cache directory
+        """
+        import json
+        import os
+
+        with self._lock:
+            totals = self._load_stats()
+            totals = {'hits': totals['hits'] + self._hits,
+                      'misses': totals['misses'] + self._misses,
+                      'evictions': totals['evictions'] + self._evictions}
+            tmp = os.path.join(self._directory, '{}.{}.tmp'.format(self._stats_file, os.getpid()))
+            with open(tmp, 'w') as f:
+                json.dump(totals, f)
+            os.replace(tmp, os.path.join(self._directory, self._stats_file))
+            self._hits = self._misses = self._evictions = 0
+
+    def translator_identity(self, modelica_exe):
+        """ String identifying the translator: the given identifier, or the path, size and modification
+        time of its executable.
+
+        :param modelica_exe: name of the translator executable
+        """
+        import os
+        import shutil
+
+        if self._translator_id is not None:
+            return self._translator_id
+        exe = shutil.which(modelica_exe)
+        if exe is None:
+            return modelica_exe
+        st = os.stat(exe)
+        return '{}:{}:{}'.format(os.path.realpath(exe), st.st_size, st.st_mtime_ns)
+
+    def file_digest(self, path):
+        """ sha256 digest of a file. Digests are remembered as long as the file size and modification time
+        do not change.
+        """
+        import hashlib
+        import os
+
+        st = os.stat(path)
+        with self._lock:
+            known = self._digests.get(path)
+        if known is not None and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+            return known[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def key(self, fmutrans, source_files=None):
+        """ Key of the FMU produced by a translator.
+
+        :param fmutrans: the :class:`modfmu.fmu_translator.FMUTranslator`
+        :param source_files: Modelica files the model depends on. Defaults to ``fmutrans.source_files()``.
+        :return: hexadecimal sha256 digest
+        """
+        import hashlib
+        import os
+
+        if source_files is None:
+            source_files = fmutrans.source_files()
+
+        h = hashlib.sha256()
+
+        def add(value):
+            value = str(value).encode('utf-8')
+            h.update(str(len(value)).encode('ascii') + b':' + value)
+
+        add(self.translator_identity(fmutrans._modelica_exe))
+        for value in (fmutrans.model_path, fmutrans.modifier, fmutrans.fmu_name, fmutrans._fmi_version,
+                      fmutrans._fmi_type, fmutrans._include_src, fmutrans._store_result):
+            add(value)
+        # openModel statements hold the absolute path of the library, whose content is hashed below
+        for p in fmutrans._preProcessing:
+            if not p.startswith('openModel('):
+                add(p)
+        add('--')
+        for p in fmutrans._postProcessing:
+            add(p)
+        add('--')
+        # FMUs repacked with another policy hold other entries
+        if fmutrans.repack is not None:
+            add(fmutrans.repack.key())
+        # sources are identified relatively to their common root, so that checkouts at different places share keys
+        source_files = sorted(os.path.realpath(s) for s in source_files)
+        root = os.path.dirname(os.path.commonpath(source_files)) if source_files else ''
+        for s in source_files:
+            add(os.path.relpath(s, root).replace(os.path.sep, '/'))
+            add(self.file_digest(s))
+        return h.hexdigest()
+
+    def fetch(self, key, fmu_path):
+        """ Restores a cached FMU.
+
+        The FMU is hard-linked to ``fmu_path`` when possible, and copied otherwise. As it may share its data
+        with the cache, the restored FMU must be replaced rather than modified in place. Entries stored by
+        other processes sharing the cache directory since it was scanned are restored as well.
+
+        :return: True on a cache hit, False otherwise
+        """
+        import os
+        import shutil
+        import time
+
+        entry = self._entry_path(key)
+        with self._lock:
+            now = time.time()
+            try:
+                os.utime(entry, (now, now))
+                # the entry may have been stored by another process, it is evicted by the next store if need be
+                self._entries[key] = [os.path.getsize(entry), now]
+            except FileNotFoundError:
+                self._entries.pop(key, None)
+                self._misses += 1
+                return False
+            self._hits += 1
+
+        if os.path.lexists(fmu_path):
+            os.remove(fmu_path)
+        try:
+            os.link(entry, fmu_path)
+        except OSError:
+            shutil.copy2(entry, fmu_path)
+        return True
+
+    def store(self, key, fmu_path):
+        """ Adds an FMU to the cache, then evicts the least recently used entries if the cache is too large.
+        """
+        import os
+        import shutil
+        import threading
+        import time
+
+        entry = self._entry_path(key)
+        if not os.path.exists(os.path.dirname(entry)):
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = '{}.{}.{}.tmp'.format(entry, os.getpid(), threading.get_ident())
+        try:
+            os.link(fmu_path, tmp)
+        except OSError:
+            shutil.copy2(fmu_path, tmp)
+        os.replace(tmp, entry)
+        now = time.time()
+        os.utime(entry, (now, now))
+        with self._lock:
+            self._entries[key] = [os.path.getsize(entry), now]
+            self._evict()
+
+    def _evict(self):
+        """ Removes the least recently used entries until the cache fits in ``max_size``
+        """
+        import os
+
+        total = sum(e[0] for e in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if total <= self._max_size:
+                break
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+            total -= self._entries.pop(key)[0]
+            self._evictions += 1
+
+    def clear(self):
+        """ Removes all the entries of the cache
+        """
+        import os
+
+        with self._lock:
+            for key in list(self._entries):
+                try:
+                    os.remove(self._entry_path(key))
+                except FileNotFoundError:
+                    pass
+                del self._entries[key]
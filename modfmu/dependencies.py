@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency graph between the files of a Modelica library.
+
+The graph is built from the ``within`` clause, the ``import`` clauses and every class name used in a file
+(``extends`` clauses, component types, function calls, ...). Names are resolved the way Modelica looks up
+classes: first in the enclosing scopes of the class, then through the imports. Names that do not resolve
+to a class of the library (e.g. ``Modelica.*`` or ``Real``) are ignored.
+"""
+
+import re
+
+from modfmu.modelica_parser import class_definitions, keywords, read_code
+
+_within = re.compile(r'^\s*within\s*([\w.]*)\s*;')
+_import = re.compile(r'\bimport\s+(?:(\w+)\s*=\s*)?([\w.]+?)(\.\*|\.\{([\w\s,]*)\})?\s*;')
+_name = re.compile(r'(?<![\w.])([A-Za-z_]\w*(?:\s*\.\s*[A-Za-z_]\w*)*)')
+
+
+def parse_modelica_file(path):
+    """ Extracts what the dependency graph needs from a Modelica file.
+
+    :param path: path of the ``.mo`` file
+    :return: tuple ``(within, classes, imports, names)`` where ``within`` is the name of the enclosing package,
+        ``classes`` the names of the classes defined in the file (the first one being the main class),
+        ``imports`` a tuple ``(aliases, wildcards)`` and ``names`` the set of class names used in the file.
+    """
+    text = read_code(path)
+
+    m = _within.match(text)
+    within = m.group(1) if m else ''
+    if m:
+        text = text[m.end():]
+
+    classes = [name for name, kind, partial in class_definitions(text)]
+
+    aliases = dict()
+    wildcards = list()
+    for alias, target, suffix, members in _import.findall(text):
+        if suffix == '.*':
+            wildcards.append(target)
+        elif members:
+            for member in members.split(','):
+                if member.strip():
+                    aliases[member.strip()] = target + '.' + member.strip()
+        else:
+            aliases[alias or target.split('.')[-1]] = target
+
+    names = set()
+    for n in _name.findall(text):
+        n = re.sub(r'\s+', '', n)
+        if n.split('.')[0] not in keywords:
+            names.add(n)
+    return within, classes, (aliases, wildcards), names
+
+
+class DependencyGraph(object):
+    """Graph of the dependencies between the ``.mo`` files of a Modelica library.
+
+    Usage:
+        >>> graph = DependencyGraph.from_package(pck)
+        >>> graph.closure('/path/to/MyLib/Sub/A.mo')   # files the translation of A depends on
+        >>> graph.dependents(['/path/to/MyLib/Sub/Base.mo'])   # files to translate again when Base changes
+    """
+
+    def __init__(self, files, parsed=None):
+        """
+
+        :param files: paths of the ``.mo`` files of the library
+        :param parsed: dictionary mapping the real paths of files to the result of :func:`parse_modelica_file`, e.g.
+            as kept by :meth:`modfmu.library_index.LibraryIndex.parse_files`. The other files are parsed.
+        """
+        import os
+
+        self._files = sorted(set(os.path.realpath(f) for f in files))
+        self._parsed = dict()  # file -> (main class, classes defined in the file, imports, names)
+        self._classes = dict()  # class name -> file
+        self._main_class = dict()  # file -> name of the class defined in the file
+        self._dependencies = dict()  # file -> set of files
+        self._dependents = None
+        self._digests = dict()
+        self._root = os.path.commonpath(self._files) if self._files else ''
+        self._parse(self._files, parsed)
+        self._index_classes()
+        self._link(self._files)
+
+    @classmethod
+    def from_package(cls, pck):
+        """ Dependency graph of the whole library a package belongs to.
+
+        :param pck: any package of the library
+        :type pck: modfmu.modelica.Package
+        """
+        files = pck.index.files()
+        return cls(files, pck.index.parse_files(files))
+
+    def updated(self, files, changed, parsed=None):
+        """ Graph of the library once some of its files changed, this graph being left as it is.
+
+        Only the changed files are parsed and have their dependencies resolved again. The dependencies of the other
+        files are resolved again only if the classes defined in the library changed, e.g. when a file is added.
+
+        :param files: paths of all the ``.mo`` files of the library
+        :param changed: paths of the files that changed, were added or were removed since this graph was built
+        :param parsed: see the constructor
+        :return: a new :class:`DependencyGraph`
+        """
+        import copy
+        import os
+
+        changed = set(os.path.realpath(p) for p in changed)
+        graph = copy.copy(self)
+        graph._files = sorted(set(os.path.realpath(f) for f in files))
+        kept = set(graph._files) - changed
+        graph._parsed = {f: p for f, p in self._parsed.items() if f in kept}
+        graph._parse([f for f in graph._files if f not in kept or f not in self._dependencies], parsed)
+        graph._index_classes()
+        graph._dependents = None
+        graph._digests = {f: d for f, d in self._digests.items() if f in kept}
+        graph._root = os.path.commonpath(graph._files) if graph._files else ''
+        if graph._classes == self._classes:
+            graph._dependencies = {f: d for f, d in self._dependencies.items() if f in kept}
+            graph._link([f for f in graph._files if f not in graph._dependencies])
+        else:
+            graph._dependencies = dict()
+            graph._link(graph._files)
+        return graph
+
+    @property
+    def files(self):
+        return self._files
+
+    def class_name(self, path):
+        """ Fully qualified name of the class defined in a file
+        """
+        import os
+        return self._main_class.get(os.path.realpath(path))
+
+    def class_file(self, class_name):
+        """ File defining a class, or None if the class is not part of the library
+        """
+        return self._classes.get(class_name)
+
+    def _parse(self, files, parsed=None):
+        """ Parses files, or takes them from ``parsed``
+        """
+        for f in files:
+            result = parsed.get(f) if parsed else None
+            within, classes, imports, names = result if result is not None else parse_modelica_file(f)
+            if classes:
+                main = '.'.join([within, classes[0]]) if within else classes[0]
+                self._parsed[f] = (main, classes, imports, names)
+
+    def _index_classes(self):
+        """ Maps the classes to the files defining them
+        """
+        self._classes = dict()
+        self._main_class = dict()
+        for f in self._files:
+            if f not in self._parsed:
+                continue
+            main, classes, imports, names = self._parsed[f]
+            self._main_class[f] = main
+            self._classes[main] = f
+            for c in classes[1:]:
+                self._classes.setdefault(main + '.' + c, f)
+
+    def _link(self, files):
+        """ Resolves the dependencies of files
+        """
+        for f in files:
+            deps = set()
+            # files without any class definition have no dependencies
+            if f in self._parsed:
+                main, classes, imports, names = self._parsed[f]
+                # the enclosing packages, whose constants and classes are visible from the class
+                scope = main.split('.')[:-1]
+                while scope:
+                    enclosing = self._classes.get('.'.join(scope))
+                    if enclosing is not None:
+                        deps.add(enclosing)
+                    scope = scope[:-1]
+                for n in names:
+                    target = self._resolve(n, main, imports)
+                    if target is not None:
+                        deps.add(target)
+                deps.discard(f)
+            self._dependencies[f] = deps
+
+    def _resolve(self, name, scope, imports):
+        """ File of the class a name refers to, or None
+        """
+        aliases, wildcards = imports
+        first, _, rest = name.partition('.')
+
+        # the first identifier is looked up in the enclosing scopes, then in the imports
+        base = None
+        parts = scope.split('.')
+        while parts and base is None:
+            if '.'.join(parts + [first]) in self._classes:
+                base = '.'.join(parts + [first])
+            parts = parts[:-1]
+        if base is None and first in aliases:
+            base = aliases[first]
+        if base is None:
+            for w in wildcards:
+                if w + '.' + first in self._classes:
+                    base = w + '.' + first
+                    break
+        if base is None and first in self._classes:
+            base = first
+        if base is None:
+            return None
+
+        # the rest of the name may refer to a nested class, or to a constant of the class
+        full = (base + '.' + rest).split('.') if rest else base.split('.')
+        while len(full) >= len(base.split('.')):
+            target = self._classes.get('.'.join(full))
+            if target is not None:
+                return target
+            full = full[:-1]
+        return None
+
+    def dependencies(self, path):
+        """ Files a file directly depends on
+        """
+        import os
+        return self._dependencies.get(os.path.realpath(path), set())
+
+    def closure(self, path):
+        """ Files a file depends on, directly or not, including the file itself
+        """
+        import os
+
+        path = os.path.realpath(path)
+        seen = {path}
+        stack = [path]
+        while stack:
+            for d in self._dependencies.get(stack.pop(), ()):
+                if d not in seen:
+                    seen.add(d)
+                    stack.append(d)
+        return seen
+
+    def dependents(self, paths):
+        """ Files depending, directly or not, on any of the given files, including these files
+        """
+        import os
+
+        if self._dependents is None:
+            self._dependents = dict()
+            for f, deps in self._dependencies.items():
+                for d in deps:
+                    self._dependents.setdefault(d, set()).add(f)
+
+        seen = set(os.path.realpath(p) for p in paths)
+        stack = list(seen)
+        while stack:
+            for d in self._dependents.get(stack.pop(), ()):
+                if d not in seen:
+                    seen.add(d)
+                    stack.append(d)
+        return seen
+
+    def file_digest(self, path):
+        """ sha256 digest of the content of a file
+        """
+        import hashlib
+
+        if path not in self._digests:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                h.update(f.read())
+            self._digests[path] = h.hexdigest()
+        return self._digests[path]
+
+    def closure_digest(self, path):
+        """ Digest of the content of all the files a file depends on. It changes as soon as one of them changes.
+        """
+        import hashlib
+        import os
+
+        h = hashlib.sha256()
+        for f in sorted(self.closure(path)):
+            h.update(os.path.relpath(f, self._root).replace(os.path.sep, '/').encode('utf-8'))
+            h.update(self.file_digest(f).encode('ascii'))
+        return h.hexdigest()
+
+
+class BuildState(object):
+    """Record of the dependencies digest of each model at its last successful translation,
+    stored in a JSON file.
+    """
+    _state_file = 'build_state.json'
+
+    def __init__(self, directory):
+        """
+
+        :param directory: directory where the state file is stored, e.g. the FMU package
+        """
+        import json
+        import os
+
+        self._path = os.path.join(directory, self._state_file)
+        try:
+            with open(self._path, 'r') as f:
+                self._models = json.load(f)
+        except (OSError, ValueError):
+            self._models = dict()
+
+    def is_up_to_date(self, model, digest):
+        """ True if the model was successfully translated with the same dependencies, and its FMU still exists
+
+        :param model: modelica name of the model
+        :param digest: digest of its dependencies, see :meth:`DependencyGraph.closure_digest`
+        """
+        import os
+
+        state = self._models.get(model)
+        return state is not None and state['digest'] == digest and os.path.exists(state['fmu'])
+
+    def fmu_path(self, model):
+        return self._models[model]['fmu']
+
+    def update(self, model, digest, fmu_path):
+        """ Records the translation of a model. A failed translation (``fmu_path`` None) forgets the model.
+        """
+        if fmu_path is None:
+            self._models.pop(model, None)
+        else:
+            self._models[model] = {'digest': digest, 'fmu': fmu_path}
+
+    def save(self):
+        import json
+        import os
+
+        tmp = self._path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._models, f, indent=1, sort_keys=True)
+        os.replace(tmp, self._path)
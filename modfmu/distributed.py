@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+"""
+Translation of the models of a package by workers running on several machines.
+
+The :class:`Coordinator` plans the same translations as :func:`modfmu.fmu_translator.translate_package` and serves
+them to the workers over a ``multiprocessing.connection`` socket. Each :class:`Worker` translates the models of a
+job against its own checkout of the library (shared or synchronized), then sends back the FMUs and the Dymola logs.
+The coordinator writes them in the FMU package and imports them. A job whose worker fails, or stops sending
+heartbeats, is handed to another worker.
+
+The coordinator listens on the loopback interface unless it is given the address of a network interface, e.g.
+``Coordinator(pck, address=('0.0.0.0', 50000))``, which is only safe on a trusted network: the workers are only
+authenticated by the shared secret. Start a worker on a build node with:
+
+    MODFMU_AUTHKEY=secret python -m modfmu.distributed --address coordinator-host:50000 --library /path/to/MyLib
+"""
+
+
+class _JobQueue(object):
+    """Jobs of a coordinator, with the lease of the jobs being translated. Shared by the coordinator and the
+    threads serving the workers.
+    """
+
+    def __init__(self, jobs, lease_timeout=60., max_attempts=3):
+        """
+
+        :param jobs: dictionary mapping job ids to jobs
+        """
+        import collections
+        import queue
+        import threading
+
+        self._lock = threading.Lock()
+        self._jobs = jobs
+        self._pending = collections.deque(jobs)
+        self._leases = dict()  # job id -> [worker id, deadline]
+        self._attempts = dict.fromkeys(jobs, 0)
+        self._done = set()
+        self._closed = False
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.results = queue.Queue()  # (job id, worker id, outcomes or error message)
+
+    def get_job(self, worker_id):
+        """ Leases the next job to a worker
+
+        :return: the job, None if no job is pending for now, or ``{'done': True}`` once all the jobs are done
+        """
+        import time
+
+        with self._lock:
+            if self._closed:
+                return {'done': True}
+            if not self._pending:
+                return None
+            job_id = self._pending.popleft()
+            self._leases[job_id] = [worker_id, time.monotonic() + self.lease_timeout]
+            return dict(self._jobs[job_id], id=job_id, lease_timeout=self.lease_timeout)
+
+    def heartbeat(self, worker_id, job_id):
+        """ Extends the lease of a job
+
+        :return: False if the worker does not hold the lease any more
+        """
+        import time
+
+        with self._lock:
+            lease = self._leases.get(job_id)
+            if lease is None or lease[0] != worker_id:
+                return False
+            lease[1] = time.monotonic() + self.lease_timeout
+            return True
+
+    def submit(self, worker_id, job_id, outcomes):
+        """ Records the outcome of a job. The first outcome received for a job is kept, e.g. from a worker whose
+        lease expired while the job was handed to another one.
+
+        :return: True if the outcome was kept
+        """
+        with self._lock:
+            if job_id in self._done:
+                return False
+            self._done.add(job_id)
+            self._leases.pop(job_id, None)
+            if job_id in self._pending:
+                self._pending.remove(job_id)
+            self.results.put((job_id, worker_id, outcomes))
+            return True
+
+    def fail(self, worker_id, job_id, error):
+        """ Hands back a job the worker could not run, e.g. because its library checkout is missing
+        """
+        with self._lock:
+            lease = self._leases.get(job_id)
+            if lease is not None and lease[0] == worker_id:
+                del self._leases[job_id]
+                self._retry(job_id, 'worker {0} failed: {1}'.format(worker_id, error))
+
+    def _retry(self, job_id, reason):
+        self._attempts[job_id] += 1
+        if self._attempts[job_id] >= self.max_attempts:
+            self._done.add(job_id)
+            self.results.put((job_id, None, '{0}. Gave up after {1} attempts'.format(reason, self._attempts[job_id])))
+        else:
+            self._pending.appendleft(job_id)
+
+    def expire(self):
+        """ Puts back in the queue the jobs whose worker did not send any heartbeat in time
+
+        :return: list of ``(job id, worker id)`` of these jobs
+        """
+        import time
+
+        now = time.monotonic()
+        expired = list()
+        with self._lock:
+            for job_id, (worker_id, deadline) in list(self._leases.items()):
+                if deadline < now:
+                    del self._leases[job_id]
+                    self._retry(job_id, 'lease of worker {} expired'.format(worker_id))
+                    expired.append((job_id, worker_id))
+        return expired
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+
+
+class Coordinator(object):
+    """Plans the translation of the models of a package, serves the jobs to :class:`Worker` instances, then
+    writes and imports the FMUs they send back.
+
+    Usage:
+        >>> coordinator = Coordinator(pck, address=('0.0.0.0', 50000), authkey=b'secret', batch_size=10)
+        >>> results = coordinator.run(local_workers=4)
+    """
+    _methods = ('get_job', 'heartbeat', 'submit', 'fail')
+
+    def __init__(self, pck, fmu_dir_name='FMUs', batch_size=None, cache=None, incremental=False,
+                 address=('127.0.0.1', 0), authkey=None, lease_timeout=60., max_attempts=3, history=True, repack=None):
+        """
+
+        :param pck: Package to be translated to FMU, see :func:`modfmu.fmu_translator.translate_package` for the
+            ``fmu_dir_name``, ``batch_size``, ``cache``, ``incremental``, ``history`` and ``repack`` parameters. The
+            FMUs are repacked by the workers, before they are sent.
+        :param address: ``(host, port)`` the coordinator listens on. Port 0 picks a free port. Defaults to the
+            loopback interface, for local workers only: the coordinator unpickles what the workers send, so listening
+            on the network (e.g. ``('0.0.0.0', 50000)``) must only be done on a trusted network, with a secret
+            ``authkey``.
+        :param authkey: secret shared with the workers. Defaults to the ``MODFMU_AUTHKEY`` environment
+            variable, or to a random key (see :attr:`authkey`).
+        :param lease_timeout: time after which a job is handed to another worker if its worker stopped sending
+            heartbeats, in seconds
+        :param max_attempts: number of workers a job is handed to before giving up
+        :type pck: modfmu.modelica.Package
+        """
+        import os
+        from modfmu.fmu_translator import _PackageBuild, FMUBatchTranslator
+
+        if authkey is None:
+            authkey = os.environ.get('MODFMU_AUTHKEY') or os.urandom(16).hex()
+        if isinstance(authkey, str):
+            authkey = authkey.encode('utf-8')
+        self._authkey = authkey
+        self._address = address
+
+        self._build = _PackageBuild(pck, fmu_dir_name=fmu_dir_name, batch_size=batch_size, cache=cache,
+                                    incremental=incremental, history=history, repack=repack)
+        self._report = self._build.report
+        self._translators = list()  # translators of the models of each task
+        self._job_translators = dict()  # job id -> translators of the models that are not in the cache
+        jobs = dict()
+        for i, task in enumerate(self._build.tasks):
+            trans = self._build.translator(task)
+            if isinstance(trans, FMUBatchTranslator):
+                translators = trans.translators
+                pre_processing = _without_open_model(trans._preProcessing)
+            else:
+                translators = [trans]
+                pre_processing = list()
+            self._translators.append(translators)
+            pending = [t for t in translators if not t._restore_from_cache()]
+            if pending:
+                jobs[i] = {'pre_processing': pre_processing, 'translators': [_translator_config(t) for t in pending]}
+                self._job_translators[i] = pending
+        self._queue = _JobQueue(jobs, lease_timeout=lease_timeout, max_attempts=max_attempts)
+        self._listener = None
+
+    @property
+    def authkey(self):
+        return self._authkey
+
+    @property
+    def address(self):
+        """ Address the workers connect to, once :meth:`run` started listening
+        """
+        return self._listener.address if self._listener is not None else self._address
+
+    def _serve(self, conn):
+        """ Answers the requests of a worker connection until it is closed
+        """
+        try:
+            while True:
+                method, args = conn.recv()
+                if method not in self._methods:
+                    conn.send(('error', 'unknown method {}'.format(method)))
+                    continue
+                try:
+                    conn.send(('ok', getattr(self._queue, method)(*args)))
+                except Exception as e:
+                    conn.send(('error', repr(e)))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _accept(self):
+        import multiprocessing
+        import threading
+
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (multiprocessing.AuthenticationError, EOFError, ConnectionError):
+                # a client with a wrong key, or a worker lost during the handshake
+                continue
+            except OSError:
+                # the listener was closed
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _receive(self, job_id, worker_id, outcomes):
+        """ Writes the FMUs and logs sent back for a job
+        """
+        import os
+        from modfmu.fmu_translator import ProcessResult, TranslationResult
+
+        translators = self._job_translators[job_id]
+        if isinstance(outcomes, str):
+            self._report.writeError(outcomes)
+            for t in translators:
+                t.result = TranslationResult(t.model_path + t.modifier, status='failed')
+            return
+
+        self._report.writeOutput('job {0} translated by worker {1}'.format(job_id, worker_id))
+        for t, outcome in zip(translators, outcomes):
+            t._remove_previous_outputs()
+            for data, path, mode in ((outcome['fmu'], t.fmu_path, 'wb'), (outcome['log'], t.log_path, 'w')):
+                if data is not None:
+                    with open(path + '.tmp', mode) as f:
+                        f.write(data)
+                    os.replace(path + '.tmp', path)
+            process = ProcessResult(outcome['cmd'], returncode=outcome['returncode'], timed_out=outcome['timed_out'],
+                                    duration=outcome['duration'], aborted=outcome.get('aborted', False),
+                                    fatal_errors=outcome.get('fatal_errors'))
+            t._make_result(process)
+
+    def run(self, local_workers=0, poll_interval=0.5):
+        """ Serves the jobs until every one is done, then imports the FMUs.
+
+        :param local_workers: number of worker processes started on this machine, against the library of the package
+        :param poll_interval: time between two checks of the job leases, in seconds
+        :return: dictionary mapping the modelica name of each model to its :class:`TranslationResult`
+        """
+        import multiprocessing
+        import queue
+        import threading
+        from multiprocessing.connection import Listener
+        from modfmu.fmu_translator import _import_translated, _import_translated_batch
+
+        self._listener = Listener(self._address, authkey=self._authkey)
+        threading.Thread(target=self._accept, daemon=True).start()
+        host, port = self.address
+        self._report.writeOutput('coordinator listening on {0}:{1} for {2} jobs'.format(host, port, len(self._job_translators)))
+
+        workers = list()
+        context = multiprocessing.get_context('spawn')
+        for i in range(local_workers):
+            w = context.Process(target=run_worker,
+                                args=(('127.0.0.1' if host in ('', '0.0.0.0') else host, port), self._authkey,
+                                      self._build.pck.adam),
+                                kwargs={'worker_id': 'local-{}'.format(i)}, daemon=True)
+            w.start()
+            workers.append(w)
+
+        try:
+            remaining = set(self._job_translators)
+            while remaining:
+                try:
+                    job_id, worker_id, outcomes = self._queue.results.get(timeout=poll_interval)
+                except queue.Empty:
+                    for job_id, worker_id in self._queue.expire():
+                        self._report.writeWarning('worker {0} was lost, job {1} is queued again'.format(worker_id, job_id))
+                    continue
+                self._receive(job_id, worker_id, outcomes)
+                remaining.discard(job_id)
+        finally:
+            self._queue.close()
+            for w in workers:
+                w.join(timeout=10)
+                if w.is_alive():
+                    w.terminate()
+            self._listener.close()
+
+        try:
+            # the FMUs of all the jobs are imported within a single importer session
+            translators = [t for job in self._translators for t in job]
+            if len(translators) > 1:
+                _import_translated_batch(self._build.fmu_pck, translators, self._report,
+                                         timeouts=[self._build.import_timeout(t) for t in translators])
+            else:
+                for t in translators:
+                    _import_translated(self._build.fmu_pck, t, self._report, timeout=self._build.import_timeout(t))
+            return self._build.finish([[t.result for t in job] for job in self._translators])
+        finally:
+            self._build.close()
+
+
+def _without_open_model(statements):
+    """ Statements of a script, except the opening of the library, which is done by the worker from its own checkout
+    """
+    return [p for p in statements if not p.startswith('openModel(')]
+
+
+def _translator_config(fmutrans):
+    """ What a worker needs to configure the translator of a model
+    """
+    return {'model_name': fmutrans.model_path,
+            'fmu_name': fmutrans.fmu_name,
+            'modifier': fmutrans.modifier,
+            'fmi_version': fmutrans._fmi_version,
+            'fmi_type': fmutrans.fmi_type,
+            'include_src': fmutrans._include_src,
+            'store_result': fmutrans._store_result,
+            'timeout': fmutrans.timeout,
+            'repack': fmutrans.repack.to_dict() if fmutrans.repack is not None else None,
+            'pre_processing': _without_open_model(fmutrans._preProcessing),
+            'post_processing': list(fmutrans._postProcessing)}
+
+
+class Worker(object):
+    """Translates the jobs of a :class:`Coordinator` against a local checkout of the library.
+
+    Usage:
+        >>> Worker(('build-host', 50000), b'secret', '/path/to/MyLib').run()
+    """
+
+    def __init__(self, address, authkey, library, work_dir=None, modelica_exe='Dymola', worker_id=None,
+                 poll_interval=1.):
+        """
+
+        :param address: ``(host, port)`` of the coordinator
+        :param authkey: secret shared with the coordinator
+        :param library: directory of the root package of the library on this machine
+        :param work_dir: directory in which the jobs are translated. Defaults to the temporary directory.
+        :param modelica_exe: name of the translator executable
+        :param worker_id: name of the worker in the logs of the coordinator. Defaults to ``<host>-<pid>``.
+        :param poll_interval: time waited before asking again for a job when none is pending, in seconds
+        """
+        import os
+        import socket
+        import tempfile
+        from modfmu.reporter import Reporter
+
+        if isinstance(authkey, str):
+            authkey = authkey.encode('utf-8')
+        self._address = tuple(address)
+        self._authkey = authkey
+        self._library = os.path.realpath(library)
+        self._work_dir = work_dir or tempfile.gettempdir()
+        self._modelica_exe = modelica_exe
+        self.worker_id = worker_id or '{0}-{1}'.format(socket.gethostname(), os.getpid())
+        self._poll_interval = poll_interval
+        if not os.path.exists(self._work_dir):
+            os.makedirs(self._work_dir)
+        self._reporter = Reporter(os.path.join(self._work_dir, 'worker_{}.log'.format(self.worker_id)))
+        self.jobs_done = 0
+
+    def _call(self, conn, method, *args):
+        conn.send((method, args))
+        status, value = conn.recv()
+        if status != 'ok':
+            raise RuntimeError('Coordinator error in {0}: {1}'.format(method, value))
+        return value
+
+    def _heartbeat(self, job_id, interval, stop):
+        """ Extends the lease of a job until ``stop`` is set, over a connection of its own
+        """
+        from multiprocessing.connection import Client
+
+        try:
+            conn = Client(self._address, authkey=self._authkey)
+        except OSError:
+            return
+        try:
+            while not stop.wait(interval):
+                self._call(conn, 'heartbeat', self.worker_id, job_id)
+        except (EOFError, OSError, RuntimeError):
+            pass
+        finally:
+            conn.close()
+
+    def _translators(self, job, directory):
+        import os
+        from modfmu.fmu_translator import FMUTranslator, FMUBatchTranslator
+        from modfmu.repack import RepackPolicy
+
+        package_file = os.path.join(self._library, 'package.mo')
+        single = len(job['translators']) == 1
+        translators = list()
+        for c in job['translators']:
+            t = FMUTranslator(c['model_name'], translator=self._modelica_exe, fmu_name=c['fmu_name'],
+                              modifier=c['modifier'], output_directory=os.path.join(directory, c['fmu_name']),
+                              package_path=[package_file] if single else list(), reporter=self._reporter)
+            t.setFmiVersion(c['fmi_version'])
+            t.fmi_type = c['fmi_type']
+            t._include_src = c['include_src']
+            t._store_result = c['store_result']
+            t.timeout = c['timeout']
+            t.repack = RepackPolicy(**c['repack']) if c['repack'] is not None else None
+            for p in c['pre_processing']:
+                t.addPreProcessingStatement(p)
+            for p in c['post_processing']:
+                t.addPostProcessingStatement(p)
+            translators.append(t)
+        if single:
+            return translators[0]
+
+        batch = FMUBatchTranslator(translators, translator=self._modelica_exe, output_directory=directory,
+                                   package_path=[package_file], reporter=self._reporter)
+        for p in job['pre_processing']:
+            batch.addPreProcessingStatement(p)
+        return batch
+
+    def run_job(self, job):
+        """ Translates the models of a job
+
+        :return: list of the outcome of each model: FMU content, log content and translator process
+        """
+        import os
+        import shutil
+        import tempfile
+        from modfmu.fmu_translator import FMUBatchTranslator
+
+        directory = tempfile.mkdtemp(prefix='modfmu_job_', dir=self._work_dir)
+        try:
+            trans = self._translators(job, directory)
+            if isinstance(trans, FMUBatchTranslator):
+                trans.translate_fmus()
+                translators = trans.translators
+            else:
+                trans.translate_fmu()
+                translators = [trans]
+
+            outcomes = list()
+            for t in translators:
+                process = t.result.process
+                outcome = {'fmu': None, 'log': None,
+                           'cmd': process.cmd + ['({})'.format(self.worker_id)] if process is not None else [self.worker_id],
+                           'returncode': process.returncode if process is not None else None,
+                           'timed_out': process.timed_out if process is not None else False,
+                           'duration': process.duration if process is not None else 0.,
+                           'aborted': process.aborted if process is not None else False,
+                           'fatal_errors': process.fatal_errors if process is not None else list()}
+                if t.result.success:
+                    with open(t.fmu_path, 'rb') as f:
+                        outcome['fmu'] = f.read()
+                if os.path.exists(t.log_path):
+                    with open(t.log_path, 'r', errors='replace') as f:
+                        outcome['log'] = f.read()
+                outcomes.append(outcome)
+            return outcomes
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, max_jobs=None):
+        """ Translates jobs until the coordinator has none left, or ``max_jobs`` jobs are done
+
+        :return: number of jobs done
+        """
+        import threading
+        import time
+        from multiprocessing.connection import Client
+
+        conn = Client(self._address, authkey=self._authkey)
+        try:
+            while max_jobs is None or self.jobs_done < max_jobs:
+                job = self._call(conn, 'get_job', self.worker_id)
+                if job is None:
+                    time.sleep(self._poll_interval)
+                    continue
+                if job.get('done'):
+                    break
+
+                self._reporter.writeOutput('running job {0}: {1}'.format(
+                    job['id'], ', '.join(c['model_name'] + c['modifier'] for c in job['translators'])))
+                stop = threading.Event()
+                heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], job['lease_timeout'] / 4., stop),
+                                             daemon=True)
+                heartbeat.start()
+                try:
+                    outcomes = self.run_job(job)
+                except Exception as e:
+                    self._reporter.writeError('job {0} failed: {1!r}'.format(job['id'], e))
+                    self._call(conn, 'fail', self.worker_id, job['id'], repr(e))
+                    continue
+                finally:
+                    stop.set()
+                    heartbeat.join()
+                self._call(conn, 'submit', self.worker_id, job['id'], outcomes)
+                self.jobs_done += 1
+        except (EOFError, OSError):
+            # the coordinator is gone
+            pass
+        finally:
+            conn.close()
+        return self.jobs_done
+
+
+def run_worker(address, authkey, library, **kwargs):
+    """ Runs a :class:`Worker` until the coordinator has no job left. Target of the local worker processes.
+    """
+    return Worker(address, authkey, library, **kwargs).run()
+
+
+def translate_package_distributed(pck, fmu_dir_name='FMUs', batch_size=None, cache=None, incremental=False,
+                                  address=('127.0.0.1', 0), authkey=None, local_workers=0, lease_timeout=60., max_attempts=3,
+                                  history=True, repack=None):
+    """
+    Same as :func:`modfmu.fmu_translator.translate_package`, the translations being run by workers, see
+    :class:`Coordinator`.
+
+    :param address: ``(host, port)`` the coordinator listens on, see :class:`Coordinator`. Defaults to the loopback
+        interface: pass the address of a network interface to accept remote workers.
+    :param local_workers: number of worker processes started on this machine
+    :return: dictionary mapping the modelica name of each model to its :class:`TranslationResult`
+    """
+    from modfmu import profiling
+
+    with profiling.build('translate_package_distributed', package=pck._modelica_name):
+        coordinator = Coordinator(pck, fmu_dir_name=fmu_dir_name, batch_size=batch_size, cache=cache, incremental=incremental,
+                                  address=address, authkey=authkey, lease_timeout=lease_timeout, max_attempts=max_attempts,
+                                  history=history, repack=repack)
+        return coordinator.run(local_workers=local_workers)
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description='Worker translating the jobs of a modfmu coordinator. '
+                                                 'The shared secret is read from the MODFMU_AUTHKEY environment variable.')
+    parser.add_argument('--address', required=True, help='host:port of the coordinator')
+    parser.add_argument('--library', required=True, help='directory of the root package of the library')
+    parser.add_argument('--work-dir', default=None, help='directory in which the jobs are translated')
+    parser.add_argument('--exe', default='Dymola', help='translator executable')
+    parser.add_argument('--id', default=None, help='name of the worker')
+    args = parser.parse_args()
+
+    host, _, port = args.address.rpartition(':')
+    n = Worker((host, int(port)), os.environ['MODFMU_AUTHKEY'], args.library, work_dir=args.work_dir,
+               modelica_exe=args.exe, worker_id=args.id).run()
+    print('{} jobs done'.format(n))
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Parsing of the log files saved by Dymola with ``savelog``.
+"""
+
+import re
+
+_error = re.compile(r'^\s*error\b\s*:?', re.I)
+_warning = re.compile(r'^\s*warning\b\s*:?', re.I)
+_section = re.compile(r'^\s*(Original Model|Translated Model)\s*$')
+_statistic = re.compile(r'^\s+([A-Za-z][\w /\-]*?)\s*:\s*(\d+)')
+_time = re.compile(r'^\s*([\w /\-]*time[\w /\-]*?)\s*[:=]\s*([\d.]+(?:[eE][-+]?\d+)?)\s*(?:s|sec|seconds)\s*$', re.I)
+_fmu = re.compile(r'([^\s"\'=]+\.fmu)\b')
+
+# lines of the translator output after which a translation cannot succeed, by kind of error. They may be changed,
+# or given per translator, see FMUTranslator.fatal_patterns.
+fatal_patterns = {
+    'license': r'(?i)(licen[cs]e\s+(error|expired|server\b.*\b(down|unavailable|not\s+respond))|'
+               r'(failed|unable)\s+to\s+(check\s*out|obtain|get)\s+(a\s+)?licen[cs]e|no\s+(valid\s+)?licen[cs]e\b)',
+    'missing_package': r'(?i)(failed\s+to\s+(open|load)\s+(model|package|library|file)|'
+                       r'(could\s+not|cannot|unable\s+to)\s+(find|load|open)\s+(the\s+)?(package|library)\b)',
+    'translation_error': r'(?i)(translation\s+aborted|errors\s+have\s+been\s+issued|'
+                         r'(compilation|translation)\s+of\s+\S+\s+failed|dsbuild\s+failed)',
+}
+# kinds of fatal errors that fail every translation of the session, and the following sessions
+session_fatal_kinds = ('license', 'missing_package')
+
+
+class DymolaLog(object):
+    """Content of a Dymola log file: errors, warnings, translation statistics and FMU path.
+
+    Usage:
+        >>> log = DymolaLog.parse('FMUs/MyModel/dymola_translate.log')
+        >>> log.errors, log.warnings, log.equations, log.states
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.found = False
+        self.errors = list()
+        self.warnings = list()
+        self.statistics = dict()  # section -> {statistic: value}
+        self.times = dict()  # name -> seconds
+        self.fmu_path = None
+        self.number_of_lines = 0
+
+    @classmethod
+    def parse(cls, path):
+        """ Parses a log file line by line. A missing log file gives an empty log whose ``found`` attribute is False.
+
+        :param path: path of the log file
+        :return: a :class:`DymolaLog`
+        """
+        log = cls(path)
+        try:
+            with open(path, 'r', errors='replace') as f:
+                log.found = True
+                log.feed(f)
+        except OSError:
+            pass
+        return log
+
+    def feed(self, lines):
+        """ Parses lines of a log
+
+        :param lines: iterable of lines
+        """
+        current = None  # list to which indented continuation lines are appended
+        section = None
+        for line in lines:
+            self.number_of_lines += 1
+            line = line.rstrip('\r\n')
+            if not line.strip():
+                current = None
+                continue
+
+            if _error.match(line):
+                self.errors.append(line.strip())
+                current = self.errors
+                continue
+            if _warning.match(line):
+                self.warnings.append(line.strip())
+                current = self.warnings
+                continue
+            if current is not None and line[:1].isspace():
+                current[-1] += '\n' + line.strip()
+                continue
+            current = None
+
+            m = _section.match(line)
+            if m:
+                section = m.group(1)
+                self.statistics.setdefault(section, dict())
+                continue
+            m = _time.match(line)
+            if m:
+                self.times[m.group(1).strip()] = float(m.group(2))
+                continue
+            if section is not None:
+                m = _statistic.match(line)
+                if m:
+                    self.statistics[section][m.group(1)] = int(m.group(2))
+                    continue
+            m = _fmu.search(line)
+            if m:
+                self.fmu_path = m.group(1)
+
+    @property
+    def equations(self):
+        """ Number of equations of the original model, or None if not in the log
+        """
+        return self.statistics.get('Original Model', dict()).get('Equations')
+
+    @property
+    def states(self):
+        """ Number of continuous time states of the translated model, or None if not in the log
+        """
+        return self.statistics.get('Translated Model', dict()).get('Continuous time states')
+
+    def to_dict(self):
+        return {'path': self.path,
+                'found': self.found,
+                'errors': self.errors,
+                'warnings': self.warnings,
+                'statistics': self.statistics,
+                'times': self.times,
+                'fmu_path': self.fmu_path}
+
+
+def _file_state(path):
+    import os
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+
+def wait_for_file(path, timeout=2.):
+    """ Waits until a file exists and stopped growing, e.g. a log file written by a process that just exited.
+
+    The file is checked after 1 ms, then at growing intervals, so that a file already complete is seen at once
+    while a file still being written is not read too early.
+
+    :param path: path of the file
+    :param timeout: maximum waiting time in seconds
+    :return: True if the file is ready, False if it is still missing or growing after ``timeout``
+    """
+    import time
+
+    end = time.monotonic() + timeout
+    delay = 0.001
+    previous = _file_state(path)
+    while True:
+        time.sleep(min(delay, max(0., end - time.monotonic())))
+        state = _file_state(path)
+        if state is not None and state == previous:
+            return True
+        if time.monotonic() >= end:
+            return False
+        previous = state
+        delay = min(2 * delay, 0.05)
+
+
+async def wait_for_file_async(path, timeout=2.):
+    """ Same as :func:`wait_for_file`, without blocking the event loop
+    """
+    import asyncio
+    import time
+
+    end = time.monotonic() + timeout
+    delay = 0.001
+    previous = _file_state(path)
+    while True:
+        await asyncio.sleep(min(delay, max(0., end - time.monotonic())))
+        state = _file_state(path)
+        if state is not None and state == previous:
+            return True
+        if time.monotonic() >= end:
+            return False
+        previous = state
+        delay = min(2 * delay, 0.05)
+
+
+class FatalErrorWatcher(object):
+    """Reads the files written by a running translator as they grow, and looks for fatal errors in their lines.
+
+    Usage:
+        >>> watcher = FatalErrorWatcher(['_translate_stdout.log', 'dymola_translate.log'])
+        >>> while process.poll() is None and not watcher.poll():
+        ...     time.sleep(0.5)
+    """
+
+    def __init__(self, paths, patterns=None, max_matches=10, from_end=False):
+        """
+
+        :param paths: paths of the files to watch. They may not exist yet.
+        :param patterns: dictionary mapping a kind of error to a regular expression. Defaults to
+            :data:`fatal_patterns`.
+        :param max_matches: maximum number of matching lines kept
+        :param from_end: if True, only what is appended to the files from now on is read, e.g. for the output of a
+            translator session already running
+        """
+        self._paths = list(paths)
+        patterns = fatal_patterns if patterns is None else patterns
+        self._patterns = [(kind, re.compile(p) if isinstance(p, str) else p) for kind, p in patterns.items()]
+        self._offsets = {p: (_file_state(p) or (0, 0))[0] if from_end else 0 for p in self._paths}
+        self._partial = dict.fromkeys(self._paths, b'')
+        self._max_matches = max_matches
+        self.matches = list()  # (kind, line) of the matching lines
+
+    def _match(self, line):
+        for kind, pattern in self._patterns:
+            if pattern.search(line):
+                self.matches.append((kind, line.strip()))
+                return
+
+    def poll(self, final=False):
+        """ Reads what was appended to the files since the last call
+
+        :param final: if True, the last line of each file is read even if it does not end with a new line
+        :return: list of the ``(kind, line)`` of the lines matching a fatal error pattern found by this call
+        """
+        found = len(self.matches)
+        for path in self._paths:
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(self._offsets[path])
+                    data = f.read()
+            except OSError:
+                data = b''
+            self._offsets[path] += len(data)
+            lines = (self._partial[path] + data).split(b'\n')
+            self._partial[path] = lines.pop()
+            if final and self._partial[path]:
+                lines.append(self._partial[path])
+                self._partial[path] = b''
+            for line in lines:
+                if len(self.matches) >= self._max_matches:
+                    break
+                self._match(line.decode('utf-8', errors='replace'))
+        return self.matches[found:]
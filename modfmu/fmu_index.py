@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+Index of the variables of the FMUs of a directory, read from their ``modelDescription.xml``.
+
+The ``modelDescription.xml`` of each FMU is read from the zip archive, without extracting it, and parsed as a stream.
+The variables of all the FMUs are stored by columns in NumPy arrays: name, causality, variability, type, start value
+and value reference, with the GUID and model name of each FMU. The index is saved in the directory, and refreshed
+incrementally: only the FMUs added or modified since the last refresh are read again.
+
+Usage:
+    >>> index = FMUIndex('MyLib/FMUs')
+    >>> index.fmus_with_variable('heater.Q_flow')
+    >>> index.query(causality='parameter', variability='tunable')
+    >>> index.to_dataframe(pattern=r'.*\\.T$')  # requires pandas
+"""
+
+_index_file = '.modfmu_fmu_index.npz'
+_version = 1
+
+causalities = ('parameter', 'calculatedParameter', 'input', 'output', 'local', 'independent', 'structuralParameter')
+variabilities = ('constant', 'fixed', 'tunable', 'discrete', 'continuous')
+types = ('Real', 'Integer', 'Boolean', 'String', 'Enumeration', 'Float32', 'Float64', 'Int8', 'UInt8', 'Int16',
+         'UInt16', 'Int32', 'UInt32', 'Int64', 'UInt64', 'Binary', 'Clock')
+
+# columns of the FMUs and of the variables, and their NumPy types
+_fmu_columns = (('path', 'U'), ('mtime', 'int64'), ('size', 'int64'), ('guid', 'U'), ('model_name', 'U'),
+                ('fmi_version', 'U'), ('error', 'U'))
+_variable_columns = (('fmu', 'int32'), ('name', 'U'), ('causality', 'int8'), ('variability', 'int8'), ('type', 'int8'),
+                     ('value_reference', 'int64'), ('start', 'U'), ('start_value', 'float64'), ('description', 'U'))
+
+
+def _local_name(tag):
+    """ Tag without its namespace
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def _code(categories, value):
+    return categories.index(value) if value in categories else -1
+
+
+def read_model_description(fmu_path):
+    """ Reads the description and the variables of an FMU from its ``modelDescription.xml``, as a stream
+
+    :param fmu_path: path of the FMU
+    :return: tuple ``(attributes of the fmiModelDescription element, list of the variables)``. Each variable is a
+        tuple ``(name, causality, variability, type, value reference, start, description)``.
+    :raises ValueError: if the FMU has no readable ``modelDescription.xml``
+    """
+    import xml.etree.ElementTree as ET
+    import zipfile
+
+    description = dict()
+    variables = list()
+    try:
+        with zipfile.ZipFile(fmu_path) as z, z.open('modelDescription.xml') as f:
+            stack = list()
+            variable = None
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                tag = _local_name(elem.tag)
+                if event == 'start':
+                    if not stack:
+                        description = dict(elem.attrib)
+                    elif stack[-1] == 'ModelVariables':
+                        # FMI 2: ScalarVariable holding a typed element. FMI 3: typed element
+                        fmi3 = tag != 'ScalarVariable'
+                        variable = [elem.get('name'), elem.get('causality', 'local'),
+                                    elem.get('variability', 'continuous'), tag if fmi3 else None,
+                                    elem.get('valueReference'), elem.get('start') if fmi3 else None,
+                                    elem.get('description', '')]
+                    elif variable is not None and stack[-1] == 'ScalarVariable' and variable[3] is None:
+                        variable[3] = tag
+                        variable[5] = elem.get('start')
+                    stack.append(tag)
+                    continue
+
+                stack.pop()
+                if variable is not None and stack and stack[-1] == 'ModelVariables':
+                    variables.append(tuple(variable))
+                    variable = None
+                if len(stack) <= 2:
+                    # the variables already read are not kept in the tree
+                    elem.clear()
+    except (KeyError, OSError, zipfile.BadZipFile, ET.ParseError) as e:
+        raise ValueError('Could not read the model description of {0}: {1}'.format(fmu_path, e))
+    return description, variables
+
+
+class FMUIndex(object):
+    """Index of the variables of the FMUs found under a directory, stored in a NumPy ``.npz`` file in the directory.
+
+    The columns are available as NumPy arrays through :attr:`fmus` and :attr:`variables`. The causality, variability
+    and type of the variables are stored as codes into :data:`causalities`, :data:`variabilities` and :data:`types`
+    (-1 for an unknown value).
+
+    Thread safe.
+    """
+
+    def __init__(self, directory, refresh=True):
+        """
+
+        :param directory: directory under which the FMUs are looked for, e.g. the FMU package of a library
+        :param refresh: if True, the index is brought up to date at once, see :meth:`refresh`
+        """
+        import os
+        import threading
+
+        self._directory = os.path.realpath(directory)
+        self._path = os.path.join(self._directory, _index_file)
+        self._lock = threading.RLock()
+        self.fmus = self._empty(_fmu_columns)
+        self.variables = self._empty(_variable_columns)
+        self._load()
+        if refresh:
+            self.refresh()
+
+    @staticmethod
+    def _empty(columns):
+        import numpy as np
+        return {c: np.zeros(0, dtype=t) for c, t in columns}
+
+    @property
+    def path(self):
+        """ Path of the index file
+        """
+        return self._path
+
+    def _load(self):
+        import numpy as np
+
+        try:
+            with np.load(self._path, allow_pickle=False) as data:
+                if int(data['version']) != _version:
+                    return
+                self.fmus = {c: data['fmu_' + c] for c, t in _fmu_columns}
+                self.variables = {c: data['variable_' + c] for c, t in _variable_columns}
+        except (OSError, KeyError, ValueError):
+            # missing, older or corrupted index: built again
+            self.fmus = self._empty(_fmu_columns)
+            self.variables = self._empty(_variable_columns)
+
+    def _save(self):
+        import os
+        import numpy as np
+
+        arrays = {'version': np.array(_version)}
+        arrays.update({'fmu_' + c: a for c, a in self.fmus.items()})
+        arrays.update({'variable_' + c: a for c, a in self.variables.items()})
+        tmp = '{}.{}.tmp.npz'.format(self._path, os.getpid())
+        np.savez(tmp, **arrays)
+        os.replace(tmp, self._path)
+
+    def _scan(self):
+        """ FMUs found under the directory
+
+        :return: dictionary mapping the path of each FMU, relative to the directory, to its ``(mtime, size)``
+        """
+        import os
+
+        found = dict()
+        for root, dirs, files in os.walk(self._directory):
+            for f in files:
+                if f.endswith('.fmu'):
+                    st = os.stat(os.path.join(root, f))
+                    found[os.path.relpath(os.path.join(root, f), self._directory)] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def refresh(self):
+        """ Reads the FMUs added or modified since the last refresh, and forgets the removed ones. The index file is
+        written if anything changed.
+
+        :return: tuple ``(number of FMUs read, number of FMUs removed)``
+        """
+        import os
+        import numpy as np
+
+        with self._lock:
+            found = self._scan()
+            known = {p: (int(m), int(s)) for p, m, s in zip(self.fmus['path'], self.fmus['mtime'], self.fmus['size'])}
+            changed = sorted(p for p, state in found.items() if known.get(p) != state)
+            removed = [p for p in known if p not in found]
+            if not changed and not removed:
+                return 0, 0
+
+            # rows of the FMUs left unchanged
+            kept = np.array([p in found and known[p] == found[p] for p in self.fmus['path']], dtype=bool)
+            fmu_rows = [{c: a[kept] for c, a in self.fmus.items()}]
+            codes = np.cumsum(kept) - 1  # old code of a kept FMU -> new code
+            variable_kept = kept[self.variables['fmu']]
+            kept_variables = {c: a[variable_kept] for c, a in self.variables.items()}
+            kept_variables['fmu'] = codes[kept_variables['fmu']].astype('int32')
+            variable_rows = [kept_variables]
+
+            code = int(kept.sum())
+            for p in changed:
+                mtime, size = found[p]
+                try:
+                    description, variables = read_model_description(os.path.join(self._directory, p))
+                    error = ''
+                except ValueError as e:
+                    description, variables, error = dict(), list(), str(e)
+                # FMI 3 names the GUID instantiationToken
+                guid = description.get('guid', description.get('instantiationToken', ''))
+                fmu_rows.append({'path': np.array([p]), 'mtime': np.array([mtime], dtype='int64'),
+                                 'size': np.array([size], dtype='int64'), 'guid': np.array([guid]),
+                                 'model_name': np.array([description.get('modelName', '')]),
+                                 'fmi_version': np.array([description.get('fmiVersion', '')]),
+                                 'error': np.array([error])})
+                variable_rows.append(self._columns(code, variables))
+                code += 1
+
+            self.fmus = self._concatenate(fmu_rows, _fmu_columns)
+            self.variables = self._concatenate(variable_rows, _variable_columns)
+            self._save()
+            return len(changed), len(removed)
+
+    @staticmethod
+    def _columns(code, variables):
+        """ Columns of the variables of an FMU
+        """
+        import numpy as np
+
+        def start_value(start):
+            try:
+                return float(start)
+            except (TypeError, ValueError):
+                return {'true': 1., 'false': 0.}.get(start, np.nan)
+
+        return {'fmu': np.full(len(variables), code, dtype='int32'),
+                'name': np.array([v[0] or '' for v in variables], dtype='U'),
+                'causality': np.array([_code(causalities, v[1]) for v in variables], dtype='int8'),
+                'variability': np.array([_code(variabilities, v[2]) for v in variables], dtype='int8'),
+                'type': np.array([_code(types, v[3]) for v in variables], dtype='int8'),
+                'value_reference': np.array([int(v[4]) if v[4] and v[4].isdigit() else -1 for v in variables],
+                                            dtype='int64'),
+                'start': np.array([v[5] if v[5] is not None else '' for v in variables], dtype='U'),
+                'start_value': np.array([start_value(v[5]) for v in variables], dtype='float64'),
+                'description': np.array([v[6] for v in variables], dtype='U')}
+
+    @staticmethod
+    def _concatenate(rows, columns):
+        import numpy as np
+
+        return {c: np.concatenate([r[c] for r in rows]).astype(str if t == 'U' else t) for c, t in columns}
+
+    def fmu_path(self, code):
+        """ Absolute path of the FMU of a code of the ``fmu`` column
+        """
+        import os
+        return os.path.join(self._directory, str(self.fmus['path'][code]))
+
+    def _mask(self, name=None, pattern=None, causality=None, variability=None, type=None, fmu=None):
+        """ Boolean mask of the variables matching all the given criteria
+        """
+        import os
+        import re
+        import numpy as np
+
+        v = self.variables
+        mask = np.ones(len(v['name']), dtype=bool)
+        if name is not None:
+            mask &= v['name'] == name
+        if pattern is not None:
+            regex = re.compile(pattern)
+            rows = np.flatnonzero(mask)
+            mask[rows] = [regex.fullmatch(n) is not None for n in v['name'][rows]]
+        for column, categories, value in (('causality', causalities, causality),
+                                          ('variability', variabilities, variability), ('type', types, type)):
+            if value is not None:
+                mask &= v[column] == _code(categories, value)
+        if fmu is not None:
+            relative = os.path.relpath(os.path.realpath(fmu), self._directory) if os.path.isabs(fmu) else fmu
+            codes = np.flatnonzero((self.fmus['path'] == relative) | (self.fmus['model_name'] == fmu))
+            mask &= np.isin(v['fmu'], codes)
+        return mask
+
+    def query(self, name=None, pattern=None, causality=None, variability=None, type=None, fmu=None):
+        """ Variables matching all the given criteria
+
+        :param name: name of the variable
+        :param pattern: regular expression the whole name of the variable matches
+        :param causality: e.g. ``'parameter'``, ``'input'`` or ``'output'``
+        :param variability: e.g. ``'tunable'`` or ``'continuous'``
+        :param type: e.g. ``'Real'`` or ``'Boolean'``
+        :param fmu: path of the FMU, absolute or relative to the directory, or its model name
+        :return: list of dictionaries with the keys ``fmu`` (path of the FMU), ``guid``, ``name``, ``causality``,
+            ``variability``, ``type``, ``value_reference``, ``start`` (as written in the FMU, None if not given),
+            ``start_value`` (as a float, NaN if not numeric) and ``description``
+        """
+        with self._lock:
+            rows = self._mask(name, pattern, causality, variability, type, fmu).nonzero()[0]
+            v = self.variables
+
+            def category(categories, c):
+                return categories[c] if c >= 0 else None
+
+            return [{'fmu': self.fmu_path(v['fmu'][i]), 'guid': str(self.fmus['guid'][v['fmu'][i]]),
+                     'name': str(v['name'][i]), 'causality': category(causalities, v['causality'][i]),
+                     'variability': category(variabilities, v['variability'][i]),
+                     'type': category(types, v['type'][i]), 'value_reference': int(v['value_reference'][i]),
+                     'start': str(v['start'][i]) or None, 'start_value': float(v['start_value'][i]),
+                     'description': str(v['description'][i])} for i in rows]
+
+    def fmus_with_variable(self, name):
+        """ Paths of the FMUs exposing a variable
+
+        :param name: name of the variable
+        """
+        import numpy as np
+
+        with self._lock:
+            codes = np.unique(self.variables['fmu'][self.variables['name'] == name])
+            return [self.fmu_path(c) for c in codes]
+
+    def parameters(self, tunable=True):
+        """ Parameters of all the FMUs, see :meth:`query`
+
+        :param tunable: if True, only the parameters that can be changed during a simulation
+        """
+        return self.query(causality='parameter', variability='tunable' if tunable else None)
+
+    @property
+    def errors(self):
+        """ Dictionary mapping the path of the FMUs that could not be read to the error
+        """
+        with self._lock:
+            return {self.fmu_path(i): str(e) for i, e in enumerate(self.fmus['error']) if e}
+
+    def to_dataframe(self, **criteria):
+        """ Variables matching the criteria of :meth:`query`, as a ``pandas.DataFrame`` with categorical causality,
+        variability and type columns. The ``fmu`` column holds the paths of the FMUs, as returned by :meth:`query`.
+        """
+        import numpy as np
+        import pandas as pd
+
+        with self._lock:
+            mask = self._mask(**criteria)
+            v = {c: a[mask] for c, a in self.variables.items()}
+            paths = np.array([self.fmu_path(c) for c in range(len(self.fmus['path']))], dtype='U')
+            frame = pd.DataFrame({'fmu': paths[v['fmu']], 'guid': self.fmus['guid'][v['fmu']],
+                                  'name': v['name'],
+                                  'causality': pd.Categorical.from_codes(v['causality'], causalities),
+                                  'variability': pd.Categorical.from_codes(v['variability'], variabilities),
+                                  'type': pd.Categorical.from_codes(v['type'], types),
+                                  'value_reference': v['value_reference'], 'start': v['start'],
+                                  'start_value': v['start_value'], 'description': v['description']})
+        return frame
@@ -7,6 +7,145 @@ Created on Thu Apr 07 13:54:47 2016
 from builtins import TypeError
 
 from modfmu.modelica import Package
+from modfmu import profiling, scheduler
+from modfmu.dymola_log import fatal_patterns, session_fatal_kinds
+
+
+class TranslationResult(object):
+    """Outcome of the translation of a model to FMU.
+
+    ``status`` is one of ``'translated'``, ``'cached'`` (restored from the FMU cache), ``'up-to-date'`` (left
+    untouched by an incremental build), ``'variant'`` (FMU of another variant of the model with other parameter
+    values, see :func:`translate_variants`), ``'failed'``, ``'timeout'`` or ``'aborted'`` (not translated, as the
+    build stopped on an error that fails every translation, e.g. a license failure).
+    """
+
+    def __init__(self, model_name, fmu_path=None, status='failed', process=None, log=None):
+        """
+
+        :param model_name: modelica name of the model, with its modifier
+        :param fmu_path: path of the FMU, None if the translation failed
+        :param process: :class:`ProcessResult` of the translator process, if any
+        :param log: :class:`modfmu.dymola_log.DymolaLog` of the translation, if any
+        """
+        self.model_name = model_name
+        self.fmu_path = fmu_path
+        self.status = status
+        self.process = process
+        self.log = log
+        self.import_result = None
+        self.parameter_set = None  # JSON file of the parameter values of a variant, see translate_variants
+
+    @property
+    def success(self):
+        return self.status in ('translated', 'cached', 'up-to-date', 'variant')
+
+    @property
+    def errors(self):
+        """ Errors of the log, and the lines of the output of the translator matching a fatal error pattern
+        """
+        errors = list(self.log.errors) if self.log is not None else list()
+        return errors + [line for kind, line in self.fatal_errors if line not in errors]
+
+    @property
+    def fatal_errors(self):
+        """ ``(kind, line)`` of the lines of the output of the translator matching a fatal error pattern
+        """
+        return self.process.fatal_errors if self.process is not None else list()
+
+    @property
+    def warnings(self):
+        return self.log.warnings if self.log is not None else list()
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return 'TranslationResult({!r}, status={!r}, fmu_path={!r})'.format(self.model_name, self.status, self.fmu_path)
+
+    def to_dict(self):
+        """ Machine-readable outcome, e.g. to be dumped as JSON
+        """
+        return {'model_name': self.model_name,
+                'fmu_path': self.fmu_path,
+                'status': self.status,
+                'success': self.success,
+                'returncode': self.process.returncode if self.process is not None else None,
+                'duration': self.process.duration if self.process is not None else None,
+                'fatal_errors': self.fatal_errors,
+                'log': self.log.to_dict() if self.log is not None else None,
+                'parameter_set': self.parameter_set,
+                'import': self.import_result.to_dict() if self.import_result is not None else None}
+
+
+class ImportResult(object):
+    """Outcome of the import of a FMU in a Modelica package.
+    """
+
+    def __init__(self, fmu_path, package_name, process=None, log=None, completed=None):
+        """
+
+        :param process: :class:`ProcessResult` of the importer process. It is shared by the FMUs of a batch import.
+        :param log: :class:`modfmu.dymola_log.DymolaLog` of the import
+        :param completed: for the FMUs of a batch import, True if the log shows the end of the import of the FMU,
+            whatever happened to the session afterwards. None for a single import.
+        """
+        self.fmu_path = fmu_path
+        self.package_name = package_name
+        self.process = process
+        self.log = log
+        self.completed = completed
+
+    @property
+    def success(self):
+        if self.process is None or self.log is None or not self.log.found or self.log.errors:
+            return False
+        return self.completed if self.completed is not None else not self.process.timed_out
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return 'ImportResult({!r}, success={})'.format(self.fmu_path, self.success)
+
+    def to_dict(self):
+        return {'fmu_path': self.fmu_path,
+                'package_name': self.package_name,
+                'success': self.success,
+                'returncode': self.process.returncode if self.process is not None else None,
+                'duration': self.process.duration if self.process is not None else None,
+                'log': self.log.to_dict() if self.log is not None else None}
+
+
+def _is_reporter(reporter):
+    """ True if ``reporter`` can be used as a reporter: a :class:`modfmu.reporter.Reporter`, a
+    :class:`modfmu.reporter.QueuedReporter`, a ``buildingspy`` reporter, or any object with their ``write*`` methods
+    """
+    return all(hasattr(reporter, m) for m in ('writeOutput', 'writeWarning', 'writeError'))
+
+
+def _report_log(reporter, log, description, process=None):
+    """ Writes the outcome of a translator run to a reporter
+
+    :param log: the :class:`modfmu.dymola_log.DymolaLog` of the run
+    :param description: what was run, e.g. 'translation of MyLib.MyModel'
+    :param process: the :class:`ProcessResult` of the run, if any
+    """
+    if process is not None:
+        for kind, line in process.fatal_errors:
+            reporter.writeError('{0} {1} on a fatal error ({2}): {3}'.format(
+                description, 'stopped' if process.aborted else 'failed', kind, line))
+    if not log.found:
+        reporter.writeError('Could not find the Dymola log file at {}'.format(log.path))
+        return
+    for e in log.errors:
+        reporter.writeError(e)
+    for w in log.warnings:
+        reporter.writeWarning(w)
+    msg = '{0} : {1} errors, {2} warnings'.format(description, len(log.errors), len(log.warnings))
+    if log.equations is not None or log.states is not None:
+        msg += ', {0} equations, {1} states'.format(log.equations, log.states)
+    reporter.writeOutput(msg)
 
 
 class FMUTranslator:
@@ -32,7 +171,7 @@ class FMUTranslator:
         :type package_path: list
         """
 
-        import buildingspy.io.reporter as rp
+        from modfmu.reporter import Reporter
         import os
 
         if fmu_name is None:
@@ -43,14 +182,13 @@ class FMUTranslator:
 
         if output_directory is None:
             output_directory = '.'
-        else:
-            self.output_directory = output_directory
+        self.output_directory = output_directory
 
-        if isinstance(reporter, rp.Reporter):
+        if _is_reporter(reporter):
             self._reporter = reporter
         else:
             log_fil_nam = os.path.join(output_directory, "fmu_translator.log")
-            self._reporter = rp.Reporter(fileName=log_fil_nam)
+            self._reporter = Reporter(fileName=log_fil_nam)
             self._reporter.writeOutput('rp file is initiated')
 
         self.modifier = modifier
@@ -80,6 +218,23 @@ class FMUTranslator:
         self._show_gui = False
         self._exit_simulator = True
 
+        # Build cache, see modfmu.cache.FMUCache
+        self.cache = None
+        self._source_files = None
+        self._cache_key = None
+
+        # maximum time waited for the log file once the translator exited, in seconds
+        self._log_timeout = 2.
+        # time out of the translator, in seconds, see modfmu.history.BuildHistory.timeout
+        self.timeout = 100
+        # lines of the output after which the translator is stopped, see modfmu.dymola_log.fatal_patterns
+        self.fatal_patterns = dict(fatal_patterns)
+        # modfmu.pool.TranslatorPool running the script, instead of a new translator process
+        self.pool = None
+        # modfmu.repack.RepackPolicy applied to the FMU once translated, or None to keep it as written by the translator
+        self.repack = None
+        self.result = None
+
     @property
     def fmu_path(self):
         return self._fmu_path
@@ -229,6 +384,50 @@ class FMUTranslator:
         self._fmi_version = fmiVersion
         return
 
+    def source_files(self):
+        """List of the Modelica files the translation depends on.
+
+        Unless set with :meth:`set_source_files`, these are all the files of the opened libraries.
+        """
+        import os
+
+        if self._source_files is not None:
+            return self._source_files
+
+        files = list()
+        for p in self.package_path:
+            files.extend(_library_files(os.path.dirname(os.path.realpath(p))))
+        return files
+
+    def set_source_files(self, files):
+        """Sets the Modelica files the translation depends on, used to identify the FMU in the cache.
+
+        :param files: list of file paths
+        """
+        self._source_files = list(files)
+
+    def _restore_from_cache(self):
+        """ Restores the FMU from the cache, if any.
+
+        :return: True if the FMU was found in the cache
+        """
+        if self.cache is None:
+            return False
+        self._cache_key = self.cache.key(self)
+        if self.cache.fetch(self._cache_key, self.fmu_path):
+            self._reporter.writeOutput('{0} restored from the FMU cache'.format(self.fmu_path))
+            self.result = TranslationResult(self.model_path + self.modifier, self.fmu_path, status='cached')
+            return True
+        return False
+
+    def _store_in_cache(self):
+        """ Stores the translated FMU in the cache, if any.
+        """
+        import os
+
+        if self.cache is not None and self._cache_key is not None and os.path.exists(self.fmu_path):
+            self.cache.store(self._cache_key, self.fmu_path)
+
     def setTranslator(self, translator):
         """Sets the solver.
 
@@ -239,17 +438,12 @@ class FMUTranslator:
         self._translator_.update(translator=translator)
         return
 
-    def _get_dymola_commands(self):
+    def _get_translate_commands(self):
         """
-        Script that create a .mos file for translating the FMU 
+        Part of the script that translates the model in the output directory, without pre-processing statements
         """
 
-        #
-        script = ''
-        for p in self._preProcessing:
-            script += '\n' + p
-        script += '\n'
-        script += 'cd("' + self._output_directory + '");\n'
+        script = 'cd("' + self._output_directory + '");\n'
         script += 'translateModelFMU("' + \
                   self.model_path + self.modifier + '",' + \
                   self._store_result + ',"' + \
@@ -261,6 +455,19 @@ class FMUTranslator:
         for p in self._postProcessing:
             script += p + '\n'
 
+        return script
+
+    def _get_dymola_commands(self):
+        """
+        Script that create a .mos file for translating the FMU 
+        """
+
+        #
+        script = ''
+        for p in self._preProcessing:
+            script += '\n' + p
+        script += '\n'
+        script += self._get_translate_commands()
         script += 'savelog("{0}");\n'.format(self._dymola_log_file)
 
         if self._exit_simulator:
@@ -268,29 +475,371 @@ class FMUTranslator:
 
         return script
 
-    def translate_fmu(self):
-        """ Translate model to FMU
+    def _remove_previous_outputs(self):
+        """ Removes the FMU and the log left by a previous translation, which would be taken for the outputs of
+        the next one
+        """
+        import os
+
+        for f in (self.fmu_path, self.log_path):
+            if os.path.exists(f):
+                os.remove(f)
+
+    def _write_script(self):
+        """ Writes the translation script, unless the FMU is restored from the cache
+
+        :return: the path of the script, or None if the FMU was restored from the cache
         """
         import os
-        from time import sleep
+
+        if self._restore_from_cache():
+            return None
+
+        self._remove_previous_outputs()
 
         runScriptName = os.path.join(self.output_directory, self._translate_mos)
         self._reporter.writeOutput('writing file {0}'.format(runScriptName))
         f = open(runScriptName, 'w')
         f.write(self._get_dymola_commands())
         f.close()
-        self._reporter.writeOutput('running file {0}'.format(runScriptName))
-        run_mos(runScriptName, directory=self.output_directory, modelica_exe=self._modelica_exe, timeout=100, showGUI=self._show_gui, showProgressBar=self._show_progress_bar)
-        self._reporter.writeOutput('trying to read dymola log file :')
-        try:
-            sleep(0.1)
-            with open(os.path.join(self.output_directory, self._dymola_log_file), 'r') as f:
-                lines = f.readlines()
-            line = '\t\t\t\t'.join(lines)
-            self._reporter.writeOutput(line)
-        except Exception:
-            msg = 'Could not find the Dymola log file at {}'.format(os.path.join(self.output_directory, self._dymola_log_file))
-            self._reporter.writeError(msg)
+        return runScriptName
+
+    def translate_fmu(self):
+        """ Translate model to FMU
+
+        :return: a :class:`TranslationResult`
+        """
+        with profiling.phase('total', 'FMUTranslator', model=self.model_path + self.modifier):
+            with profiling.phase('script_write', 'FMUTranslator'):
+                runScriptName = self._write_script()
+            if runScriptName is None:
+                return self.result
+            self._reporter.writeOutput('running file {0}'.format(runScriptName))
+            runner = run_mos if self.pool is None else self.pool.run_mos
+
+            process = runner(runScriptName, directory=self.output_directory, modelica_exe=self._modelica_exe, timeout=self.timeout, showGUI=self._show_gui, showProgressBar=self._show_progress_bar,
+                             fatal_patterns=self.fatal_patterns, watch=[self.log_path])
+            return self._read_result(process)
+
+    async def translate_fmu_async(self):
+        """ Translate model to FMU, without blocking the event loop
+
+        Same as :meth:`translate_fmu`, the translator being run by :func:`run_mos_async`.
+        """
+        with profiling.phase('total', 'FMUTranslator', model=self.model_path + self.modifier):
+            with profiling.phase('script_write', 'FMUTranslator'):
+                runScriptName = self._write_script()
+            if runScriptName is None:
+                return self.result
+            self._reporter.writeOutput('running file {0}'.format(runScriptName))
+            runner = run_mos_async if self.pool is None else self.pool.run_mos_async
+
+            process = await runner(runScriptName, directory=self.output_directory, modelica_exe=self._modelica_exe, timeout=self.timeout, showGUI=self._show_gui,
+                                   fatal_patterns=self.fatal_patterns, watch=[self.log_path])
+            return await self._read_result_async(process)
+
+    @property
+    def log_path(self):
+        """ Path of the Dymola log file of the translation
+        """
+        import os
+        return os.path.join(self.output_directory, self._dymola_log_file)
+
+    def _read_result(self, process):
+        """ Waits for the Dymola log file of the translation, then parses it
+
+        :param process: :class:`ProcessResult` of the translator process
+        :return: a :class:`TranslationResult`
+        """
+        from modfmu.dymola_log import wait_for_file
+
+        with profiling.phase('log_read', 'FMUTranslator', model=self.model_path + self.modifier):
+            if not process.timed_out and not process.aborted:
+                wait_for_file(self.log_path, self._log_timeout)
+            return self._make_result(process)
+
+    async def _read_result_async(self, process):
+        from modfmu.dymola_log import wait_for_file_async
+
+        with profiling.phase('log_read', 'FMUTranslator', model=self.model_path + self.modifier):
+            if not process.timed_out and not process.aborted:
+                await wait_for_file_async(self.log_path, self._log_timeout)
+            return self._make_result(process)
+
+    def _make_result(self, process):
+        import os
+        from modfmu.dymola_log import DymolaLog
+
+        log = DymolaLog.parse(self.log_path)
+        _report_log(self._reporter, log, 'translation of {}'.format(self.model_path + self.modifier), process)
+        if process.timed_out:
+            status = 'timeout'
+        elif os.path.exists(self.fmu_path):
+            status = 'translated'
+        else:
+            status = 'failed'
+        if status == 'translated' and self.repack is not None:
+            self._repack()
+        self.result = TranslationResult(self.model_path + self.modifier, self.fmu_path if status == 'translated' else None,
+                                        status=status, process=process, log=log)
+        if self.result.success:
+            self._store_in_cache()
+        return self.result
+
+    def _repack(self):
+        """ Strips and recompresses the translated FMU according to :attr:`repack`. The FMU is kept as written by the
+        translator if it cannot be repacked.
+        """
+        from modfmu.repack import repack_fmu, RepackError
+
+        with profiling.phase('repack', 'FMUTranslator', model=self.model_path + self.modifier):
+            try:
+                r = repack_fmu(self.fmu_path, self.repack, include_sources=self._include_src == 'true')
+            except RepackError as e:
+                self._reporter.writeWarning('{0} was not repacked: {1}'.format(self.fmu_path, e))
+                return
+        self._reporter.writeOutput('{0} repacked from {1} to {2} bytes, {3} entries removed'.format(
+            self.fmu_path, r.size_before, r.size_after, len(r.removed)))
+
+
+class FMUBatchTranslator(object):
+    """Class to translate several Modelica models to FMU within a single translator session.
+
+    The library is opened once, then each model is translated in its own output directory,
+    where its own log file is saved.
+    """
+    _translate_mos = '_translate_batch.mos'
+
+    def __init__(self, models, translator, output_directory=None, package_path=list(), reporter=None, script_name=None):
+        """
+
+        :param models: list of models to translate. Each item is either a model name, a tuple
+            ``(model_name, modifier)`` or an already configured :class:`FMUTranslator`.
+        :param translator: name of the translator executable
+        :param output_directory: directory in which the sub directory of each model is created
+        :param script_name: name of the script written in ``output_directory``. Batches sharing the same
+            output directory must have different script names.
+        :type package_path: list
+        """
+
+        from modfmu.reporter import Reporter
+        import os
+
+        if output_directory is None:
+            output_directory = '.'
+
+        if _is_reporter(reporter):
+            self._reporter = reporter
+        else:
+            if output_directory != '.' and not os.path.exists(output_directory):
+                os.makedirs(output_directory)
+            log_fil_nam = os.path.join(output_directory, "fmu_translator.log")
+            self._reporter = Reporter(fileName=log_fil_nam)
+            self._reporter.writeOutput('rp file is initiated')
+
+        if script_name is not None:
+            self._translate_mos = script_name
+
+        self._output_directory = output_directory
+        self._modelica_exe = translator
+        self._preProcessing = list()
+        self._translators = list()
+        self._show_progress_bar = False
+        self._show_gui = False
+        self._exit_simulator = True
+        # the errors of one model must not stop the translation of the other ones
+        self.fatal_patterns = {k: fatal_patterns[k] for k in session_fatal_kinds if k in fatal_patterns}
+        # modfmu.pool.TranslatorPool running the script, instead of a new translator process
+        self.pool = None
+
+        for p in package_path:
+            self.addpackagepath(p)
+
+        for m in models:
+            self.add_model(m)
+
+    @property
+    def translators(self):
+        """List of the :class:`FMUTranslator` of each model of the batch
+        """
+        return self._translators
+
+    @property
+    def output_directory(self):
+        return self._output_directory
+
+    def add_model(self, model):
+        """Adds a model to the batch.
+
+        :param model: a model name, a tuple ``(model_name, modifier)`` or a :class:`FMUTranslator`
+        :return: the :class:`FMUTranslator` of the model
+        """
+        import os
+
+        if isinstance(model, FMUTranslator):
+            fmutrans = model
+        else:
+            if isinstance(model, str):
+                model_name, modifier = model, ""
+            else:
+                model_name, modifier = model
+            fmu_name = model_name.split('.')[-1]
+            # models that differ only by their modifier must not share an output directory
+            taken = [t.fmu_name for t in self._translators]
+            if fmu_name in taken:
+                i = 1
+                while '{}_{}'.format(fmu_name, i) in taken:
+                    i += 1
+                fmu_name = '{}_{}'.format(fmu_name, i)
+            fmutrans = FMUTranslator(model_name,
+                                     translator=self._modelica_exe,
+                                     fmu_name=fmu_name,
+                                     modifier=modifier,
+                                     output_directory=os.path.join(self._output_directory, fmu_name),
+                                     reporter=self._reporter)
+        self._translators.append(fmutrans)
+        return fmutrans
+
+    def addPreProcessingStatement(self, command):
+        """Adds a pre-processing statement, executed once before the translation of the first model.
+
+        :param command: A script statement.
+        """
+        self._preProcessing.append(command)
+        return
+
+    def addpackagepath(self, packagePath):
+        """ Adds a Modelica package to be opened once at the beginning of the session.
+
+        :type packagePath: string
+        :param packagePath: The path of the ``package.mo`` file of the Modelica package.
+        """
+        import os
+
+        if not os.path.isfile(packagePath):
+            msg = "Argument packagePath=%s must be an existing file " % packagePath
+            msg += "containing a Modelica package."
+            raise ValueError(msg)
+
+        self.addPreProcessingStatement('openModel("' + packagePath + '")')
+
+    def setFmiVersion(self, fmiVersion='2'):
+        """Set the FMI version of every model of the batch
+
+            :param fmiVersion: version of the fmi
+        """
+        for t in self._translators:
+            t.setFmiVersion(fmiVersion)
+
+    def set_fmi_type(self, fmi_type='cs'):
+        """Set the FMI type of every model of the batch
+
+            :param fmi_type: 'cs', 'me' or 'all'
+        """
+        for t in self._translators:
+            t.fmi_type = fmi_type
+
+    def _get_dymola_commands(self, translators=None):
+        """
+        Script that create a .mos file for translating all the FMUs of the batch
+
+        :param translators: translators of the models to translate. Defaults to all the models of the batch.
+        """
+        import os
+
+        if translators is None:
+            translators = self._translators
+
+        script = ''
+        for p in self._preProcessing:
+            script += '\n' + p
+        script += '\n'
+
+        for t in translators:
+            for p in t._preProcessing:
+                script += p + '\n'
+            script += t._get_translate_commands()
+            script += 'savelog("{0}");\n'.format(os.path.join(t.output_directory, t._dymola_log_file))
+            script += 'clearlog();\n'
+
+        if self._exit_simulator:
+            script += "Modelica.Utilities.System.exit();\n"
+
+        return script
+
+    def _write_script(self, timeout=None):
+        """ Writes the script translating the models whose FMU is not restored from the cache
+
+        :return: tuple ``(script path, translators of these models, time out)``. The script path is None
+            if all the FMUs were restored from the cache.
+        """
+        import os
+
+        pending = [t for t in self._translators if not t._restore_from_cache()]
+        for t in pending:
+            t._remove_previous_outputs()
+
+        if timeout is None:
+            timeout = sum(t.timeout for t in pending)
+
+        if not pending:
+            return None, pending, timeout
+
+        if self._output_directory != '.' and not os.path.exists(self._output_directory):
+            os.makedirs(self._output_directory)
+        runScriptName = os.path.join(self._output_directory, self._translate_mos)
+        self._reporter.writeOutput('writing file {0}'.format(runScriptName))
+        with open(runScriptName, 'w') as f:
+            f.write(self._get_dymola_commands(pending))
+        self._reporter.writeOutput('running file {0} for {1} models'.format(runScriptName, len(pending)))
+        return runScriptName, pending, timeout
+
+    def _collect_results(self, process, pending):
+        """ Reads the log of the translated models and maps each model to its result
+        """
+        for t in pending:
+            t._read_result(process)
+
+        return {t.model_path + t.modifier: t.result for t in self._translators}
+
+    async def _collect_results_async(self, process, pending):
+        for t in pending:
+            await t._read_result_async(process)
+
+        return {t.model_path + t.modifier: t.result for t in self._translators}
+
+    def translate_fmus(self, timeout=None):
+        """ Translate all the models of the batch within a single translator session
+
+        Models whose FMU is found in the cache of their translator are restored instead of being translated.
+
+        :param timeout: Time out in seconds for the whole session. Defaults to the sum of the time outs of the models.
+        :return: dictionary mapping each model name (with its modifier) to its :class:`TranslationResult`
+        """
+        with profiling.phase('total', 'FMUBatchTranslator', batch=self._translate_mos):
+            with profiling.phase('script_write', 'FMUBatchTranslator'):
+                runScriptName, pending, timeout = self._write_script(timeout)
+            if runScriptName is None:
+                return self._collect_results(None, pending)
+            runner = run_mos if self.pool is None else self.pool.run_mos
+
+            process = runner(runScriptName, directory=self._output_directory, modelica_exe=self._modelica_exe, timeout=timeout,
+                             showGUI=self._show_gui, showProgressBar=self._show_progress_bar, fatal_patterns=self.fatal_patterns)
+            return self._collect_results(process, pending)
+
+    async def translate_fmus_async(self, timeout=None):
+        """ Same as :meth:`translate_fmus`, without blocking the event loop
+        """
+        with profiling.phase('total', 'FMUBatchTranslator', batch=self._translate_mos):
+            with profiling.phase('script_write', 'FMUBatchTranslator'):
+                runScriptName, pending, timeout = self._write_script(timeout)
+            if runScriptName is None:
+                return self._collect_results(None, pending)
+            runner = run_mos_async if self.pool is None else self.pool.run_mos_async
+
+            process = await runner(runScriptName, directory=self._output_directory, modelica_exe=self._modelica_exe,
+                                   timeout=timeout, showGUI=self._show_gui, fatal_patterns=self.fatal_patterns)
+            return await self._collect_results_async(process, pending)
 
 
 class FMUImport(object):
@@ -298,7 +847,7 @@ class FMUImport(object):
 
     def __init__(self, pck, fmu_path, importer='Dymola', reporter=None):
 
-        import buildingspy.io.reporter as rp
+        from modfmu.reporter import Reporter
         import os
 
         # checking pck
@@ -308,11 +857,11 @@ class FMUImport(object):
             msg = 'pck must be a modelica package'
             raise TypeError(msg)
 
-        if isinstance(reporter, rp.Reporter):
+        if _is_reporter(reporter):
             self._reporter = reporter
         elif reporter is None:
             log_fil_nam = os.path.join(pck.path, "fmu_importer.log")
-            self._reporter = rp.Reporter(fileName=log_fil_nam)
+            self._reporter = Reporter(fileName=log_fil_nam)
             self._reporter.writeOutput('rp file is initiated')
 
         # checking fmu_path
@@ -333,6 +882,14 @@ class FMUImport(object):
         self._postProcessing = list()
 
         self._dymola_log_file = 'dymola_import.log'
+        # maximum time waited for the log file once the importer exited, in seconds
+        self._log_timeout = 2.
+        # time out of the importer, in seconds
+        self.timeout = 100
+        # lines of the output after which the importer is stopped
+        self.fatal_patterns = {k: fatal_patterns[k] for k in session_fatal_kinds if k in fatal_patterns}
+        # modfmu.pool.TranslatorPool running the script, instead of a new translator process
+        self.pool = None
 
     def addPostProcessingStatement(self, command):
         """
@@ -387,12 +944,16 @@ class FMUImport(object):
 
         return script
 
-    def import_fmu(self):
-        """ 
-        import FMU to modelica model
+    def _write_script(self):
+        """ Writes the import script
+
+        :return: the path of the script
         """
         import os
-        from time import sleep
+
+        # a log left by a previous import would be taken for the log of this one
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
 
         runScriptName = os.path.join(self.pck.path, self._import_mos)
         self._reporter.writeOutput('writing file {0}'.format(runScriptName))
@@ -400,50 +961,351 @@ class FMUImport(object):
         f.write(self._get_dymola_commands())
         f.close()
         self._reporter.writeOutput('running file {0}'.format(runScriptName))
-        run_mos(runScriptName, directory=self.pck.path, modelica_exe=self._MODELICA_EXE, timeout=100, showGUI=self._showGUI, showProgressBar=self._showProgressBar)
-        self._reporter.writeOutput('trying to read dymola log file :')
+        return runScriptName
 
-        try:
-            sleep(0.2)
-            with open(os.path.join(self.pck.path, self._dymola_log_file), 'r') as f:
-                lines = f.readlines()
-            line = '\t\t\t\t'.join(lines)
-            self._reporter.writeOutput(line)
-        except Exception:
-            self._reporter.writeError('Could not find the Dymola log file')
+    @property
+    def log_path(self):
+        """ Path of the Dymola log file of the import
+        """
+        import os
+        return os.path.join(self.pck.path, self._dymola_log_file)
 
+    def _make_result(self, process):
+        from modfmu.dymola_log import DymolaLog
 
-def print_progress_bar(fraction_complete):
-    """Prints a progress bar to the console.
+        log = DymolaLog.parse(self.log_path)
+        _report_log(self._reporter, log, 'import of {}'.format(self._fmu_path), process)
+        return ImportResult(self._fmu_path, self.pck._modelica_name, process=process, log=log)
 
-    :param fraction_complete: The fraction of the time that is completed.
+    def import_fmu(self):
+        """ 
+        import FMU to modelica model
 
-    """
-    import sys
-    nInc = 50
-    count = int(nInc * fraction_complete)
-    proBar = "|"
-    for i in range(nInc):
-        if i < count:
-            proBar += "-"
-        else:
-            proBar += " "
-    proBar += "|"
-    print((proBar, int(fraction_complete * 100), "%\r",))
-    sys.stdout.flush()
+        :return: an :class:`ImportResult`
+        """
+        from modfmu.dymola_log import wait_for_file
 
+        with profiling.phase('import', 'FMUImport', fmu=self._fmu_path):
+            with profiling.phase('script_write', 'FMUImport'):
+                runScriptName = self._write_script()
+            runner = run_mos if self.pool is None else self.pool.run_mos
 
-def is_executable(program):
-    import os
-    import platform
+            process = runner(runScriptName, directory=self.pck.path, modelica_exe=self._MODELICA_EXE, timeout=self.timeout, showGUI=self._showGUI, showProgressBar=self._showProgressBar,
+                             fatal_patterns=self.fatal_patterns)
+            with profiling.phase('log_read', 'FMUImport'):
+                if not process.timed_out and not process.aborted:
+                    wait_for_file(self.log_path, self._log_timeout)
+                return self._make_result(process)
 
-    def is_exe(fpath):
-        return os.path.exists(fpath) and os.access(fpath, os.X_OK)
+    async def import_fmu_async(self):
+        """
+        import FMU to modelica model, without blocking the event loop
+        """
+        from modfmu.dymola_log import wait_for_file_async
 
-    # Add .exe, which is needed on Windows 7 to test existence
-    # of the program
-    if platform.system() == "Windows":
-        program = program + ".exe"
+        with profiling.phase('import', 'FMUImport', fmu=self._fmu_path):
+            with profiling.phase('script_write', 'FMUImport'):
+                runScriptName = self._write_script()
+            runner = run_mos_async if self.pool is None else self.pool.run_mos_async
+
+            process = await runner(runScriptName, directory=self.pck.path, modelica_exe=self._MODELICA_EXE, timeout=self.timeout, showGUI=self._showGUI,
+                                   fatal_patterns=self.fatal_patterns)
+            with profiling.phase('log_read', 'FMUImport'):
+                if not process.timed_out and not process.aborted:
+                    await wait_for_file_async(self.log_path, self._log_timeout)
+                return self._make_result(process)
+
+
+class FMUBatchImport(object):
+    """Class to import several FMUs in a Modelica package within a single importer session.
+
+    The package is opened once, then the FMUs are imported one after the other. The log of the session is split
+    per FMU by markers printed before and after each import, and the models created by the imports are added to
+    ``package.order`` in a single write once the session ended.
+    """
+    _import_mos = '_import_batch.mos'
+    _begin_marker = 'modfmu: begin of import {}'
+    _end_marker = 'modfmu: end of import {}'
+    # time out of the import of each FMU, in seconds
+    _fmu_timeout = 100
+
+    def __init__(self, pck, fmu_paths, importer='Dymola', reporter=None):
+        """
+
+        :param pck: package in which the FMUs are imported
+        :param fmu_paths: paths of the FMUs, imported in this order
+        :param importer: name of the importer executable
+        """
+        from modfmu.reporter import Reporter
+        import os
+
+        if type(pck) is Package:
+            self.pck = pck
+        else:
+            msg = 'pck must be a modelica package'
+            raise TypeError(msg)
+
+        if _is_reporter(reporter):
+            self._reporter = reporter
+        else:
+            log_fil_nam = os.path.join(pck.path, "fmu_importer.log")
+            self._reporter = Reporter(fileName=log_fil_nam)
+            self._reporter.writeOutput('rp file is initiated')
+
+        self._fmu_paths = list()
+        for fmu_path in fmu_paths:
+            if not (os.path.exists(fmu_path) and fmu_path.endswith('.fmu')):
+                msg = 'fmu_path must be pointing at an existing fmu file. Got %s instead' % fmu_path
+                self._reporter.writeError(msg)
+                raise FileNotFoundError(msg)
+            self._fmu_paths.append(fmu_path)
+
+        self._MODELICA_EXE = importer
+        self._exitSimulator = True
+        self._showGUI = False
+        self._showProgressBar = False
+
+        self._preProcessing = list()
+        self._postProcessing = list()
+
+        self._dymola_log_file = 'dymola_import_batch.log'
+        # maximum time waited for the log file once the importer exited, in seconds
+        self._log_timeout = 2.
+        # time out of the whole session, in seconds. Defaults to the time out of each FMU times their number.
+        self.timeout = None
+        # lines of the output after which the importer is stopped
+        self.fatal_patterns = {k: fatal_patterns[k] for k in session_fatal_kinds if k in fatal_patterns}
+        # modfmu.pool.TranslatorPool running the script, instead of a new translator process
+        self.pool = None
+        self._classes_before = dict()  # classes of the package before the imports, see _package_classes
+
+    @property
+    def fmu_paths(self):
+        return self._fmu_paths
+
+    def addPostProcessingStatement(self, command):
+        """
+        Adds a post-processing statement, executed once after the import of the last FMU.
+
+        :param command:  A script statement.
+        """
+        self._postProcessing.append(command)
+
+    def addPreProcessingStatement(self, command):
+        """
+        Adds a pre-processing statement, executed once before the package is opened.
+
+        :param command: A script statement.
+        """
+        self._preProcessing.append(command)
+
+    def _get_dymola_commands(self):
+        """
+        Script that create a .mos file for importing all the FMUs. The log is saved after each import, so that the
+        imports done before the session is stopped are known.
+        """
+        import os
+
+        script = ''
+        for p in self._preProcessing:
+            script += '\n' + p
+        script += '\n'
+
+        script += 'openModel("{}");\n'.format(os.path.join(self.pck.path, Package._package_file))
+        script += 'cd("{}");\n'.format(self.pck.path)
+        script += '  Advanced.FMI.CopyExternalResources = false;\n'
+        script += '  Advanced.FMI.OverlappingIOThreshold = 6;\n'
+        for i, fmu_path in enumerate(self._fmu_paths):
+            script += 'Modelica.Utilities.Streams.print("{}");\n'.format(self._begin_marker.format(i))
+            script += 'importFMU("{0}", false, false, false, "{1}");\n'.format(fmu_path.replace('\\', r'\\'),
+                                                                           self.pck._modelica_name)
+            script += 'Modelica.Utilities.Streams.print("{}");\n'.format(self._end_marker.format(i))
+            script += 'savelog("{}");\n'.format(self._dymola_log_file)
+
+        for p in self._postProcessing:
+            script += p + '\n'
+
+        script += 'savelog("{}");\n'.format(self._dymola_log_file)
+
+        if self._exitSimulator:
+            script += "Modelica.Utilities.System.exit();\n"
+
+        return script
+
+    @property
+    def log_path(self):
+        """ Path of the Dymola log file of the session
+        """
+        import os
+        return os.path.join(self.pck.path, self._dymola_log_file)
+
+    def _package_classes(self):
+        """ Modification time of the modelica files and sub packages directly contained in the package
+        """
+        import os
+
+        classes = dict()
+        for entry in os.scandir(self.pck.path):
+            if entry.is_file() and entry.name.endswith('.mo') and entry.name != Package._package_file:
+                classes[entry.name[:-3]] = entry.stat().st_mtime_ns
+            elif entry.is_dir() and os.path.isfile(os.path.join(entry.path, Package._package_file)):
+                classes[entry.name] = os.stat(os.path.join(entry.path, Package._package_file)).st_mtime_ns
+        return classes
+
+    def _write_script(self):
+        """ Writes the import script
+
+        :return: tuple ``(script path, classes of the package before the imports)``
+        """
+        import os
+
+        # a log left by a previous import would be taken for the log of this one
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+        runScriptName = os.path.join(self.pck.path, self._import_mos)
+        self._reporter.writeOutput('writing file {0}'.format(runScriptName))
+        with open(runScriptName, 'w') as f:
+            f.write(self._get_dymola_commands())
+        self._reporter.writeOutput('running file {0} for {1} FMUs'.format(runScriptName, len(self._fmu_paths)))
+        return runScriptName, self._package_classes()
+
+    def _split_log(self):
+        """ Splits the log of the session between the FMUs
+
+        :return: tuple ``(log of each FMU, indices of the FMUs whose import went to its end)``. The errors written
+            before the first import, e.g. while opening the package, are in the log of every FMU.
+        """
+        from modfmu.dymola_log import DymolaLog
+
+        begins = {self._begin_marker.format(i): i for i in range(len(self._fmu_paths))}
+        ends = {self._end_marker.format(i): i for i in range(len(self._fmu_paths))}
+        preamble = list()
+        sections = dict()  # index of the FMU -> lines of its import
+        completed = set()
+        current = preamble
+        found = False
+        try:
+            with open(self.log_path, 'r', errors='replace') as f:
+                found = True
+                for line in f:
+                    marker = line.strip()
+                    if marker in begins:
+                        current = sections.setdefault(begins[marker], list())
+                    elif marker in ends:
+                        completed.add(ends[marker])
+                        current = list()  # lines between two imports
+                    else:
+                        current.append(line)
+        except OSError:
+            pass
+
+        session = DymolaLog(self.log_path)
+        session.feed(preamble)
+        logs = list()
+        for i in range(len(self._fmu_paths)):
+            log = DymolaLog(self.log_path)
+            log.found = found
+            log.feed(sections.get(i, list()))
+            log.errors = session.errors + log.errors
+            logs.append(log)
+        return logs, completed
+
+    def _make_results(self, process):
+        """ Results of the imports, and update of ``package.order`` with the models they created
+        """
+        import os
+
+        logs, completed = self._split_log()
+        results = list()
+        for i, (fmu_path, log) in enumerate(zip(self._fmu_paths, logs)):
+            _report_log(self._reporter, log, 'import of {}'.format(fmu_path), process if i == 0 else None)
+            results.append(ImportResult(fmu_path, self.pck._modelica_name, process=process, log=log,
+                                        completed=i in completed))
+
+        # models created or rewritten by the imports, in the order of their FMU
+        classes = self._package_classes()
+        changed = sorted(n for n, mtime in classes.items() if self._classes_before.get(n) != mtime)
+        stems = [os.path.splitext(os.path.basename(p))[0] for p in self._fmu_paths]
+        rank = {n: next((i for i, s in enumerate(stems) if n.startswith(s)), len(stems)) for n in changed}
+        added = self.pck.add_to_order(sorted(changed, key=lambda n: rank[n]))
+        if added:
+            self._reporter.writeOutput('added {0} models to {1}'.format(len(added), self.pck._modelica_name))
+        return results
+
+    def import_fmus(self):
+        """
+        import the FMUs to the modelica package within a single importer session
+
+        :return: list of the :class:`ImportResult` of each FMU, in the order of ``fmu_paths``
+        """
+        from modfmu.dymola_log import wait_for_file
+
+        with profiling.phase('import', 'FMUBatchImport', fmus=len(self._fmu_paths)):
+            with profiling.phase('script_write', 'FMUBatchImport'):
+                runScriptName, self._classes_before = self._write_script()
+            timeout = self.timeout if self.timeout is not None else self._fmu_timeout * len(self._fmu_paths)
+            runner = run_mos if self.pool is None else self.pool.run_mos
+
+            process = runner(runScriptName, directory=self.pck.path, modelica_exe=self._MODELICA_EXE, timeout=timeout,
+                             showGUI=self._showGUI, showProgressBar=self._showProgressBar,
+                             fatal_patterns=self.fatal_patterns)
+            with profiling.phase('log_read', 'FMUBatchImport'):
+                if not process.timed_out and not process.aborted:
+                    wait_for_file(self.log_path, self._log_timeout)
+                return self._make_results(process)
+
+    async def import_fmus_async(self):
+        """
+        Same as :meth:`import_fmus`, without blocking the event loop
+        """
+        from modfmu.dymola_log import wait_for_file_async
+
+        with profiling.phase('import', 'FMUBatchImport', fmus=len(self._fmu_paths)):
+            with profiling.phase('script_write', 'FMUBatchImport'):
+                runScriptName, self._classes_before = self._write_script()
+            timeout = self.timeout if self.timeout is not None else self._fmu_timeout * len(self._fmu_paths)
+            runner = run_mos_async if self.pool is None else self.pool.run_mos_async
+
+            process = await runner(runScriptName, directory=self.pck.path, modelica_exe=self._MODELICA_EXE,
+                                   timeout=timeout, showGUI=self._showGUI, fatal_patterns=self.fatal_patterns)
+            with profiling.phase('log_read', 'FMUBatchImport'):
+                if not process.timed_out and not process.aborted:
+                    await wait_for_file_async(self.log_path, self._log_timeout)
+                return self._make_results(process)
+
+
+def print_progress_bar(fraction_complete):
+    """Prints a progress bar to the console.
+
+    :param fraction_complete: The fraction of the time that is completed.
+
+    """
+    import sys
+    nInc = 50
+    count = int(nInc * fraction_complete)
+    proBar = "|"
+    for i in range(nInc):
+        if i < count:
+            proBar += "-"
+        else:
+            proBar += " "
+    proBar += "|"
+    print((proBar, int(fraction_complete * 100), "%\r",))
+    sys.stdout.flush()
+
+
+def is_executable(program):
+    import os
+    import platform
+
+    def is_exe(fpath):
+        return os.path.exists(fpath) and os.access(fpath, os.X_OK)
+
+    # Add .exe, which is needed on Windows 7 to test existence
+    # of the program
+    if platform.system() == "Windows":
+        program = program + ".exe"
 
     if is_exe(program):
         return True
@@ -455,26 +1317,116 @@ def is_executable(program):
     return False
 
 
-def run_mos(mosFile, directory, modelica_exe='Dymola',
-            timeout=60, showGUI=False, showProgressBar=False):
-    """Runs a model translation or simulation.
-    
-    :param showGUI: 
-    :param showProgressBar: 
-    :param modelica_exe: 
-    :param mosFile: The Modelica *mos* file name, including extension
-    :param timeout: Time out in seconds
-    :param directory
+class ProcessResult(object):
+    """Outcome of a translator process run by :func:`run_mos`.
     """
 
+    def __init__(self, cmd, returncode=None, timed_out=False, duration=0., stdout_log=None, stderr_log=None, aborted=False,
+                 fatal_errors=None):
+        """
+
+        :param aborted: True if the process was stopped because of a fatal error in its output
+        :param fatal_errors: list of the ``(kind, line)`` of the lines of the output matching a fatal error pattern
+        """
+        self.cmd = cmd
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.duration = duration
+        self.stdout_log = stdout_log
+        self.stderr_log = stderr_log
+        self.aborted = aborted
+        self.fatal_errors = fatal_errors if fatal_errors is not None else list()
+
+    @property
+    def success(self):
+        """True if the process exited by itself with a zero exit code
+        """
+        return self.returncode == 0 and not self.timed_out and not self.aborted
+
+    def __repr__(self):
+        return 'ProcessResult(returncode={}, timed_out={}, aborted={}, duration={:.2f})'.format(
+            self.returncode, self.timed_out, self.aborted, self.duration)
+
+
+def _popen_process_group_kwargs():
+    """ Arguments of ``subprocess.Popen`` starting the process in its own process group, so that the translator
+    and the compilers it spawns can be stopped together.
+    """
+    import subprocess
     import sys
+
+    if sys.platform == 'win32':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def _process_group_alive(pgid):
+    """ True if a process of the process group ``pgid`` is still running (POSIX)
+    """
+    import os
+
+    try:
+        os.killpg(pgid, 0)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def _kill_process_group(pro, grace=5.):
+    """ Terminates the process group of ``pro``, then kills it if any of its processes is still running after
+    ``grace`` seconds.
+
+    :param pro: process started with :func:`_popen_process_group_kwargs`
+    :param grace: time given to the processes to exit after being terminated, in seconds
+    """
+    import os
+    import signal
     import subprocess
+    import sys
     import time
-    import datetime
 
-    # Remove the working directory from the mosFile name.
-    # This is needed for example if the simulation is run in a docker,
-    # which may have a different file structure than the host.
+    if sys.platform == 'win32':
+        try:
+            pro.send_signal(signal.CTRL_BREAK_EVENT)
+        except OSError:
+            pass
+        try:
+            pro.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            # taskkill is the only way to kill the whole tree of processes
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(pro.pid)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            pro.kill()
+            pro.wait()
+        return
+
+    try:
+        os.killpg(pro.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+    deadline = time.monotonic() + grace
+    try:
+        pro.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    # the processes of the group ignoring SIGTERM, e.g. compilers, may outlive the translator
+    while _process_group_alive(pro.pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if _process_group_alive(pro.pid):
+        try:
+            os.killpg(pro.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    pro.wait()
+
+
+def _mos_process_result(mosFile, directory, modelica_exe, showGUI):
+    """ Checks the translator executable and prepares the result of the run of a *mos* file.
+
+    :return: a :class:`ProcessResult` holding the command to run and the paths of its output logs
+    :raises FileNotFoundError: if the translator executable is not on the PATH
+    """
+    import os
 
     # List of command and arguments
     if showGUI:
@@ -484,102 +1436,815 @@ def run_mos(mosFile, directory, modelica_exe='Dymola',
 
     # Check if executable is on the path
     if not is_executable(cmd[0]):
-        print(("Error: Did not find executable '", cmd[0], "'."))
-        print("       Make sure it is on the PATH variable of your operating system.")
-        exit(3)
-    # Run command
+        raise FileNotFoundError("Did not find executable '{}'. Make sure it is on the PATH variable of your operating "
+                                "system.".format(cmd[0]))
+
+    log_base = os.path.join(directory, os.path.splitext(os.path.basename(mosFile))[0])
+    return ProcessResult(cmd, stdout_log=log_base + '_stdout.log', stderr_log=log_base + '_stderr.log')
+
+
+# time between two readings of the output of a translator looking for fatal errors, in seconds
+_fatal_poll_interval = 0.25
+
+
+def _fatal_error_watcher(result, fatal_patterns, watch):
+    """ :class:`modfmu.dymola_log.FatalErrorWatcher` of the output of a translator, or None if there is no pattern
+    """
+    from modfmu.dymola_log import FatalErrorWatcher
+
+    if not fatal_patterns:
+        return None
+    return FatalErrorWatcher([result.stdout_log, result.stderr_log] + list(watch), fatal_patterns)
+
+
+def run_mos(mosFile, directory, modelica_exe='Dymola',
+            timeout=60, showGUI=False, showProgressBar=False, fatal_patterns=None, watch=()):
+    """Runs a model translation or simulation.
+
+    The standard output and error of the translator are written as they come to
+    ``<mosFile without extension>_stdout.log`` and ``_stderr.log`` in ``directory``.
+    If the translator is still running after ``timeout`` seconds, its whole process group
+    is terminated, then killed if it does not exit.
+
+    With ``fatal_patterns``, the output of the translator and the ``watch`` files are read while they are
+    written. As soon as a line matches one of the patterns, the translator is stopped the same way, as it cannot
+    succeed anymore. The matching lines are given by the ``fatal_errors`` attribute of the result.
+
+    :param showGUI: 
+    :param showProgressBar: 
+    :param modelica_exe: 
+    :param mosFile: The Modelica *mos* file name, including extension
+    :param timeout: Time out in seconds. No time out if it is not positive. The time spent waiting for the
+        admission of the translator by the :mod:`modfmu.scheduler` controller in use, if any, is not counted.
+    :param directory
+    :param fatal_patterns: dictionary mapping a kind of error to a regular expression, see
+        :data:`modfmu.dymola_log.fatal_patterns`
+    :param watch: paths of other files written by the translator in which fatal errors are looked for, e.g. its log
+    :return: a :class:`ProcessResult`
+    :raises FileNotFoundError: if the translator executable is not on the PATH
+    """
+
+    import sys
+    import subprocess
+    import time
+
+    result = _mos_process_result(mosFile, directory, modelica_exe, showGUI)
+    cmd = result.cmd
+    watcher = _fatal_error_watcher(result, fatal_patterns, watch)
+
+    # the translator waits for its admission if a controller is in use, see modfmu.scheduler
+    with scheduler.admission():
+        # Run command
+        staTim = time.monotonic()
+        try:
+            with open(result.stdout_log, 'wb') as std_out, open(result.stderr_log, 'wb') as std_err:
+                pro = subprocess.Popen(args=cmd,
+                                       stdout=std_out,
+                                       stderr=std_err,
+                                       shell=False,
+                                       cwd=directory,
+                                       **_popen_process_group_kwargs())
+        except OSError as e:
+            print(("Execution of ", cmd, " failed:", e))
+            return result
+        spawned = time.monotonic()
+        profiling.record('process_spawn', 'run_mos', spawned - staTim, script=mosFile)
+
+        try:
+            # wake up once per second to update the progress bar, and regularly to look for fatal errors
+            steps = [1.] if timeout > 0 and showProgressBar else []
+            if watcher is not None:
+                steps.append(_fatal_poll_interval)
+            while True:
+                elapsedTime = time.monotonic() - staTim
+                if timeout > 0 and elapsedTime >= timeout:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+                if timeout > 0 and showProgressBar:
+                    print_progress_bar(elapsedTime / timeout)
+                if watcher is not None and watcher.poll():
+                    result.aborted = True
+                    _kill_process_group(pro)
+                    break
+                waits = steps + ([timeout - elapsedTime] if timeout > 0 else [])
+                try:
+                    pro.wait(timeout=min(waits) if waits else None)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+        except subprocess.TimeoutExpired:
+            result.timed_out = True
+            _kill_process_group(pro)
+        except BaseException:
+            # e.g. KeyboardInterrupt, do not leave the translator running
+            _kill_process_group(pro)
+            raise
+        finally:
+            # This output is needed because of the progress bar
+            if showProgressBar:
+                sys.stdout.write("\n")
+
+        result.returncode = pro.returncode
+        result.duration = time.monotonic() - staTim
+        if watcher is not None:
+            watcher.poll(final=True)
+            result.fatal_errors = watcher.matches
+        profiling.record('translator_runtime', 'run_mos', result.duration - (spawned - staTim), script=mosFile,
+                         returncode=result.returncode, timed_out=result.timed_out, aborted=result.aborted)
+        return result
+
+
+async def _kill_process_group_async(pro, grace=5.):
+    """ Same as :func:`_kill_process_group`, for a process started with ``asyncio.create_subprocess_exec``
+    """
+    import asyncio
+    import os
+    import signal
+    import sys
+    import time
+
+    if sys.platform == 'win32':
+        try:
+            pro.send_signal(signal.CTRL_BREAK_EVENT)
+        except OSError:
+            pass
+        try:
+            await asyncio.wait_for(pro.wait(), grace)
+        except asyncio.TimeoutError:
+            killer = await asyncio.create_subprocess_exec('taskkill', '/F', '/T', '/PID', str(pro.pid),
+                                                          stdout=asyncio.subprocess.DEVNULL,
+                                                          stderr=asyncio.subprocess.DEVNULL)
+            await killer.wait()
+            try:
+                pro.kill()
+            except ProcessLookupError:
+                pass
+            await pro.wait()
+        return
+
     try:
-        staTim = datetime.datetime.now()
-        #            self._reporter.writeOutput("Starting simulation in '" +
-        #                                        directory + "' at " +
-        #                                        str(staTim))
-        pro = subprocess.Popen(args=cmd,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE,
-                               shell=False,
-                               cwd=directory)
-        killedProcess = False
-        if timeout > 0:
-            while pro.poll() is None:
-                time.sleep(0.01)
-                elapsedTime = (datetime.datetime.now() - staTim).seconds
-
-                if elapsedTime > timeout:
-                    # First, terminate the process. Then, if it is still
-                    # running, kill the process
-
-                    if showProgressBar and not killedProcess:
-                        killedProcess = True
-                        # This output needed because of the progress bar
-                        sys.stdout.write("\n")
-
-                        pro.terminate()
-                    else:
+        os.killpg(pro.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+    deadline = time.monotonic() + grace
+    try:
+        await asyncio.wait_for(pro.wait(), grace)
+    except asyncio.TimeoutError:
+        pass
+    # the processes of the group ignoring SIGTERM, e.g. compilers, may outlive the translator
+    while _process_group_alive(pro.pid) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if _process_group_alive(pro.pid):
+        try:
+            os.killpg(pro.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    await pro.wait()
 
-                        pro.kill()
-                else:
-                    if showProgressBar:
-                        fractionComplete = float(elapsedTime) / float(timeout)
-                        print_progress_bar(fractionComplete)
 
+async def run_mos_async(mosFile, directory, modelica_exe='Dymola', timeout=60, showGUI=False, fatal_patterns=None, watch=()):
+    """Runs a model translation or simulation without blocking the event loop.
+
+    Same as :func:`run_mos`. The time out and the cancellation of the task both stop the whole process group
+    of the translator; a cancellation is then propagated to the caller.
+
+    :param mosFile: The Modelica *mos* file name, including extension
+    :param directory: working directory of the translator
+    :param modelica_exe: name of the translator executable
+    :param timeout: Time out in seconds. No time out if it is not positive.
+    :param showGUI: shows the window of the translator
+    :param fatal_patterns: patterns of the fatal errors stopping the translator, see :func:`run_mos`
+    :param watch: paths of other files in which fatal errors are looked for
+    :return: a :class:`ProcessResult`
+    :raises FileNotFoundError: if the translator executable is not on the PATH
+    """
+    import asyncio
+    import time
+
+    result = _mos_process_result(mosFile, directory, modelica_exe, showGUI)
+    watcher = _fatal_error_watcher(result, fatal_patterns, watch)
+
+    async with scheduler.admission():
+        staTim = time.monotonic()
+        try:
+            with open(result.stdout_log, 'wb') as std_out, open(result.stderr_log, 'wb') as std_err:
+                pro = await asyncio.create_subprocess_exec(*result.cmd,
+                                                           stdout=std_out,
+                                                           stderr=std_err,
+                                                           cwd=directory,
+                                                           **_popen_process_group_kwargs())
+        except OSError as e:
+            print(("Execution of ", result.cmd, " failed:", e))
+            return result
+        spawned = time.monotonic()
+        profiling.record('process_spawn', 'run_mos', spawned - staTim, script=mosFile)
+
+        try:
+            while True:
+                elapsedTime = time.monotonic() - staTim
+                if timeout > 0 and elapsedTime >= timeout:
+                    raise asyncio.TimeoutError()
+                if watcher is not None and watcher.poll():
+                    result.aborted = True
+                    await _kill_process_group_async(pro)
+                    break
+                waits = ([_fatal_poll_interval] if watcher is not None else []) + ([timeout - elapsedTime] if timeout > 0 else [])
+                try:
+                    await asyncio.wait_for(pro.wait(), min(waits) if waits else None)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            await _kill_process_group_async(pro)
+        except BaseException:
+            # e.g. asyncio.CancelledError, do not leave the translator running
+            await asyncio.shield(_kill_process_group_async(pro))
+            raise
+
+        result.returncode = pro.returncode
+        result.duration = time.monotonic() - staTim
+        if watcher is not None:
+            watcher.poll(final=True)
+            result.fatal_errors = watcher.matches
+        profiling.record('translator_runtime', 'run_mos', result.duration - (spawned - staTim), script=mosFile,
+                         returncode=result.returncode, timed_out=result.timed_out, aborted=result.aborted)
+        return result
+
+
+def _library_files(root):
+    """
+    List the files of a Modelica library that may change the result of a translation.
+
+    :param root: directory of the library
+    """
+    import os
+
+    files = list()
+    for r, dirs, fils in os.walk(root):
+        files.extend(os.path.join(r, f) for f in fils if f.endswith('.mo') or f == 'package.order')
+    return files
+
+
+def _package_translator(pck, model_file, report, fmu_dir_name='FMUs', fmu_name=None, modifier="", open_library=True,
+                        cache=None, source_files=None, output_directory=None):
+    """
+    Configure the translator of the model defined in ``model_file``.
+
+    :param pck: Package in which the model is defined
+    :param model_file: name of the modelica file of the model, relative to ``pck.path``
+    :param report: reporter shared by all the models of the package
+    :param open_library: if False, the library is expected to be already opened, e.g. by a batch translator
+    :param cache: :class:`modfmu.cache.FMUCache` in which FMUs are looked up and stored
+    :param source_files: files the model depends on. Defaults to all the files of the library.
+    :param output_directory: directory of the FMU. Defaults to ``pck.path/fmu_dir_name/<model name>``.
+    :return: the configured :class:`FMUTranslator`
+    """
+    import os
+    from modfmu.modelica import Package
+
+    report.writeOutput('found the following modelica model to be translated : {}'.format(model_file))
+    model_base = os.path.splitext(model_file)[0]  # name of the modelica file without extension
+    model = '.'.join([pck._modelica_name, model_base])  # name of the model in modelica
+    model_dir = output_directory or os.path.join(pck.path, fmu_dir_name, model_base)
+    fmutrans = FMUTranslator(model,
+                             translator='Dymola',
+                             fmu_name=fmu_name,
+                             modifier=modifier,
+                             output_directory=model_dir,
+                             package_path=[os.path.join(pck.adam, Package._package_file)] if open_library else list(),
+                             reporter=report)
+    if open_library:
+        fmutrans.addPreProcessingStatement(FMUTranslator._prestatements_fmu_dymola)
+    fmutrans.fmi_type = 'cs'
+    fmutrans.setFmiVersion(fmiVersion='2')
+    if cache is not None:
+        fmutrans.cache = cache
+        fmutrans.set_source_files(source_files if source_files is not None else _library_files(pck.adam))
+    return fmutrans
+
+
+def _import_translated(fmu_pck, fmutrans, report, import_lock=None, timeout=None, pool=None):
+    """
+    Import the FMU produced by ``fmutrans`` in ``fmu_pck``.
+
+    :param import_lock: lock serializing the imports when several translations run at once
+    :param timeout: time out of the importer, in seconds. Defaults to the one of :class:`FMUImport`.
+    :param pool: :class:`modfmu.pool.TranslatorPool` running the import, if any
+    :return: the :class:`TranslationResult` of ``fmutrans``, with its ``import_result`` set if it was imported
+    """
+    result = fmutrans.result
+    if result.success:
+        fmu_import = FMUImport(fmu_pck, fmutrans.fmu_path, reporter=report)
+        fmu_import.pool = pool
+        if timeout is not None:
+            fmu_import.timeout = timeout
+        if import_lock is None:
+            result.import_result = fmu_import.import_fmu()
         else:
-            pro.wait()
-        # This output is needed because of the progress bar
-        if showProgressBar and not killedProcess:
-            sys.stdout.write("\n")
+            with import_lock:
+                result.import_result = fmu_import.import_fmu()
+    else:
+        msg = 'Something went wrong. check Dymola log file for more details.'
+        report.writeWarning(msg)
+    return result
+
+
+def _batch_importer(fmu_pck, translators, report, timeouts=None, pool=None):
+    """
+    Configure the import of the FMUs produced by ``translators`` in ``fmu_pck`` within a single importer session.
 
-        if not killedProcess:
-            std_out = pro.stdout.read()
-            std_err = pro.stderr.read()
+    :param timeouts: time out of the import of the FMU of each translator, in seconds, or None for the default one
+    :return: the :class:`FMUBatchImport`, or None if no translation succeeded
+    """
+    translated = list()
+    for i, t in enumerate(translators):
+        if t.result.success:
+            translated.append(i)
+        else:
+            report.writeWarning('Something went wrong. check Dymola log file for more details.')
+    if not translated:
+        return None
+    batch = FMUBatchImport(fmu_pck, [translators[i].fmu_path for i in translated], reporter=report)
+    batch.pool = pool
+    if timeouts is not None:
+        batch.timeout = sum(timeouts[i] if timeouts[i] is not None else batch._fmu_timeout for i in translated)
+    return batch
+
+
+def _set_import_results(translators, import_results):
+    """ Gives to the translators whose translation succeeded the results of a :class:`FMUBatchImport`
+    """
+    for t, r in zip([t for t in translators if t.result.success], import_results):
+        t.result.import_result = r
+
+
+def _import_translated_batch(fmu_pck, translators, report, import_lock=None, timeouts=None, pool=None):
+    """
+    Import the FMUs produced by ``translators`` in ``fmu_pck`` within a single importer session.
+
+    :param import_lock: lock serializing the imports when several translations run at once
+    :param timeouts: time out of the import of the FMU of each translator, in seconds, or None for the default one
+    :param pool: :class:`modfmu.pool.TranslatorPool` running the imports, if any
+    :return: list of the :class:`TranslationResult` of ``translators``, with their ``import_result`` set if they were
+        imported
+    """
+    batch = _batch_importer(fmu_pck, translators, report, timeouts=timeouts, pool=pool)
+    if batch is not None:
+        if import_lock is None:
+            _set_import_results(translators, batch.import_fmus())
+        else:
+            with import_lock:
+                _set_import_results(translators, batch.import_fmus())
+    return [t.result for t in translators]
+
+
+def _translate_and_import(pck, fmu_pck, model_file, report, fmu_dir_name='FMUs', fmu_name=None, modifier="", import_lock=None,
+                          cache=None, source_files=None):
+    """
+    Translate the model defined in ``model_file`` and import the resulting FMU in ``fmu_pck``.
 
-    except OSError as e:
-        print(("Execution of ", cmd, " failed:", e))
+    :return: the :class:`TranslationResult` of the model
+    """
+    fmutrans = _package_translator(pck, model_file, report, fmu_dir_name=fmu_dir_name, fmu_name=fmu_name, modifier=modifier,
+                                   cache=cache, source_files=source_files)
+    fmutrans.translate_fmu()
+    return _import_translated(fmu_pck, fmutrans, report, import_lock=import_lock)
 
 
-def translate_model(pck, model, fmu_name=None, fmu_dir_name='FMUs', report=None, modifier=""):
+def translate_model(pck, model, fmu_name=None, fmu_dir_name='FMUs', report=None, modifier="", cache=None):
     import os
-    import buildingspy.io.reporter as rp
+    from modfmu.reporter import Reporter
     from modfmu.modelica import Package
 
-    if not isinstance(report, rp.Reporter):
+    with profiling.build('translate_model', package=pck._modelica_name, model=model):
+        if not _is_reporter(report):
+            log_fil_nam = os.path.join(pck.path, "package_fmu_translation.log")
+            report = Reporter(log_fil_nam)
+            report.writeOutput('Initialisation of the log file')
+            report.writeOutput('Creation of the FMUs sub package for translation and import of the FMUs')
+
+        with profiling.phase('package_scan', 'translate_model'):
+            pck.add_subpackage(fmu_dir_name, order='first')
+            fmu_dir = os.path.join(pck.path, fmu_dir_name)
+            fmu_pck = Package(fmu_dir)
+
+        if os.path.isfile(os.path.join(pck.path, model)) and model.endswith('.mo'):
+            return _translate_and_import(pck, fmu_pck, model, report, fmu_dir_name=fmu_dir_name, fmu_name=fmu_name, modifier=modifier,
+                                         cache=cache)
+        else:
+            report.writeWarning('{} is not a modelica model'.format(model))
+
+
+def translate_variants(pck, model, variants, fmu_dir_name='FMUs', report=None, cache=None, rewrite=True):
+    """
+    Translation of several variants of a model, i.e. of the model with several modifiers.
+
+    The modifiers are split into a structural part and a parameter-only part (see
+    :func:`modfmu.variants.split_modifier`). The model is translated once per structural part. The FMU of each
+    variant is then obtained by rewriting the start values of its parameters in a copy of the translated FMU, and
+    the parameter values are saved in a ``<fmu name>.parameters.json`` file, to be applied at instantiation.
+    A variant setting a parameter that cannot be rewritten, e.g. because it was evaluated during the translation,
+    is translated on its own.
+
+    FMUs are written in ``pck.path/fmu_dir_name/<model name>/<fmu name>`` and imported in fmu_dir package.
+
+    Usage:
+        >>> translate_variants(pck, 'MyModel.mo', {'MyModel_k1': '(k=1)', 'MyModel_k2': '(k=2)'})
+
+    :param pck: Package in which the model is defined
+    :param model: name of the modelica file of the model, relative to ``pck.path``
+    :param variants: dictionary mapping the FMU name of each variant to its modifier
+    :param rewrite: if False, no FMU is written for the variants: each one is described by its parameter set only,
+        which applies to the FMU translated for its structural part
+    :type pck: Package
+    :type variants: dict
+    :return: dictionary mapping the FMU name of each variant to its :class:`TranslationResult`
+    """
+    import os
+    from modfmu.reporter import Reporter
+    from modfmu.modelica import Package
+    from modfmu.variants import group_variants, missing_parameters, write_variant, write_parameter_set, fmi_version
+
+    with profiling.build('translate_variants', package=pck._modelica_name, model=model):
+        if not _is_reporter(report):
+            log_fil_nam = os.path.join(pck.path, "package_fmu_translation.log")
+            report = Reporter(log_fil_nam)
+            report.writeOutput('Initialisation of the log file')
+
+        if not (os.path.isfile(os.path.join(pck.path, model)) and model.endswith('.mo')):
+            report.writeWarning('{} is not a modelica model'.format(model))
+            return dict()
+
+        pck.add_subpackage(fmu_dir_name, order='first')
+        fmu_pck = Package(os.path.join(pck.path, fmu_dir_name))
+        model_dir = os.path.join(pck.path, fmu_dir_name, os.path.splitext(model)[0])
+
+        def translate(name, modifier):
+            fmutrans = _package_translator(pck, model, report, fmu_dir_name=fmu_dir_name, fmu_name=name, modifier=modifier,
+                                           cache=cache, output_directory=os.path.join(model_dir, name))
+            return fmutrans, fmutrans.translate_fmu()
+
+        results = dict()
+        for structural, members in group_variants(variants):
+            report.writeOutput('translating {0}{1} for the variants {2}'.format(model, structural, ', '.join(n for n, p in members)))
+            # the first variant of the group is translated, the other ones are derived from its FMU
+            (first, first_parameters), others = members[0], members[1:]
+            base, base_result = translate(first, structural)
+            if not base_result.success:
+                for name, parameters in members:
+                    results[name] = TranslationResult(base_result.model_name, status=base_result.status,
+                                                      process=base_result.process, log=base_result.log)
+                continue
+
+            # the shared libraries of a FMI 1 FMU export functions prefixed by its model identifier: a copy of the
+            # FMU cannot be given a model identifier of its own
+            fmi1 = fmi_version(base.fmu_path).startswith('1')
+            for name, parameters in others + [(first, first_parameters)]:
+                model_name = base.model_path + variants[name]
+                missing = missing_parameters(base.fmu_path, parameters)
+                if missing:
+                    report.writeOutput('{0} translated on its own, as {1} cannot be set in the FMU'.format(
+                        name, ', '.join(missing)))
+                    results[name] = translate(name, variants[name])[1]
+                    continue
+                if fmi1 and rewrite and name != first:
+                    report.writeOutput('{0} translated on its own, as the model identifier of a FMI 1 FMU cannot be '
+                                       'changed'.format(name))
+                    results[name] = translate(name, variants[name])[1]
+                    continue
+
+                if name == first:
+                    # the FMU of the first variant is rewritten last, once the other ones were derived from it
+                    fmu_path = base.fmu_path
+                    result = TranslationResult(model_name, fmu_path, status=base_result.status, process=base_result.process,
+                                               log=base_result.log)
+                elif rewrite:
+                    directory = os.path.join(model_dir, name)
+                    if not os.path.exists(directory):
+                        os.makedirs(directory)
+                    fmu_path = os.path.join(directory, name + '.fmu')
+                    result = TranslationResult(model_name, fmu_path, status='variant')
+                else:
+                    fmu_path = base.fmu_path
+                    result = TranslationResult(model_name, fmu_path, status='variant')
+
+                if fmu_path != base.fmu_path or parameters and rewrite:
+                    write_variant(base.fmu_path, fmu_path, parameters, model_identifier=name if name != first else None)
+                    report.writeOutput('{0} written with the parameters {1}'.format(fmu_path, parameters))
+                result.parameter_set = os.path.join(os.path.dirname(fmu_path), name + '.parameters.json')
+                write_parameter_set(result.parameter_set, model_name, fmu_path, parameters)
+                results[name] = result
+
+            imported = set()
+            for name, parameters in members:
+                result = results[name]
+                if result.success and result.fmu_path not in imported:
+                    result.import_result = FMUImport(fmu_pck, result.fmu_path, reporter=report).import_fmu()
+                    imported.add(result.fmu_path)
+
+        return {name: results[name] for name in variants}
+
+
+def _package_model_files(pck, kinds=('model', 'block')):
+    """ Models stored in their own file in the package, in the order of package.order
+
+    :param kinds: kinds of the classes to translate
+    :return: tuple ``(model_files, others)`` where ``model_files`` are the names of the files of the models, relative
+        to ``pck.path``, and ``others`` the modelica names of the other classes of the package
+    """
+    import os
+    from modfmu.modelica import Package
+
+    index = pck.index
+    model_files = list()
+    others = list()
+    for name in index.children(pck._modelica_name):
+        m = os.path.relpath(index.class_file(name), pck.path)
+        # classes defined in package.mo are not translated: the name of a model is the one of its file
+        if index.class_kind(name) in kinds and not index.is_partial(name) and m.endswith('.mo') \
+                and os.path.dirname(m) == '' and m != Package._package_file:
+            model_files.append(m)
+        else:
+            others.append(name)
+    return model_files, others
+
+
+class _PackageBuild(object):
+    """Translation and import of the models of a package, shared by :func:`translate_package`
+    and :func:`translate_package_async`.
+    """
+    _model_kinds = ('model', 'block')
+
+    def __init__(self, pck, fmu_dir_name='FMUs', jobs=1, batch_size=None, cache=None, incremental=False, history=True,
+                 pool=None, repack=None):
+        import os
+        from modfmu.history import BuildHistory
+        from modfmu.reporter import QueuedReporter
+
+        if jobs < 1:
+            raise ValueError('jobs must be a positive integer. Got {} instead'.format(jobs))
+        if batch_size is not None and batch_size < 1:
+            raise ValueError('batch_size must be a positive integer. Got {} instead'.format(batch_size))
+
+        self.pck = pck
+        self.fmu_dir_name = fmu_dir_name
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.cache = cache
+        self.incremental = incremental
+        self.pool = pool
+        self.repack = repack
+        if history is True:
+            history = BuildHistory(os.path.join(pck.path, fmu_dir_name))
+        self.history = history or None
+        self.timeouts = dict()  # modelica name -> time out of the translation of the model
+        self.stopped = None  # line of the error that stopped the build, see check_session_errors
+
         log_fil_nam = os.path.join(pck.path, "package_fmu_translation.log")
-        report = rp.Reporter(log_fil_nam)
-        report.writeOutput('Initialisation of the log file')
-        report.writeOutput('Creation of the FMUs sub package for translation and import of the FMUs')
-
-    pck.add_subpackage(fmu_dir_name, order='first')
-    fmu_dir = os.path.join(pck.path, fmu_dir_name)
-    fmu_pck = Package(fmu_dir)
-
-    if os.path.isfile(os.path.join(pck.path, model)) and model.endswith('.mo'):
-        report.writeOutput('found the following modelica model to be translated : {}'.format(model))
-        model_base = os.path.splitext(model)[0]  # name of the modelica file without extension
-        model = '.'.join([pck._modelica_name, model_base])  # name of the model in modelica
-        model_dir = os.path.join(pck.path, 'FMUs', model_base)
-        fmutrans = FMUTranslator(model,
-                                 translator='Dymola',
-                                 fmu_name=fmu_name,
-                                 modifier=modifier,
-                                 output_directory=model_dir,
-                                 package_path=[os.path.join(pck.adam, Package._package_file)],
-                                 reporter=report)
-        fmutrans.addPreProcessingStatement(FMUTranslator._prestatements_fmu_dymola)
-        fmutrans.fmi_type = 'cs'
-        fmutrans.setFmiVersion(fmiVersion='2')
-        fmutrans.translate_fmu()
+        # the translations running at once do not wait for each other to write the log, started anew by each build
+        self.report = QueuedReporter(log_fil_nam, reset=True)
+        self.report.writeOutput('Initialisation of the log file')
+        self.report.writeOutput('Creation of the FMUs sub package for translation and import of the FMUs')
+        with profiling.phase('package_scan', 'translate_package'):
+            self._scan()
+
+    def _scan(self):
+        """ Lists the models to translate, and the files they depend on
+        """
+        import os
+        from modfmu.dependencies import DependencyGraph, BuildState
+        from modfmu.modelica import Package
+
+        pck = self.pck
+        fmu_dir_name = self.fmu_dir_name
+        cache = self.cache
+        incremental = self.incremental
+        batch_size = self.batch_size
+        pck.add_subpackage(fmu_dir_name, order='first')
+        fmu_dir = os.path.join(pck.path, fmu_dir_name)
+        self.fmu_pck = Package(fmu_dir)  # modelica package for fmus export and import
+
+        model_files, others = _package_model_files(pck, self._model_kinds)
+        for name in others:
+            self.report.writeWarning('{} is not a modelica model'.format(name))
+
+        self.results = dict.fromkeys(self.model_name(m) for m in model_files)
+
+        self.source_files = dict()
+        if cache is not None or incremental:
+            graph = DependencyGraph.from_package(pck)
+            self.source_files = {m: graph.closure(os.path.join(pck.path, m)) for m in model_files}
+
+        if incremental:
+            self.state = BuildState(fmu_dir)
+            self.digests = {m: graph.closure_digest(os.path.join(pck.path, m)) for m in model_files}
+            outdated = list()
+            for m in model_files:
+                if self.state.is_up_to_date(self.model_name(m), self.digests[m]):
+                    self.report.writeOutput('{} is up to date'.format(self.model_name(m)))
+                    self.results[self.model_name(m)] = TranslationResult(self.model_name(m), self.state.fmu_path(self.model_name(m)),
+                                                                         status='up-to-date')
+                else:
+                    outdated.append(m)
+            model_files = outdated
+
+        if self.history is not None:
+            # the longest translations start first, so that the build does not end waiting for one of them
+            names = {self.model_name(m): m for m in model_files}
+            model_files = [names[n] for n in self.history.longest_first(list(names))]
+            self.timeouts = {n: self.history.timeout(n) for n in names}
+
+        # models translated by each translator session
+        if batch_size is None:
+            self.tasks = [[m] for m in model_files]
+        else:
+            self.tasks = [model_files[i:i + batch_size] for i in range(0, len(model_files), batch_size)]
 
-        if os.path.exists(model_dir) and os.path.exists(fmutrans.fmu_path):
-            fmu_import = FMUImport(fmu_pck, fmutrans.fmu_path, reporter=report)
-            fmu_import.import_fmu()
+    def model_name(self, model_file):
+        import os
+        return '.'.join([self.pck._modelica_name, os.path.splitext(model_file)[0]])
+
+    def translator(self, task):
+        """ :class:`FMUTranslator` of a single model, or :class:`FMUBatchTranslator` of a group of models
+        """
+        import os
+        from modfmu.modelica import Package
+
+        if self.batch_size is None:
+            fmutrans = _package_translator(self.pck, task[0], self.report, fmu_dir_name=self.fmu_dir_name, cache=self.cache,
+                                           source_files=self.source_files.get(task[0]))
+            fmutrans.timeout = self.timeouts.get(fmutrans.model_path, fmutrans.timeout)
+            fmutrans.pool = self.pool
+            fmutrans.repack = self.repack
+            return fmutrans
+
+        translators = [_package_translator(self.pck, m, self.report, fmu_dir_name=self.fmu_dir_name, open_library=False,
+                                           cache=self.cache, source_files=self.source_files.get(m)) for m in task]
+        for t in translators:
+            t.timeout = self.timeouts.get(t.model_path, t.timeout)
+            t.repack = self.repack
+        batch = FMUBatchTranslator(translators, translator='Dymola', output_directory=os.path.join(self.pck.path, self.fmu_dir_name),
+                                   package_path=[os.path.join(self.pck.adam, Package._package_file)], reporter=self.report,
+                                   script_name='_translate_batch_{}.mos'.format(translators[0].fmu_name))
+        batch.addPreProcessingStatement(FMUTranslator._prestatements_fmu_dymola)
+        batch.pool = self.pool
+        return batch
+
+    def run(self, task, import_lock):
+        """ Translates the models of a task and imports their FMU
+
+        :return: list of the :class:`TranslationResult` of the models
+        """
+        if self.stopped is not None:
+            return self.aborted(task)
+        trans = self.translator(task)
+        if isinstance(trans, FMUBatchTranslator):
+            trans.translate_fmus()
+            translators = trans.translators
         else:
-            msg = 'Something went wrong. check Dymola log file for more details.'
-            report.writeWarning(msg)
+            trans.translate_fmu()
+            translators = [trans]
+        self.check_session_errors(t.result for t in translators)
+        if self.stopped is None and len(translators) > 1:
+            # the FMUs of a batch are imported within a single importer session too
+            results = _import_translated_batch(self.fmu_pck, translators, self.report, import_lock=import_lock,
+                                               timeouts=[self.import_timeout(t) for t in translators], pool=self.pool)
+            self.check_session_errors(r.import_result for r in results)
+            return results
+        results = list()
+        for t in translators:
+            if self.stopped is None:
+                _import_translated(self.fmu_pck, t, self.report, import_lock=import_lock, timeout=self.import_timeout(t),
+                                   pool=self.pool)
+                self.check_session_errors([t.result.import_result])
+            results.append(t.result)
+        return results
+
+    def aborted(self, task):
+        """ Results of the models of a task that is not run, as the build was stopped
+        """
+        return [TranslationResult(self.model_name(m), status='aborted') for m in task]
 
-    else:
-        report.writeWarning('{} is not a modelica model'.format(model))
+    def check_session_errors(self, results):
+        """ Stops the build if a translator met an error that fails every translation, e.g. a license failure:
+        the tasks not started yet are not run.
+
+        :param results: :class:`TranslationResult` or :class:`ImportResult` of the last runs, or None
+        """
+        for result in results:
+            process = result.process if result is not None else None
+            for kind, line in process.fatal_errors if process is not None else list():
+                if kind in session_fatal_kinds and self.stopped is None:
+                    self.stopped = line
+                    self.report.writeError('Build of {0} stopped, as the next translations would fail too: {1}'.format(
+                        self.pck._modelica_name, line))
+
+    def import_timeout(self, fmutrans):
+        """ Time out of the import of the FMU of a translator, or None for the default one
+        """
+        return self.history.timeout(fmutrans.model_path, kind='import') if self.history is not None else None
+
+    async def run_async(self, task, import_lock):
+        """ Same as :meth:`run`, without blocking the event loop
+
+        :param import_lock: an ``asyncio.Lock``
+        """
+        if self.stopped is not None:
+            return self.aborted(task)
+        trans = self.translator(task)
+        if isinstance(trans, FMUBatchTranslator):
+            await trans.translate_fmus_async()
+            translators = trans.translators
+        else:
+            await trans.translate_fmu_async()
+            translators = [trans]
+        self.check_session_errors(t.result for t in translators)
+        if self.stopped is None and len(translators) > 1:
+            batch = _batch_importer(self.fmu_pck, translators, self.report,
+                                    timeouts=[self.import_timeout(t) for t in translators], pool=self.pool)
+            if batch is not None:
+                async with import_lock:
+                    _set_import_results(translators, await batch.import_fmus_async())
+            self.check_session_errors(t.result.import_result for t in translators)
+            return [t.result for t in translators]
+
+        results = list()
+        for t in translators:
+            if self.stopped is not None:
+                pass
+            elif t.result.success:
+                fmu_import = FMUImport(self.fmu_pck, t.fmu_path, reporter=self.report)
+                fmu_import.timeout = self.import_timeout(t) or fmu_import.timeout
+                fmu_import.pool = self.pool
+                async with import_lock:
+                    t.result.import_result = await fmu_import.import_fmu_async()
+                self.check_session_errors([t.result.import_result])
+            else:
+                self.report.writeWarning('Something went wrong. check Dymola log file for more details.')
+            results.append(t.result)
+        return results
+
+    def finish(self, task_results):
+        """ Records the outcome of the tasks
 
+        :param task_results: list of the results of :meth:`run` for each task
+        :return: dictionary mapping the modelica name of each model to its :class:`TranslationResult`
+        """
+        if self.cache is not None:
+            self.report.writeOutput('FMU cache statistics : {}'.format(self.cache.stats))
+            self.cache.save_stats()
+
+        for task, results in zip(self.tasks, task_results):
+            for m, result in zip(task, results):
+                self.results[self.model_name(m)] = result
+                if self.incremental:
+                    self.state.update(self.model_name(m), self.digests[m], result.fmu_path if result.success else None)
+        if self.incremental:
+            self.state.save()
+        if self.history is not None:
+            self._record_history(task_results)
+
+        return self.results
+
+    def close(self):
+        """ Writes the messages of the build left in the queue of its reporter
+        """
+        self.report.close()
 
-def translate_package(pck, fmu_dir_name='FMUs'):
+    def _record_history(self, task_results):
+        """ Records the duration of the translations and imports that were run
+        """
+        import collections
+
+        translations = list()
+        imports = list()
+        shared = collections.Counter(id(r.import_result.process) for results in task_results for r in results
+                                     if r.import_result is not None)
+        for task, results in zip(self.tasks, task_results):
+            names = [self.model_name(m) for m in task]
+            # the models of a task are translated within a single session, and share its duration in proportion of
+            # the times in their log. Models restored from the cache have no process.
+            session = [(name, result) for name, result in zip(names, results) if result.process is not None]
+            weights = [sum(r.log.times.values()) if r.log is not None else 0. for n, r in session]
+            if not all(weights):
+                weights = [1.] * len(session)
+            for (name, result), w in zip(session, weights):
+                translations.append((name, result.status, result.process.duration * w / sum(weights), self.timeouts.get(name)))
+
+            for name, result in zip(names, results):
+                process = result.import_result.process if result.import_result is not None else None
+                if process is not None:
+                    status = 'imported' if result.import_result.success else 'timeout' if process.timed_out else 'failed'
+                    # the FMUs of a batch import share the duration of its session
+                    imports.append((name, status, process.duration / shared[id(process)],
+                                    self.history.timeout(name, kind='import')))
+
+        self.history.record_many(translations, kind='translate')
+        self.history.record_many(imports, kind='import')
+
+
+def translate_package(pck, fmu_dir_name='FMUs', jobs=1, batch_size=None, cache=None, incremental=False, history=True,
+                      pool=None, repack=None):
     """
     Automated translation of all modelica models defined in a given package.
 
@@ -589,51 +2254,103 @@ def translate_package(pck, fmu_dir_name='FMUs'):
 
     for each fmu exported, it is automatically imported in fmu_dir package using FMUImport class.
 
+    With ``jobs`` greater than 1, up to ``jobs`` translations run at once, each one in its own sub folder.
+    The imports in fmu_dir package are still done one at a time, as they all modify the same package.
+    With ``jobs='auto'``, the number of translations running at once follows the free memory and the load of the
+    machine (see :class:`modfmu.scheduler.AdmissionController`).
+
+    With ``batch_size`` set, models are translated by groups of ``batch_size`` within a single translator
+    session (see :class:`FMUBatchTranslator`), so that the library is opened once per group instead of once
+    per model. Up to ``jobs`` groups are translated at once. The FMUs of a group are then imported within a single
+    importer session too (see :class:`FMUBatchImport`).
+
+    With a ``cache``, models whose sources and translation options did not change since they were stored in the
+    cache are restored from it instead of being translated.
+
+    With ``incremental`` set, only the models for which one of the files they depend on changed since their last
+    successful translation are translated and imported again (see :class:`modfmu.dependencies.DependencyGraph`).
+    The other ones keep their current FMU.
+
+    The duration and outcome of each translation and import are recorded in a :class:`modfmu.history.BuildHistory`
+    stored in fmu_dir, unless ``history`` is False. The models whose translations took the longest in the past are
+    translated first, and each translation and import gets a time out derived from the past durations of the model.
+
     :param pck : Package to be translated to FMU
     :param fmu_dir_name : name of the folder created in pck.path for FMUs 
+    :param jobs: maximum number of translations running at once, or ``'auto'``
+    :param batch_size: number of models translated within a single translator session
+    :param cache: cache of the translated FMUs
+    :param incremental: translate only the models whose dependencies changed since the last build
+    :param history: True to use the history of fmu_dir, a :class:`modfmu.history.BuildHistory`, or False
+    :param pool: :class:`modfmu.pool.TranslatorPool` running the translations and imports, instead of a new translator
+        process for each one. Its sessions should load the library of the package.
+    :param repack: :class:`modfmu.repack.RepackPolicy` stripping and recompressing each FMU once translated, or None
     :type fmu_dir_name: str
     :type pck: Package
+    :type jobs: int or str
+    :type batch_size: int
+    :type cache: modfmu.cache.FMUCache
+    :type incremental: bool
+    :return: dictionary mapping the modelica name of each model to its :class:`TranslationResult`.
+        Models are listed in the same order whatever the value of ``jobs``.
     """
 
-    import os
-    import buildingspy.io.reporter as rp
-    from modfmu.modelica import Package
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
 
-    log_fil_nam = os.path.join(pck.path, "package_fmu_translation.log")
-    report = rp.Reporter(log_fil_nam)
-    report.writeOutput('Initialisation of the log file')
-    report.writeOutput('Creation of the FMUs sub package for translation and import of the FMUs')
-    pck.add_subpackage(fmu_dir_name, order='first')
-    fmu_dir = os.path.join(pck.path, fmu_dir_name)
-    fmu_pck = Package(fmu_dir)  # modelica package for fmus export and import
-
-    for m in os.listdir(pck.path):
-        if os.path.isfile(os.path.join(pck.path, m)) and m.endswith('.mo'):
-            report.writeOutput('found the following modelica model to be translated : {}'.format(m))
-            model_base = os.path.splitext(m)[0]  # name of the modelica file without extension
-            model = '.'.join([pck._modelica_name, model_base])  # name of the model in modelica
-            model_dir = os.path.join(pck.path, 'FMUs', model_base)
-            fmutrans = FMUTranslator(model, translator='Dymola', output_directory=model_dir, package_path=[os.path.join(pck.adam, Package._package_file)], reporter=report)
-            fmutrans.addPreProcessingStatement(("  Advanced.AllowMultipleInstances = true;\n"
-                                                "  OutputCPUtime = false;\n"
-                                                "  Advanced.CompileFMU32 = false;\n"
-                                                "  Advanced.CompileFMU64 = true;\n"
-                                                "  Advanced.CompileWith64 = 0;\n"
-                                                "  Advanced.AllowStringParameters = true;\n"
-                                                "  Advanced.FMI.xmlIgnoreProtected = true;\n"
-                                                "  Advanced.FMI.xmlIgnoreLocal = true;\n"
-                                                "  Advanced.FMI.BlackBoxModelDescription = false;\n"
-                                                "  Advanced.FMI.CopyExternalResources = false;\n"))
-            fmutrans.fmi_type = 'cs'
-            fmutrans.setFmiVersion(fmiVersion='2')
-            fmutrans.translate_fmu()
-
-            if os.path.exists(model_dir) and os.path.exists(fmutrans.fmu_path):
-                fmu_import = FMUImport(fmu_pck, fmutrans.fmu_path, reporter=report)
-                fmu_import.import_fmu()
+    jobs, controller = scheduler.resolve_jobs(jobs)
+    with profiling.build('translate_package', package=pck._modelica_name), scheduler.use(controller):
+        build = _PackageBuild(pck, fmu_dir_name=fmu_dir_name, jobs=jobs, batch_size=batch_size, cache=cache, incremental=incremental,
+                              history=history, pool=pool, repack=repack)
+        import_lock = threading.Lock()
+        try:
+            if jobs == 1:
+                task_results = [build.run(t, import_lock) for t in build.tasks]
             else:
-                msg = 'Something went wrong. check Dymola log file for more details.'
-                report.writeWarning(msg)
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    # the worker threads report their timings with the labels of the build
+                    run = profiling.run_in_context(build.run)
+                    task_results = list(executor.map(lambda t: run(t, import_lock), build.tasks))
+            return build.finish(task_results)
+        finally:
+            build.close()
 
-        else:
-            report.writeWarning('{} is not a modelica model'.format(m))
+
+async def translate_package_async(pck, fmu_dir_name='FMUs', jobs=1, batch_size=None, cache=None, incremental=False,
+                                  history=True, pool=None, repack=None):
+    """
+    Same as :func:`translate_package`, without blocking the event loop.
+
+    Up to ``jobs`` translator processes are supervised by the event loop at once. Cancelling the task stops the
+    running translators and cancels the pending ones.
+
+    :return: dictionary mapping the modelica name of each model to its :class:`TranslationResult`
+    """
+    import asyncio
+
+    jobs, controller = scheduler.resolve_jobs(jobs)
+    with profiling.build('translate_package', package=pck._modelica_name), scheduler.use(controller):
+        build = _PackageBuild(pck, fmu_dir_name=fmu_dir_name, jobs=jobs, batch_size=batch_size, cache=cache, incremental=incremental,
+                              history=history, pool=pool, repack=repack)
+        import_lock = asyncio.Lock()
+        slots = asyncio.Semaphore(jobs)
+
+        async def run(task):
+            async with slots:
+                return await build.run_async(task, import_lock)
+
+        tasks = [asyncio.ensure_future(run(t)) for t in build.tasks]
+        try:
+            try:
+                task_results = await asyncio.gather(*tasks)
+            except BaseException:
+                # gather returns as soon as a task waiting for its slot is cancelled: the running translators are
+                # stopped before the cancellation is propagated
+                for t in tasks:
+                    t.cancel()
+                if tasks:
+                    await asyncio.wait(tasks)
+                raise
+            return build.finish(task_results)
+        finally:
+            build.close()
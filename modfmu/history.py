@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+History of the translations and imports of the models, used to plan the next builds.
+
+:func:`modfmu.fmu_translator.translate_package` records the duration and outcome of the translation and import of
+each model in a :class:`BuildHistory`. From it, the next builds start the longest translations first, so that a
+parallel build does not end waiting for a single large model, and give each model a time out derived from its
+past durations instead of a fixed one.
+
+Usage:
+    >>> history = BuildHistory('MyLib/FMUs')
+    >>> history.timeout('MyLib.MyModel')
+    >>> history.expected_duration('MyLib.MyModel')
+"""
+
+
+class BuildHistory(object):
+    """Durations and outcomes of the last runs of each model, stored in a SQLite file.
+
+    The time out of a model is ``timeout_factor`` times its longest recent successful run, within
+    ``[min_timeout, max_timeout]``. A model whose runs all timed out gets twice its last time out. A model without
+    history gets ``default_timeout``.
+
+    Thread safe.
+    """
+    _history_file = 'build_history.sqlite'
+    # statuses of the runs that went to their end, whose duration is the cost of the model
+    _completed = ('translated', 'imported')
+
+    def __init__(self, directory, default_timeout=100., min_timeout=30., max_timeout=3600., timeout_factor=3.,
+                 keep=10):
+        """
+
+        :param directory: directory where the history file is stored, e.g. the FMU package
+        :param default_timeout: time out of a model without history, in seconds
+        :param min_timeout: minimum time out derived from the history, in seconds
+        :param max_timeout: maximum time out derived from the history, in seconds
+        :param timeout_factor: ratio between the time out of a model and its longest recent run
+        :param keep: number of runs kept per model and kind of run
+        """
+        import os
+        import sqlite3
+        import threading
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(directory, self._history_file)
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self._keep = keep
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30., check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS runs (model TEXT NOT NULL, kind TEXT NOT NULL, status TEXT NOT NULL, '
+                         'duration REAL NOT NULL, timeout REAL, time REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS runs_model ON runs (model, kind, time)')
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def runs(self, model, kind='translate'):
+        """ Last runs of a model, the most recent first
+
+        :param model: modelica name of the model
+        :param kind: ``'translate'`` or ``'import'``
+        :return: list of ``(status, duration, timeout)`` tuples
+        """
+        with self._lock:
+            return self._db.execute('SELECT status, duration, timeout FROM runs WHERE model = ? AND kind = ? '
+                                    'ORDER BY time DESC LIMIT ?', (model, kind, self._keep)).fetchall()
+
+    def record(self, model, status, duration, timeout=None, kind='translate'):
+        """ Records a run of a model, and forgets its oldest runs beyond ``keep``
+
+        :param model: modelica name of the model
+        :param status: status of the run: the status of a :class:`modfmu.fmu_translator.TranslationResult`, or
+            ``'imported'``, ``'failed'`` or ``'timeout'`` for an import
+        :param duration: duration of the run, in seconds
+        :param timeout: time out of the run, in seconds
+        :param kind: ``'translate'`` or ``'import'``
+        """
+        self.record_many([(model, status, duration, timeout)], kind=kind)
+
+    def record_many(self, runs, kind='translate'):
+        """ Records several runs in a single transaction
+
+        :param runs: iterable of ``(model, status, duration, timeout)`` tuples
+        """
+        import time
+
+        now = time.time()
+        runs = list(runs)
+        with self._lock, self._db:
+            self._db.executemany('INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)',
+                                 [(m, kind, s, d, t, now) for m, s, d, t in runs])
+            self._db.executemany('DELETE FROM runs WHERE model = ? AND kind = ? AND rowid NOT IN '
+                                 '(SELECT rowid FROM runs WHERE model = ? AND kind = ? ORDER BY time DESC LIMIT ?)',
+                                 [(m, kind, m, kind, self._keep) for m in set(r[0] for r in runs)])
+
+    def expected_duration(self, model, kind='translate'):
+        """ Mean duration of the recent successful runs of a model, its last time out if they all timed out,
+        or None if it has no history
+        """
+        runs = self.runs(model, kind)
+        durations = [d for s, d, t in runs if s in self._completed]
+        if durations:
+            return sum(durations) / len(durations)
+        timeouts = [t for s, d, t in runs if s == 'timeout' and t]
+        return timeouts[0] if timeouts else None
+
+    def timeout(self, model, kind='translate'):
+        """ Time out of the next run of a model, in seconds
+        """
+        runs = self.runs(model, kind)
+        durations = [d for s, d, t in runs if s in self._completed]
+        if durations:
+            return min(self.max_timeout, max(self.min_timeout, self.timeout_factor * max(durations)))
+        timeouts = [t for s, d, t in runs if s == 'timeout' and t]
+        if timeouts:
+            return min(self.max_timeout, 2 * timeouts[0])
+        return self.default_timeout
+
+    def longest_first(self, models, kind='translate'):
+        """ Sorts models by decreasing expected duration. Models without history come first, in their original
+        order, as they may be the longest ones.
+
+        :param models: modelica names of the models
+        :return: sorted list of the models
+        """
+        expected = {m: self.expected_duration(m, kind) for m in models}
+        return sorted(models, key=lambda m: (expected[m] is not None, -(expected[m] or 0.)))
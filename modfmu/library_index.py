@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent index of the classes of a Modelica library.
+
+The index is stored in a SQLite file next to the root ``package.mo`` of the library. It maps the fully qualified
+name of each class to its file, with its kind (model, block, package, ...) and its position in ``package.order``.
+It is refreshed incrementally: only the directories whose modification time changed are listed again, and only
+the files whose modification time or size changed are parsed again. The index also keeps what the dependency graph
+(:mod:`modfmu.dependencies`) needs from each file, parsed again once the file changed.
+"""
+
+from modfmu.modelica_parser import class_definitions, read_code
+
+
+def parse_classes(path):
+    """ Lists the classes defined in a Modelica file.
+
+    :param path: path of the ``.mo`` file
+    :return: list of tuples ``(name, kind, partial)``, the first one being the main class of the file
+    """
+    return class_definitions(read_code(path))
+
+
+class LibraryIndex(object):
+    """Index of the classes of a Modelica library, persisted in the library directory.
+
+    Indexes are shared: :meth:`open` returns the same instance for a given library, so that every
+    :class:`modfmu.modelica.Package` of the library uses it.
+
+    Usage:
+        >>> index = LibraryIndex.open('/path/to/MyLib')
+        >>> index.class_file('MyLib.Sub.A')
+        >>> index.children('MyLib.Sub', kinds=('model', 'block'))
+    """
+    _index_file = '.modfmu_index.sqlite'
+    _package_file = 'package.mo'
+    _package_order = 'package.order'
+    _version = 2
+    # minimum time between two refreshes done by open(), in seconds
+    refresh_interval = 1.
+
+    _indexes = dict()  # root directory -> LibraryIndex
+
+    def __init__(self, root):
+        """
+
+        :param root: directory of the library, i.e. of its root ``package.mo``
+        """
+        import os
+        import threading
+
+        self._root = os.path.realpath(root)
+        self._name = os.path.basename(self._root)
+        self._path = os.path.join(self._root, self._index_file)
+        self._lock = threading.RLock()
+        self._refreshed = None
+        self._dirs = dict()  # directory -> [mtime_ns, package.order mtime_ns, is_package]
+        self._files = dict()  # file -> [mtime_ns, size]
+        self._classes = dict()  # class name -> [file, kind, partial, position]
+        self._parsed = dict()  # file -> [mtime_ns, size, JSON of the result of parse_modelica_file]
+        self._load()
+
+    @classmethod
+    def open(cls, root):
+        """ Index of a library, refreshed if it was not refreshed during the last ``refresh_interval`` seconds.
+
+        :param root: directory of the library
+        """
+        import os
+        import time
+
+        root = os.path.realpath(root)
+        index = cls._indexes.get(root)
+        if index is None:
+            index = cls._indexes.setdefault(root, cls(root))
+        with index._lock:
+            if index._refreshed is None or time.monotonic() - index._refreshed >= cls.refresh_interval:
+                index.refresh()
+        return index
+
+    @classmethod
+    def containing(cls, path):
+        """ Already opened index of the library a package directory belongs to, or None.
+
+        :param path: directory of a package
+        """
+        import os
+
+        path = os.path.realpath(path)
+        for root, index in list(cls._indexes.items()):
+            if path == root or path.startswith(root + os.path.sep):
+                state = index._dirs.get(index._relpath(path))
+                if state is not None and state[2]:
+                    return index
+        return None
+
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def name(self):
+        """ Modelica name of the library
+        """
+        return self._name
+
+    def _relpath(self, path):
+        import os
+
+        rel = os.path.relpath(path, self._root)
+        return '' if rel == os.curdir else rel.replace(os.path.sep, '/')
+
+    def _abspath(self, rel):
+        import os
+        return self._root + os.path.sep + rel.replace('/', os.path.sep) if rel else self._root
+
+    def _package_name(self, rel_dir):
+        return '.'.join([self._name] + rel_dir.split('/')) if rel_dir else self._name
+
+    def _connect(self):
+        import sqlite3
+
+        conn = sqlite3.connect(self._path, timeout=30)
+        # the index can always be rebuilt from the library: no journal file, so that writing the index does not
+        # change the modification time of the library directory
+        conn.execute('PRAGMA journal_mode=MEMORY')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER, order_mtime INTEGER, '
+                     'is_package INTEGER)')
+        conn.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER)')
+        conn.execute('CREATE TABLE IF NOT EXISTS classes (name TEXT PRIMARY KEY, file TEXT, kind TEXT, partial INTEGER, '
+                     'position INTEGER)')
+        conn.execute('CREATE TABLE IF NOT EXISTS parsed (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, data TEXT)')
+        return conn
+
+    def _load(self):
+        """ Reads the index file. An index written by another version, or unreadable, is rebuilt.
+        """
+        import os
+        import sqlite3
+
+        try:
+            conn = self._connect()
+            try:
+                version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+                if version is None or int(version[0]) != self._version:
+                    with conn:
+                        for table in ('meta', 'dirs', 'files', 'classes', 'parsed'):
+                            conn.execute('DELETE FROM {}'.format(table))
+                        conn.execute("INSERT INTO meta VALUES ('version', ?)", (str(self._version),))
+                    return
+                self._dirs = {r[0]: list(r[1:]) for r in conn.execute('SELECT * FROM dirs')}
+                self._files = {r[0]: list(r[1:]) for r in conn.execute('SELECT * FROM files')}
+                self._classes = {r[0]: list(r[1:]) for r in conn.execute('SELECT * FROM classes')}
+                self._parsed = {r[0]: list(r[1:]) for r in conn.execute('SELECT * FROM parsed')}
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError:
+            self._dirs, self._files, self._classes, self._parsed = dict(), dict(), dict(), dict()
+            os.remove(self._path)
+            self._connect().close()
+
+    def refresh(self):
+        """ Updates the index with the changes made to the library since the last refresh.
+
+        :return: number of files parsed again
+        """
+        import os
+        import time
+
+        with self._lock:
+            # known content of each package directory
+            known_dirs = dict()
+            known_files = dict()
+            for d in self._dirs:
+                if d:
+                    known_dirs.setdefault(d.rpartition('/')[0], list()).append(d)
+            for f in self._files:
+                known_files.setdefault(f.rpartition('/')[0], list()).append(f)
+
+            dirs = dict()
+            files = dict()
+            changed_files = list()
+            changed_orders = set()
+            stack = ['']
+            while stack:
+                rel = stack.pop()
+                path = self._abspath(rel)
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                known = self._dirs.get(rel)
+                unchanged = known is not None and known[0] == mtime
+                if unchanged and rel:
+                    is_package = known[2]
+                else:
+                    is_package = os.path.isfile(os.path.join(path, self._package_file))
+                if not is_package:
+                    # directories that are not packages, e.g. resources, are not indexed
+                    dirs[rel] = [mtime, None, False]
+                    continue
+
+                if unchanged and known[2]:
+                    sub_dirs = known_dirs.get(rel, list())
+                    names = known_files.get(rel, list())
+                else:
+                    sub_dirs, names = list(), list()
+                    for e in os.scandir(path):
+                        if e.is_dir():
+                            sub_dirs.append('/'.join([rel, e.name]) if rel else e.name)
+                        elif e.name.endswith('.mo'):
+                            names.append('/'.join([rel, e.name]) if rel else e.name)
+
+                try:
+                    order_mtime = os.stat(os.path.join(path, self._package_order)).st_mtime_ns
+                except OSError:
+                    order_mtime = None
+                if not unchanged or known[1] != order_mtime:
+                    changed_orders.add(rel)
+                dirs[rel] = [mtime, order_mtime, True]
+                stack.extend(sub_dirs)
+
+                prefix = path + os.path.sep
+                for f in names:
+                    try:
+                        st = os.stat(prefix + f.rpartition('/')[2])
+                    except OSError:
+                        continue
+                    files[f] = [st.st_mtime_ns, st.st_size]
+                    if self._files.get(f) != files[f]:
+                        changed_files.append(f)
+
+            if changed_files or dirs != self._dirs or files.keys() != self._files.keys():
+                self._update(dirs, files, changed_files, changed_orders)
+            self._refreshed = time.monotonic()
+            return len(changed_files)
+
+    def _file_class_name(self, rel_file):
+        """ Name of the main class of a file, given by its location in the library
+        """
+        rel_dir, _, name = rel_file.rpartition('/')
+        if name == self._package_file:
+            return self._package_name(rel_dir)
+        return '.'.join([self._package_name(rel_dir), name[:-len('.mo')]])
+
+    def _update(self, dirs, files, changed_files, changed_orders):
+        """ Applies the changes found by :meth:`refresh` and writes them to the index file
+        """
+        import os
+
+        previous = (self._dirs, self._files, {n: list(c) for n, c in self._classes.items()})
+
+        stale = set(self._files) - set(files) | set(changed_files)
+        for n in [n for n, c in self._classes.items() if c[0] in stale]:
+            del self._classes[n]
+
+        for f in changed_files:
+            main = self._file_class_name(f)
+            try:
+                classes = parse_classes(self._abspath(f))
+            except OSError:
+                continue
+            kind, partial = (classes[0][1], classes[0][2]) if classes else (None, False)
+            self._classes[main] = [f, kind, partial, None]
+            for name, kind, partial in classes[1:]:
+                # a class stored in its own file wins over a nested class of the same name
+                existing = self._classes.get('.'.join([main, name]))
+                if existing is None or existing[0] == f:
+                    self._classes['.'.join([main, name])] = [f, kind, partial, None]
+
+        # positions in package.order, for the packages whose order or content changed
+        positions = dict()
+        for rel in changed_orders | set(f.rpartition('/')[0] for f in changed_files):
+            if rel not in dirs or not dirs[rel][2]:
+                continue
+            try:
+                with open(os.path.join(self._abspath(rel), self._package_order), 'r') as fo:
+                    order = [l.strip() for l in fo if l.strip()]
+            except OSError:
+                order = list()
+            positions[self._package_name(rel)] = {n: i for i, n in enumerate(order)}
+        for n, c in self._classes.items():
+            parent, _, short = n.rpartition('.')
+            if parent in positions:
+                c[3] = positions[parent].get(short)
+
+        self._dirs = dirs
+        self._files = files
+        self._save(previous)
+
+    def _save(self, previous):
+        """ Writes the rows that changed since ``previous``, the tuple of the former dirs, files and classes
+        """
+        import sqlite3
+
+        try:
+            conn = self._connect()
+        except sqlite3.DatabaseError:
+            return
+        try:
+            with conn:
+                for table, old, new in zip(('dirs', 'files', 'classes'), previous, (self._dirs, self._files, self._classes)):
+                    key = 'name' if table == 'classes' else 'path'
+                    conn.executemany('DELETE FROM {} WHERE {} = ?'.format(table, key), ((k,) for k in old if k not in new))
+                    rows = [(k,) + tuple(v) for k, v in new.items() if old.get(k) != v]
+                    if rows:
+                        conn.executemany('INSERT OR REPLACE INTO {} VALUES ({})'.format(table, ', '.join('?' * len(rows[0]))),
+                                         rows)
+        finally:
+            conn.close()
+
+    def parse_files(self, paths):
+        """ What the dependency graph needs from Modelica files, see :func:`modfmu.dependencies.parse_modelica_file`.
+
+        The results are kept in the index with the modification time and size of each file, so that a file is only
+        parsed again once it changed.
+
+        :param paths: paths of ``.mo`` files of the library
+        :return: dictionary mapping the real path of each file to the result of
+            :func:`modfmu.dependencies.parse_modelica_file`. Files that cannot be read are left out.
+        """
+        import json
+        import os
+        import sqlite3
+        from modfmu.dependencies import parse_modelica_file
+
+        results = dict()
+        rows = list()
+        with self._lock:
+            for path in paths:
+                path = os.path.realpath(path)
+                rel = self._relpath(path)
+                try:
+                    st = os.stat(path)
+                    cached = self._parsed.get(rel)
+                    if cached is not None and cached[:2] == [st.st_mtime_ns, st.st_size]:
+                        within, classes, (aliases, wildcards), names = json.loads(cached[2])
+                        results[path] = (within, classes, (aliases, wildcards), set(names))
+                        continue
+                    results[path] = parse_modelica_file(path)
+                except OSError:
+                    continue
+                within, classes, imports, names = results[path]
+                self._parsed[rel] = [st.st_mtime_ns, st.st_size, json.dumps([within, classes, imports, sorted(names)])]
+                rows.append((rel,) + tuple(self._parsed[rel]))
+
+            # the files removed from the library are forgotten
+            removed = [f for f in self._parsed if f not in self._files]
+            for f in removed:
+                del self._parsed[f]
+            if rows or removed:
+                try:
+                    conn = self._connect()
+                except sqlite3.DatabaseError:
+                    return results
+                try:
+                    with conn:
+                        conn.executemany('DELETE FROM parsed WHERE path = ?', ((f,) for f in removed))
+                        conn.executemany('INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)', rows)
+                finally:
+                    conn.close()
+        return results
+
+    def class_file(self, name):
+        """ File defining a class, or None if the class is not in the index
+
+        :param name: fully qualified Modelica name of the class
+        """
+        c = self._classes.get(name)
+        return self._abspath(c[0]) if c is not None else None
+
+    def class_kind(self, name):
+        """ Kind of a class ('model', 'block', 'package', 'expandable connector', ...), or None
+        """
+        c = self._classes.get(name)
+        return c[1] if c is not None else None
+
+    def is_partial(self, name):
+        c = self._classes.get(name)
+        return bool(c[2]) if c is not None else False
+
+    def class_name(self, path):
+        """ Fully qualified name of the class stored in a file, or of the package stored in a directory
+
+        :param path: path of a ``.mo`` file or of a package directory
+        :return: the name, or None if the path is not part of the library
+        """
+        import os
+
+        path = os.path.realpath(path)
+        rel = self._relpath(path)
+        if rel.startswith('..'):
+            return None
+        if rel in self._files:
+            return self._file_class_name(rel)
+        if rel in self._dirs and self._dirs[rel][2]:
+            return self._package_name(rel)
+        return None
+
+    def children(self, name, kinds=None):
+        """ Classes directly contained in a package, in the order of its ``package.order`` file.
+        Classes missing from ``package.order`` come last, in alphabetical order.
+
+        :param name: fully qualified name of the package
+        :param kinds: if given, only the classes of these kinds are listed
+        :return: list of fully qualified names
+        """
+        prefix = name + '.'
+        found = [(n, c) for n, c in self._classes.items()
+                 if n.startswith(prefix) and '.' not in n[len(prefix):] and (kinds is None or c[1] in kinds)]
+        found.sort(key=lambda nc: (nc[1][3] is None, nc[1][3] or 0, nc[0]))
+        return [n for n, c in found]
+
+    def classes(self, kinds=None):
+        """ Names of all the classes of the library
+
+        :param kinds: if given, only the classes of these kinds are listed
+        """
+        return sorted(n for n, c in self._classes.items() if kinds is None or c[1] in kinds)
+
+    def files(self):
+        """ Paths of all the ``.mo`` files of the library
+        """
+        return [self._abspath(f) for f in sorted(self._files)]
+
+    def package_directories(self, path):
+        """ Directories of the packages enclosing a package directory, the root of the library included
+
+        :param path: directory of a package of the library
+        """
+        import os
+
+        rel = self._relpath(os.path.realpath(path))
+        parents = set()
+        while rel:
+            rel = rel.rpartition('/')[0]
+            if rel in self._dirs and self._dirs[rel][2]:
+                parents.add(self._abspath(rel))
+        return parents
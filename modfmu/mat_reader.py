@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Reader of the result files written by Dymola (MATLAB v4 ``.mat`` files), e.g. by the FMUs translated with
+``FMUTranslator._store_result`` set.
+
+The file is memory-mapped: only the names and the ``dataInfo`` matrix are read when it is opened, and the values of
+a variable are read from disk when they are asked for, so that a few variables of a result of several GB are loaded
+without reading the whole file.
+
+Usage:
+    >>> with DymolaResult('dsres.mat') as res:
+    ...     res.values('heater.Q_flow', start=3600., stop=7200.)
+    ...     frame = res.to_dataframe(['heater.Q_flow', 'room.T'])
+
+A Dymola result file holds the matrices ``Aclass``, ``name``, ``description``, ``dataInfo``, ``data_1`` (values of
+the parameters at the start and at the end of the simulation) and ``data_2`` (trajectories of the variables, one row
+per time step). The column ``i`` of ``dataInfo`` gives the data matrix of the variable ``i`` and its signed,
+1-based, row in it: a negative row is a negated alias.
+"""
+
+# precisions of the MAT v4 format
+_precisions = {0: 'f8', 1: 'f4', 2: 'i4', 3: 'i2', 4: 'u2', 5: 'u1'}
+
+
+class DymolaResult(object):
+    """Memory-mapped Dymola result file.
+
+    The values are returned as NumPy arrays; :meth:`values` can also return a read-only view of the file, without
+    copying the values.
+    """
+
+    def __init__(self, path):
+        """
+
+        :param path: path of the ``.mat`` file
+        :raises ValueError: if the file is not a Dymola result file
+        """
+        import mmap
+        import numpy as np
+
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mm = np.frombuffer(self._mmap, dtype='u1')
+        self._matrices = self._read_headers()
+        for required in ('name', 'dataInfo'):
+            if required not in self._matrices:
+                raise ValueError('{0} is not a Dymola result file: no {1} matrix'.format(path, required))
+
+        aclass = self._strings('Aclass', transposed=False) if 'Aclass' in self._matrices else list()
+        self._transposed = len(aclass) > 3 and aclass[3] == 'binTrans'
+        if self._transposed and hasattr(mmap, 'MADV_RANDOM'):
+            # the values of a variable are spread over the whole file, one per time step: reading ahead would load
+            # the values of the other variables too
+            self._mmap.madvise(mmap.MADV_RANDOM)
+        self._names = self._strings('name')
+        self._index = {n: i for i, n in enumerate(self._names)}
+        info = self._matrix('dataInfo')
+        # (data matrix, signed row) of each variable. The abscissa (time), in matrix 0, is the first signal of data_2
+        self._info = np.array(info[:2, :].T if self._transposed else info[:, :2], dtype='i8')
+        self._info[self._info[:, 0] == 0, 0] = 2
+        self._data = dict()  # number of the data matrix -> (time steps x signals) view
+        self._time = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """ Releases the memory map. The views returned by :meth:`values` must not be used afterwards.
+        """
+        self._data = dict()
+        self._time = None
+        self._mm = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # views of the file are still in use: it is closed once they are released
+            pass
+
+    def _read_headers(self):
+        """ Position of each matrix of the file
+
+        :return: dictionary mapping the name of each matrix to ``(dtype, rows, columns, offset of its data)``
+        """
+        import numpy as np
+
+        matrices = dict()
+        offset = 0
+        size = len(self._mm)
+        while offset + 20 <= size:
+            header = np.frombuffer(self._mm, dtype='<i4', count=5, offset=offset)
+            if not 0 <= header[0] < 5000 or header[0] // 10 % 10 not in _precisions:
+                header = header.byteswap()
+            mopt, rows, columns, imaginary, name_length = (int(h) for h in header)
+            if not 0 <= mopt < 5000 or mopt // 1000 > 1 or mopt // 10 % 10 not in _precisions or rows < 0 or \
+                    columns < 0 or name_length <= 0:
+                raise ValueError('{0} is not a MATLAB v4 file: invalid header at byte {1}'.format(self.path, offset))
+            dtype = np.dtype(('>' if mopt // 1000 == 1 else '<') + _precisions[mopt // 10 % 10])
+            name = bytes(self._mm[offset + 20:offset + 20 + name_length]).rstrip(b'\0').decode('ascii', 'replace')
+            data = offset + 20 + name_length
+            matrices[name] = (dtype, rows, columns, data)
+            offset = data + rows * columns * dtype.itemsize * (2 if imaginary else 1)
+        if offset != size:
+            raise ValueError('{0} is truncated: the matrices end at byte {1}, the file at byte {2}'.format(
+                self.path, offset, size))
+        return matrices
+
+    def _matrix(self, name):
+        """ Matrix of the file as a (rows x columns) view of the memory map, without reading it
+        """
+        import numpy as np
+
+        dtype, rows, columns, offset = self._matrices[name]
+        # MATLAB stores the matrices column by column
+        return np.frombuffer(self._mm, dtype=dtype, count=rows * columns, offset=offset).reshape(columns, rows).T
+
+    def _strings(self, name, transposed=None):
+        """ Strings of a text matrix: its columns for the transposed layout, its rows otherwise
+        """
+        import numpy as np
+
+        if transposed is None:
+            transposed = self._transposed
+        chars = self._matrix(name)
+        chars = chars.T if transposed else chars
+        chars = np.ascontiguousarray(chars.astype('u1') if chars.dtype != np.dtype('u1') else chars)
+        if chars.shape[1] == 0:
+            return [''] * chars.shape[0]
+        strings = chars.view('S{}'.format(chars.shape[1])).ravel()
+        return [s.decode('latin-1').rstrip('\0 ') for s in strings]
+
+    def _data_matrix(self, number):
+        """ Data matrix ``data_<number>`` as a (time steps x signals) view
+        """
+        if number not in self._data:
+            matrix = self._matrix('data_{}'.format(number))
+            self._data[number] = matrix.T if self._transposed else matrix
+        return self._data[number]
+
+    @property
+    def names(self):
+        """ Names of the variables, in the order of the file
+        """
+        return list(self._names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._names)
+
+    def descriptions(self):
+        """ Dictionary mapping the name of each variable to its description
+        """
+        if 'description' not in self._matrices:
+            return dict.fromkeys(self._names, '')
+        return dict(zip(self._names, self._strings('description')))
+
+    def _location(self, name):
+        """ Data matrix and row of a variable, and whether it is negated
+        """
+        try:
+            matrix, row = self._info[self._index[name]]
+        except KeyError:
+            raise KeyError('{0} is not a variable of {1}'.format(name, self.path))
+        return int(matrix), abs(int(row)) - 1, bool(row < 0)
+
+    def is_parameter(self, name):
+        """ True if the variable is constant during the simulation, i.e. stored in ``data_1``
+        """
+        return self._location(name)[0] == 1
+
+    def alias_of(self, name):
+        """ Name of the first variable sharing the values of ``name``, and whether ``name`` is its opposite
+        """
+        import numpy as np
+
+        matrix, row, negated = self._location(name)
+        i = np.flatnonzero((self._info[:, 0] == matrix) & (np.abs(self._info[:, 1]) == row + 1))[0]
+        return self._names[i], negated != (self._info[i, 1] < 0)
+
+    def time(self, start=None, stop=None):
+        """ Time steps of the trajectories within ``[start, stop]``
+        """
+        return self.values(self._time_name(), start=start, stop=stop)
+
+    def _time_name(self):
+        for name in ('Time', 'time'):
+            if name in self._index:
+                return name
+        return self._names[0]
+
+    def _steps(self, start, stop):
+        """ Slice of the time steps within ``[start, stop]``
+        """
+        import numpy as np
+
+        if start is None and stop is None:
+            return slice(None)
+        if self._time is None:
+            matrix, row, negated = self._location(self._time_name())
+            self._time = np.array(self._data_matrix(matrix)[:, row])
+        first = 0 if start is None else int(np.searchsorted(self._time, start, side='left'))
+        last = len(self._time) if stop is None else int(np.searchsorted(self._time, stop, side='right'))
+        return slice(first, last)
+
+    def values(self, name, start=None, stop=None, copy=True):
+        """ Values of a variable at the time steps within ``[start, stop]``
+
+        :param name: name of the variable
+        :param start: start of the time window, or None
+        :param stop: end of the time window, or None
+        :param copy: if False, a read-only view of the file is returned instead of an array in memory, unless the
+            variable is a negated alias. The values of the view are read from disk when they are used.
+        :return: NumPy array, with one value per time step. Parameters are repeated at each time step.
+        """
+        return self.arrays([name], start=start, stop=stop, copy=copy)[name]
+
+    def _length(self):
+        """ Number of time steps of the trajectories
+        """
+        return self._data_matrix(2).shape[0] if 'data_2' in self._matrices else 0
+
+    def arrays(self, names, start=None, stop=None, copy=True):
+        """ Values of several variables at the time steps within ``[start, stop]``.
+
+        The variables sharing the same values (aliases) are read once, and the signals of each data matrix are read
+        in a single pass over the time steps.
+
+        :param copy: see :meth:`values`
+        :return: dictionary mapping each name to a NumPy array, see :meth:`values`
+        """
+        import numpy as np
+
+        steps = self._steps(start, stop)
+        length = len(range(*steps.indices(self._length())))
+        locations = {n: self._location(n) for n in names}
+
+        result = dict()
+        rows = dict()  # data matrix -> rows to read
+        for name, (matrix, row, negated) in locations.items():
+            if matrix == 1:
+                # parameters: a single value, repeated at each time step
+                value = self._data_matrix(1)[0, row]
+                result[name] = np.broadcast_to(-value if negated else value, (length,))
+            elif not copy and not negated:
+                result[name] = self._data_matrix(matrix)[steps, row]
+            else:
+                rows.setdefault(matrix, set()).add(row)
+
+        for matrix, needed in rows.items():
+            needed = sorted(needed)
+            columns = {r: i for i, r in enumerate(needed)}
+            block = np.array(self._data_matrix(matrix)[steps][:, needed])
+            for name, (m, row, negated) in locations.items():
+                if m == matrix and name not in result:
+                    values = block[:, columns[row]]
+                    result[name] = -values if negated else values
+
+        if copy:
+            # arrays of their own, e.g. not columns of a shared block nor broadcast values
+            result = {n: np.array(v) for n, v in result.items()}
+        return result
+
+    def to_dataframe(self, names, start=None, stop=None):
+        """ Values of several variables at the time steps within ``[start, stop]``, as a ``pandas.DataFrame``
+        indexed by time
+        """
+        import pandas as pd
+
+        arrays = self.arrays(names, start=start, stop=stop, copy=False)
+        return pd.DataFrame(arrays, index=pd.Index(self.time(start, stop), name=self._time_name()),
+                            columns=list(names))
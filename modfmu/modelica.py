@@ -1,12 +1,32 @@
-from tkinter import Pack
+def _write_atomic(path, content):
+    """ Writes a file through a temporary file, so that it is never left missing nor half written
+    """
+    import os
+    import threading
+
+    tmp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp, 'w') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
 
 
 class Package(object):
     _package_file = 'package.mo'
     _package_order = 'package.order'
+    # minimum time between two checks of the directory modification times, in seconds.
+    # Changes made through the Package itself are seen at once.
+    scan_interval = 1.
 
     def __init__(self, path):
         import os
+        from modfmu.library_index import LibraryIndex
         try:
             path = os.path.realpath(path)
         except Exception as e:
@@ -18,14 +38,15 @@ class Package(object):
         self._models = set()
         self._parents = set()
         self._adam = None
+        # scan of the package tree, done on first access to children or models
+        self._dir_mtimes = None  # directory -> modification time at the last scan
+        self._checked = 0.
+        self._transaction = None  # PackageTransaction in progress
 
         if os.path.exists(self.path):  # si exists path
             #   si exists package.mo and package.order -> existing package
-            if os.path.isfile(os.path.join(self.path, Package._package_file)) and \
-                    os.path.isfile(os.path.join(self.path, Package._package_order)):
-                self.scan_children()
-                self.scan_parents()
-            else:
+            if not (os.path.isfile(os.path.join(self.path, Package._package_file)) and
+                    os.path.isfile(os.path.join(self.path, Package._package_order))):
                 Package.create_package(self.path)
         else:  # create dir, package.mo, package.order
             try:
@@ -34,9 +55,20 @@ class Package(object):
             except Exception as e:
                 raise e
 
+        # the library index, when already opened, knows the enclosing packages without walking up the tree
+        index = LibraryIndex.containing(self.path)
+        if index is not None:
+            self._adam = index.root
+            self._parents = index.package_directories(self.path)
+        else:
+            self.scan_parents()
+
         self._parent_modelica_name = self.adam.split(os.path.sep)[-1]  # 'GenkNET'
         rel = os.path.relpath(self.path, self.adam)  # 'CoSimulation\\Components\\Neighborhoud'
-        self._modelica_name = '.'.join([self._parent_modelica_name, '.'.join(rel.split(os.path.sep))])
+        if rel == os.curdir:  # root package of the library
+            self._modelica_name = self._parent_modelica_name
+        else:
+            self._modelica_name = '.'.join([self._parent_modelica_name, '.'.join(rel.split(os.path.sep))])
 
         # if Package.is_modelica_package(parent_dir):
         #     self._parent = os.path.realpath(parent_dir)
@@ -63,8 +95,31 @@ class Package(object):
     def adam(self, value):
         raise AttributeError('adam atribute cannot be set by the user.')
 
+    @property
+    def index(self):
+        """ :class:`modfmu.library_index.LibraryIndex` of the library the package belongs to
+        """
+        from modfmu.library_index import LibraryIndex
+        return LibraryIndex.open(self.adam)
+
+    def class_file(self, name):
+        """ File defining a class of the library, or None
+
+        :param name: fully qualified modelica name of the class, or its name relative to the package
+        """
+        index = self.index
+        return index.class_file('.'.join([self._modelica_name, name])) or index.class_file(name)
+
+    def classes(self, kinds=None):
+        """ Modelica names of the classes directly contained in the package, in the order of package.order
+
+        :param kinds: if given, only the classes of these kinds ('model', 'block', ...) are listed
+        """
+        return self.index.children(self._modelica_name, kinds=kinds)
+
     @property
     def models(self):
+        self._ensure_scanned()
         return self._models
 
     @models.setter
@@ -74,7 +129,7 @@ class Package(object):
 
     @property
     def children(self):
-        self.scan_children()
+        self._ensure_scanned()
         return self._children
 
     @children.setter
@@ -122,23 +177,91 @@ class Package(object):
         path = os.path.abspath(path)
         name = path.split(os.path.sep)[-1]
         parent = path.split(os.path.sep)[-2]
-        with open(os.path.join(path, Package._package_file), 'w+') as f:
-            f.write('within {} ; \n'.format(parent) +
-                    'package {} ""\n'.format(name) +
-                    '   extends Modelica.Icons.Package; \n' +
-                    'end {0};\n'.format(name))
-
-        with open(os.path.join(path, Package._package_order), 'w+') as f:
-            f.write('')
+        _write_atomic(os.path.join(path, Package._package_file),
+                      'within {} ; \n'.format(parent) +
+                      'package {} ""\n'.format(name) +
+                      '   extends Modelica.Icons.Package; \n' +
+                      'end {0};\n'.format(name))
+        _write_atomic(os.path.join(path, Package._package_order), '')
 
     def scan_children(self):
+        """ Scans the package tree for sub packages and modelica files, in a single traversal.
+        """
+        import os
+        import time
+
+        children = set()
+        models = set()
+        dir_mtimes = dict()
+        stack = [self._path]
+        while stack:
+            d = stack.pop()
+            try:
+                dir_mtimes[d] = os.stat(d).st_mtime_ns
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            names = set()
+            for e in entries:
+                names.add(e.name)
+                if e.is_dir():
+                    stack.append(e.path)
+                elif e.name.endswith('.mo'):
+                    models.add(e.path)
+            if d != self._path and Package._package_file in names and Package._package_order in names:
+                children.add(d)
+
+        self._children = children
+        self._models = models
+        self._dir_mtimes = dir_mtimes
+        self._checked = time.monotonic()
+
+    def refresh(self):
+        """ Forgets the cached scan of the package tree, which is done again on next access.
+        """
+        self._dir_mtimes = None
+
+    def _is_stale(self):
+        """ True if a directory of the package tree changed since the last scan
+        """
         import os
-        for root, dirs, files in os.walk(self._path):
-            for d in dirs:
-                self.children = os.path.join(root, d)
-            for f in files:
-                if f.endswith('.mo'):
-                    self.models = os.path.join(root, f)
+
+        for d, mtime in self._dir_mtimes.items():
+            try:
+                if os.stat(d).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _ensure_scanned(self):
+        """ Scans the package tree if it was never scanned, or if it changed since the last scan. Changes are
+        looked for at most every ``scan_interval`` seconds.
+        """
+        import time
+
+        if self._dir_mtimes is None:
+            self.scan_children()
+        elif time.monotonic() - self._checked >= self.scan_interval:
+            if self._is_stale():
+                self.scan_children()
+            else:
+                self._checked = time.monotonic()
+
+    def _record_change(self, directories):
+        """ Takes into account a change of the package tree made by the package itself, without scanning it again.
+
+        :param directories: directories whose content changed
+        """
+        import os
+
+        if self._dir_mtimes is None:
+            return
+        for d in directories:
+            try:
+                self._dir_mtimes[d] = os.stat(d).st_mtime_ns
+            except OSError:
+                self._dir_mtimes.pop(d, None)
 
     def scan_parents(self):
         from pathlib import Path
@@ -156,61 +279,51 @@ class Package(object):
                 has_parent = False
                 self._adam = p
 
-    def add_subpackage(self, sub_pck_name, order='last'):
-        import os
-        sub_pack_path = os.path.join(self.path, sub_pck_name)
-        if sub_pack_path in self.children:
-            Warning('Subpackage already existing. Did nothing.')
-        else:
-            if os.path.exists(sub_pack_path):
-                if os.path.isfile(os.path.join(sub_pack_path, self._package_file)) and \
-                        os.path.isfile(os.path.join(sub_pack_path, self._package_order)):
-                    Warning('Subpackage already existing. Did nothing.')
-                else:
-                    Package.create_package(sub_pack_path)
+    def transaction(self):
+        """ Edits of the package collected in memory and written at once, see :class:`PackageTransaction`.
 
-            else:
-                os.mkdir(sub_pack_path)
-                Package.create_package(sub_pack_path)
-
-            self.children = sub_pack_path
-            if order == 'last':
-                with open(self._order_file, 'a+') as f:
-                    f.write(sub_pck_name + '\n')
-            elif order == 'first':
-                with open(self._order_file, 'r+') as f:
-                    content = f.readlines()
-                    f.seek(0, 0)
-                    f.writelines([sub_pck_name+'\n'] + content)
-        self.scan_children()
+        Usage:
+            >>> with pck.transaction() as t:
+            ...     for name in names:
+            ...         t.add_subpackage(name)
 
-    def rm_subpackage(self, sub_pck_name):
-        import os
-        sub_pack_path = os.path.join(self.path, sub_pck_name)
-        try:
-            os.remove(os.path.join(sub_pack_path, self._package_file))
-            os.remove(os.path.join(sub_pack_path, self._package_order))
-        except Exception as e:
-            raise e
+        :return: :class:`PackageTransaction`, committed when the ``with`` block exits without error
+        """
+        if self._transaction is not None:
+            raise RuntimeError('A transaction of {} is already in progress'.format(self._modelica_name))
+        return PackageTransaction(self)
 
-        try:
-            if not os.listdir(sub_pack_path):
-                os.rmdir(sub_pack_path)
-        except FileNotFoundError:
-            pass
+    def _edit(self):
+        """ Transaction in progress, or a new one committed by the caller
+        """
+        if self._transaction is not None:
+            return self._transaction, False
+        return PackageTransaction(self), True
 
-        try:
-            self._childs.remove(sub_pack_path)
-        except ValueError:
-            pass
+    def add_subpackage(self, sub_pck_name, order='last'):
+        trans, own = self._edit()
+        trans.add_subpackage(sub_pck_name, order=order)
+        if own:
+            trans.commit()
+
+    def add_to_order(self, names):
+        """ Appends classes to package.order in a single write, e.g. the models of a batch of FMU imports.
+        Names already listed are left where they are.
+
+        :param names: names of the classes, relative to the package
+        :return: list of the names that were added
+        """
+        trans, own = self._edit()
+        added = trans.add_to_order(names)
+        if own:
+            trans.commit()
+        return added
 
-        with open(self._order_file, 'r') as f:
-            lines = f.readlines()
-            newlines = [l for l in lines if l != sub_pck_name + '\n']
-        os.remove(self._order_file)
-        with open(self._order_file + '_tmp', 'w') as f2:
-            f2.writelines(newlines)
-        os.rename(self._order_file + '_tmp', self._order_file)
+    def rm_subpackage(self, sub_pck_name):
+        trans, own = self._edit()
+        trans.rm_subpackage(sub_pck_name)
+        if own:
+            trans.commit()
 
     def get_subpackage(self, sub_pck_path):
         if sub_pck_path in self.child:
@@ -221,6 +334,175 @@ class Package(object):
         return self._package_file
 
 
+class PackageTransaction(object):
+    """Adds, removes and reorders of the classes of a package, collected in memory.
+
+    The changes are written by :meth:`commit`: each new sub package is created with its ``package.mo`` and
+    ``package.order``, the ``package.order`` of the package is written once, and the library index is refreshed once.
+    Files are written through a temporary file, so that a crash never leaves them missing nor half written.
+
+    Used as a context manager, the transaction is committed when the block exits without error, and discarded
+    otherwise. While it is in progress, the editing methods of the :class:`Package` go through it.
+    """
+
+    def __init__(self, pck):
+        """
+
+        :param pck: package to edit
+        :type pck: Package
+        """
+        self._pck = pck
+        with open(pck._order_file, 'r') as f:
+            self._original = [l.strip() for l in f if l.strip()]
+        self._order = list(self._original)
+        self._added = list()  # names of the sub packages to create
+        self._removed = list()  # names of the sub packages to remove
+        self._done = False
+
+    def __enter__(self):
+        self._pck._transaction = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._pck._transaction = None
+        if exc_type is None:
+            self.commit()
+        else:
+            self._done = True
+        return False
+
+    @property
+    def order(self):
+        """ Content of package.order once the transaction is committed
+        """
+        return list(self._order)
+
+    def _check(self):
+        if self._done:
+            raise RuntimeError('The transaction of {} is already over'.format(self._pck._modelica_name))
+
+    def add_subpackage(self, sub_pck_name, order='last'):
+        """ Adds a sub package, created at commit if it does not exist yet
+
+        :param order: ``'last'`` or ``'first'``, position of the sub package in package.order
+        """
+        import os
+
+        self._check()
+        path = os.path.join(self._pck.path, sub_pck_name)
+        if sub_pck_name in self._removed:
+            self._removed.remove(sub_pck_name)
+        if not (os.path.isfile(os.path.join(path, Package._package_file)) and
+                os.path.isfile(os.path.join(path, Package._package_order))) and sub_pck_name not in self._added:
+            self._added.append(sub_pck_name)
+        if sub_pck_name in self._order:
+            Warning('Subpackage already existing. Did nothing.')
+        elif order == 'first':
+            self._order.insert(0, sub_pck_name)
+        else:
+            self._order.append(sub_pck_name)
+
+    def rm_subpackage(self, sub_pck_name):
+        """ Removes a sub package: its package.mo and package.order, and its directory if it is then empty
+
+        :raises FileNotFoundError: if the sub package does not exist
+        """
+        import os
+
+        self._check()
+        if sub_pck_name in self._added:
+            self._added.remove(sub_pck_name)
+        elif sub_pck_name not in self._removed:
+            if not os.path.isfile(os.path.join(self._pck.path, sub_pck_name, Package._package_file)):
+                raise FileNotFoundError('{0} is not a sub package of {1}'.format(sub_pck_name,
+                                                                                self._pck._modelica_name))
+            self._removed.append(sub_pck_name)
+        self._order = [n for n in self._order if n != sub_pck_name]
+
+    def add_to_order(self, names):
+        """ Appends classes to package.order. Names already listed are left where they are.
+
+        :return: list of the names that were added
+        """
+        self._check()
+        listed = set(self._order)
+        added = list()
+        for n in names:
+            if n not in listed:
+                listed.add(n)
+                added.append(n)
+        self._order.extend(added)
+        return added
+
+    def remove_from_order(self, names):
+        """ Removes classes from package.order, without removing their files
+        """
+        self._check()
+        names = set(names)
+        self._order = [n for n in self._order if n not in names]
+
+    def reorder(self, names):
+        """ Moves classes to the top of package.order, in the given order. The other classes stay after them, in
+        their current order.
+
+        :raises ValueError: if a name is not listed in package.order
+        """
+        self._check()
+        missing = [n for n in names if n not in self._order]
+        if missing:
+            raise ValueError('{0} not listed in the package.order of {1}'.format(', '.join(missing),
+                                                                                self._pck._modelica_name))
+        first = list(dict.fromkeys(names))
+        moved = set(first)
+        self._order = first + [n for n in self._order if n not in moved]
+
+    def commit(self):
+        """ Writes the changes
+        """
+        import os
+        from modfmu.library_index import LibraryIndex
+
+        self._check()
+        self._done = True
+        pck = self._pck
+        changed = [pck.path]
+        for name in self._added:
+            path = os.path.join(pck.path, name)
+            os.makedirs(path, exist_ok=True)
+            if not Package.is_modelica_package(path):
+                Package.create_package(path)
+            changed.append(path)
+        if self._order != self._original:
+            _write_atomic(pck._order_file, ''.join(n + '\n' for n in self._order))
+        for name in self._removed:
+            path = os.path.join(pck.path, name)
+            for f in (Package._package_file, Package._package_order):
+                try:
+                    os.remove(os.path.join(path, f))
+                except FileNotFoundError:
+                    pass
+            try:
+                if not os.listdir(path):
+                    os.rmdir(path)
+            except FileNotFoundError:
+                pass
+            changed.append(path)
+
+        if pck._dir_mtimes is not None:
+            for name in self._added:
+                path = os.path.join(pck.path, name)
+                pck._children.add(path)
+                pck._models.add(os.path.join(path, Package._package_file))
+            for name in self._removed:
+                path = os.path.join(pck.path, name)
+                pck._children.discard(path)
+                pck._models.discard(os.path.join(path, Package._package_file))
+            pck._record_change(changed)
+        index = LibraryIndex.containing(pck.path)
+        if index is not None and (self._added or self._removed or self._order != self._original):
+            index.refresh()
+
+
 if __name__ == "__main__":
     import os
 
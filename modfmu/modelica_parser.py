@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Lexical parsing of Modelica files, shared by the library index (:mod:`modfmu.library_index`) and the dependency
+graph (:mod:`modfmu.dependencies`).
+
+The parsing relies on regular expressions run on the code of a file once its comments and strings are removed,
+which is enough to find the class definitions and the names used by a file without a full Modelica parser.
+"""
+
+import re
+
+_comment_or_string = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:[^"\\]|\\.)*"', re.S)
+_class_def = re.compile(r'\b((?:(?:encapsulated|partial|final|replaceable|redeclare|inner|outer)\s+)*)'
+                        r'((?:expandable\s+)?connector|(?:operator\s+)?record|(?:(?:im)?pure\s+)?(?:operator\s+)?function|'
+                        r'operator|model|block|package|type|class)\s+(\w+)')
+
+keywords = {'algorithm', 'and', 'annotation', 'block', 'break', 'class', 'connect', 'connector', 'constant',
+            'constrainedby', 'der', 'discrete', 'each', 'else', 'elseif', 'elsewhen', 'encapsulated', 'end',
+            'enumeration', 'equation', 'expandable', 'extends', 'external', 'false', 'final', 'flow', 'for',
+            'function', 'if', 'import', 'impure', 'in', 'initial', 'inner', 'input', 'loop', 'model', 'not',
+            'operator', 'or', 'outer', 'output', 'package', 'parameter', 'partial', 'protected', 'public', 'pure',
+            'record', 'redeclare', 'replaceable', 'return', 'stream', 'then', 'true', 'type', 'when', 'while',
+            'within', 'time'}
+
+
+def strip_comments(text):
+    """ Replaces the comments and strings of Modelica code by spaces
+    """
+    return _comment_or_string.sub(' ', text)
+
+
+def read_code(path):
+    """ Reads a Modelica file, without its comments and strings
+
+    :param path: path of the ``.mo`` file
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return strip_comments(f.read())
+
+
+def class_definitions(code):
+    """ Lists the classes defined in Modelica code, comments and strings removed.
+
+    Keywords following a class kind, e.g. in ``redeclare model extends``, are not taken for class names.
+
+    :param code: Modelica code, as returned by :func:`read_code`
+    :return: list of tuples ``(name, kind, partial)``, in the order of the code. ``kind`` is e.g. ``'model'``,
+        ``'expandable connector'`` or ``'operator record'``.
+    """
+    classes = list()
+    for prefixes, kind, name in _class_def.findall(code):
+        if name in keywords:
+            continue
+        kind = ' '.join(k for k in kind.split() if k not in ('pure', 'impure'))
+        classes.append((name, kind, 'partial' in prefixes.split()))
+    return classes
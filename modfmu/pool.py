@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of long-lived translator sessions.
+
+Starting the translator and loading the library for every script is often longer than the translation itself.
+A :class:`TranslatorPool` keeps translator sessions running, with the library already loaded, and sends them the
+scripts of the successive jobs. Each session is replaced after ``max_jobs`` jobs, or when its memory grew by more
+than ``max_memory_growth`` since its first job, as a long-lived translator keeps the memory of the models it
+translated.
+
+The scripts are handed to a session by one of two backends:
+
+- ``'directory'``: the session runs a script looping until a ``stop`` file appears in its directory, and runs the
+  ``job.mos`` file written there for each job (Dymola);
+- ``'stdin'``: the session reads script statements from its standard input, and each job is sent as a
+  ``RunScript`` statement (interpreters reading their commands from their standard input).
+
+In both cases, the end of a job is signalled by a marker file written by the last statement of its script.
+
+Usage:
+    >>> with TranslatorPool('Dymola', size=4, packages=['MyLib/package.mo']) as pool:
+    ...     translate_package(Package('MyLib/Sub'), jobs=4, pool=pool)
+"""
+
+_session_mos = '_session.mos'
+_job_mos = 'job.mos'
+_running_mos = 'running.mos'
+_stop_file = 'stop'
+_job_wait = 1.  # longest wait of an idle session for its next job in one shell command, in seconds
+
+
+def _modelica_path(path):
+    """ Path written in a script string
+    """
+    return path.replace('\\', '/')
+
+
+def _group_rss(pid):
+    """ Resident memory of the processes of a process group, in bytes, or None if it cannot be read (Linux only)
+    """
+    import os
+
+    total = 0
+    try:
+        pids = [p for p in os.listdir('/proc') if p.isdigit()]
+    except OSError:
+        return None
+    for p in pids:
+        try:
+            with open('/proc/{}/stat'.format(p), 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            # fields after the command: state, ppid, pgrp, ..., rss is the 22nd one
+            if int(fields[2]) == pid:
+                total += int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class _Session(object):
+    """A translator process receiving the jobs of a pool
+    """
+
+    def __init__(self, pool, number):
+        import os
+
+        self._pool = pool
+        self.directory = os.path.join(pool.directory, 'session_{}'.format(number))
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        for f in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, f))
+        self.stdout_log = os.path.join(self.directory, 'session_stdout.log')
+        self.stderr_log = os.path.join(self.directory, 'session_stderr.log')
+        self.jobs_done = 0
+        self.baseline = None  # memory after the first job
+        self._process = None
+        self.cmd = None
+
+    def _bootstrap(self):
+        """ Statements run when the session starts: loading of the library and pre-processing statements
+        """
+        script = ''
+        for p in self._pool.packages:
+            script += 'openModel("{}");\n'.format(_modelica_path(p))
+        for p in self._pool.pre_processing:
+            script += p + '\n'
+        return script
+
+    def _wait_command(self):
+        """ Shell command returning once the next job or the stop file is in the directory of the session, or after
+        :data:`_job_wait` seconds: the command polls the directory itself, so that an idle session runs one command
+        per second instead of one per poll.
+        """
+        import os
+        import shlex
+        import sys
+
+        job, stop = (_modelica_path(os.path.join(self.directory, f)) for f in (_job_mos, _stop_file))
+        polls = int(_job_wait / 0.05)
+        if sys.platform == 'win32':
+            command = ("powershell -NoProfile -Command \"$i = 0; while ($i -lt {0} -and -not (Test-Path '{1}') "
+                       "-and -not (Test-Path '{2}')) {{ Start-Sleep -Milliseconds 50; $i++ }}\"").format(polls, job, stop)
+        else:
+            command = ('i=0; while [ $i -lt {0} ] && [ ! -e {1} ] && [ ! -e {2} ]; do sleep 0.05; i=$((i + 1)); '
+                       'done').format(polls, shlex.quote(job), shlex.quote(stop))
+        return command.replace('"', '\\"')
+
+    def _directory_loop(self):
+        """ Script of a session of the ``'directory'`` backend
+        """
+        import os
+
+        path = lambda f: _modelica_path(os.path.join(self.directory, f))
+        return ('// modfmu translator session\n' + self._bootstrap() +
+                'while not Modelica.Utilities.Files.exist("{0}") loop\n'
+                '  if Modelica.Utilities.Files.exist("{1}") then\n'
+                '    Modelica.Utilities.Files.move("{1}", "{2}", true);\n'
+                '    RunScript("{2}");\n'
+                '  else\n'
+                '    Modelica.Utilities.System.command("{3}");\n'
+                '  end if;\n'
+                'end while;\n'
+                'Modelica.Utilities.System.exit();\n').format(path(_stop_file), path(_job_mos), path(_running_mos),
+                                                              self._wait_command())
+
+    def start(self):
+        import os
+        import subprocess
+        import time
+        from modfmu import profiling
+        from modfmu.fmu_translator import _popen_process_group_kwargs
+
+        start = time.monotonic()
+        if self._pool.backend == 'directory':
+            script = os.path.join(self.directory, _session_mos)
+            with open(script, 'w') as f:
+                f.write(self._directory_loop())
+            self.cmd = [self._pool.modelica_exe, script] + list(self._pool.args)
+            stdin = subprocess.DEVNULL
+        else:
+            self.cmd = [self._pool.modelica_exe] + list(self._pool.args)
+            stdin = subprocess.PIPE
+        with open(self.stdout_log, 'wb') as std_out, open(self.stderr_log, 'wb') as std_err:
+            self._process = subprocess.Popen(self.cmd, stdin=stdin, stdout=std_out, stderr=std_err, cwd=self.directory,
+                                             **_popen_process_group_kwargs())
+        if self._pool.backend == 'stdin':
+            self._send(self._bootstrap())
+        profiling.record('process_spawn', 'TranslatorPool', time.monotonic() - start)
+
+    def _send(self, statements):
+        self._process.stdin.write(statements.encode('utf-8'))
+        self._process.stdin.flush()
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def memory(self):
+        return _group_rss(self._process.pid) if self._process is not None else None
+
+    def _job_script(self, mosFile, directory, job_id, done):
+        """ Script of a job: the script ``mosFile``, without the loading of the packages already loaded by the
+        session and without the exit of the translator, run in ``directory`` with a log of its own
+        """
+        import re
+
+        loaded = [re.escape('openModel("{}")'.format(p)) for p in self._pool.packages] + \
+                 [re.escape('openModel("{}")'.format(_modelica_path(p))) for p in self._pool.packages]
+        skipped = re.compile(r'^\s*(Modelica\.Utilities\.System\.exit\(\)' + ''.join('|' + p for p in loaded) + r')\s*;?\s*$')
+        with open(mosFile, 'r') as f:
+            lines = [l for l in f.read().splitlines() if not skipped.match(l)]
+        return ('// modfmu job {0}\nclearlog();\ncd("{1}");\n'.format(job_id, _modelica_path(directory)) +
+                '\n'.join(lines) + '\n' +
+                'Modelica.Utilities.Streams.print("{0}", "{1}");\n'.format(job_id, _modelica_path(done)))
+
+    def _submit(self, mosFile, directory, job_id, fatal_patterns, watch):
+        """ Hands the script of a job to the session
+
+        :return: tuple ``(result, watcher, done)``: the result of the job, the watcher of its fatal errors or None,
+            and the path of the marker written at its end
+        """
+        import os
+        from modfmu.dymola_log import FatalErrorWatcher
+        from modfmu.fmu_translator import ProcessResult
+
+        done = os.path.join(self.directory, 'done_{}'.format(job_id))
+        job = os.path.join(self.directory, 'job_{}.mos'.format(job_id))
+        with open(job, 'w') as f:
+            f.write(self._job_script(mosFile, directory, job_id, done))
+        result = ProcessResult(self.cmd + [mosFile], stdout_log=self.stdout_log, stderr_log=self.stderr_log)
+        watcher = None
+        if fatal_patterns:
+            watcher = FatalErrorWatcher([self.stdout_log, self.stderr_log] + list(watch), fatal_patterns,
+                                        from_end=True)
+
+        if self._pool.backend == 'directory':
+            # written under another name first, so that the session never reads a partial script
+            os.replace(job, os.path.join(self.directory, _job_mos))
+        else:
+            self._send('RunScript("{}");\n'.format(_modelica_path(job)))
+        return result, watcher, done
+
+    def _over(self, result, watcher, done, start, timeout):
+        """ True once a job is over: done, session exited, timed out or aborted on a fatal error
+        """
+        import os
+        import time
+
+        if os.path.exists(done):
+            result.returncode = 0
+            os.remove(done)
+        elif not self.alive:
+            result.returncode = self._process.returncode
+        elif timeout > 0 and time.monotonic() - start >= timeout:
+            result.timed_out = True
+        elif watcher is not None and watcher.poll():
+            result.aborted = True
+        else:
+            return False
+        return True
+
+    def _finish(self, result, watcher, start):
+        import time
+
+        result.duration = time.monotonic() - start
+        if watcher is not None:
+            watcher.poll(final=True)
+            result.fatal_errors = watcher.matches
+        self.jobs_done += 1
+        return result
+
+    def run(self, mosFile, directory, job_id, timeout=60, fatal_patterns=None, watch=()):
+        """ Runs the script of a job in the session
+
+        :return: a :class:`modfmu.fmu_translator.ProcessResult`
+        """
+        import time
+        from modfmu.fmu_translator import _fatal_poll_interval, _kill_process_group
+
+        start = time.monotonic()
+        result, watcher, done = self._submit(mosFile, directory, job_id, fatal_patterns, watch)
+        delay = 0.001
+        while not self._over(result, watcher, done, start, timeout):
+            time.sleep(delay)
+            delay = min(2 * delay, _fatal_poll_interval)
+        if result.timed_out or result.aborted:
+            # the session is in an unknown state
+            _kill_process_group(self._process)
+        return self._finish(result, watcher, start)
+
+    async def run_async(self, mosFile, directory, job_id, timeout=60, fatal_patterns=None, watch=()):
+        """ Same as :meth:`run`, without blocking the event loop
+        """
+        import asyncio
+        import time
+        from modfmu.dymola_log import wait_for_file_async
+        from modfmu.fmu_translator import _fatal_poll_interval, _kill_process_group
+
+        start = time.monotonic()
+        result, watcher, done = self._submit(mosFile, directory, job_id, fatal_patterns, watch)
+        while not self._over(result, watcher, done, start, timeout):
+            await wait_for_file_async(done, _fatal_poll_interval)
+        if result.timed_out or result.aborted:
+            await asyncio.get_running_loop().run_in_executor(None, _kill_process_group, self._process)
+        return self._finish(result, watcher, start)
+
+    def stop(self, grace=10.):
+        """ Asks the session to exit, then kills it if it does not
+        """
+        import os
+        import subprocess
+        from modfmu.fmu_translator import _kill_process_group
+
+        if not self.alive:
+            return
+        try:
+            if self._pool.backend == 'directory':
+                open(os.path.join(self.directory, _stop_file), 'w').close()
+            else:
+                self._send('Modelica.Utilities.System.exit();\n')
+                self._process.stdin.close()
+            self._process.wait(timeout=grace)
+        except (OSError, subprocess.TimeoutExpired):
+            _kill_process_group(self._process)
+
+
+class TranslatorPool(object):
+    """Long-lived translator sessions running the scripts of successive jobs, see the module documentation.
+
+    Thread safe: up to ``size`` jobs run at once, each one in its own session.
+    """
+
+    def __init__(self, modelica_exe='Dymola', size=1, packages=(), pre_processing=(), directory=None,
+                 backend='directory', args=None, max_jobs=50, max_memory_growth=1024 ** 3):
+        """
+
+        :param modelica_exe: name of the translator executable
+        :param size: number of sessions
+        :param packages: paths of the ``package.mo`` files of the libraries loaded by each session
+        :param pre_processing: statements run by each session once its libraries are loaded, e.g.
+            :attr:`modfmu.fmu_translator.FMUTranslator._prestatements_fmu_dymola`
+        :param directory: directory of the scripts and outputs of the sessions. Defaults to a temporary directory.
+        :param backend: ``'directory'`` or ``'stdin'``
+        :param args: arguments of the translator. Defaults to ``['/nowindow']`` for the ``'directory'`` backend.
+        :param max_jobs: number of jobs after which a session is replaced
+        :param max_memory_growth: memory growth of a session since its first job after which it is replaced, in bytes.
+            None to disable.
+        """
+        import os
+        import queue
+        import tempfile
+        import threading
+
+        if backend not in ('directory', 'stdin'):
+            raise ValueError("backend must be 'directory' or 'stdin'. Got {} instead".format(backend))
+        if size < 1:
+            raise ValueError('size must be a positive integer. Got {} instead'.format(size))
+        self.modelica_exe = modelica_exe
+        self.size = size
+        self.packages = [os.path.abspath(p) for p in packages]
+        self.pre_processing = list(pre_processing)
+        self._temporary = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix='modfmu_pool_')
+        self.backend = backend
+        self.args = args if args is not None else (['/nowindow'] if backend == 'directory' else list())
+        self.max_jobs = max_jobs
+        self.max_memory_growth = max_memory_growth
+
+        self._idle = queue.LifoQueue()  # the session used last is the warmest one
+        self._lock = threading.Lock()
+        self._sessions = 0
+        self._jobs = 0
+        self._closed = False
+        self.recycled = 0
+        for i in range(size):
+            self._idle.put(None)  # session started at its first job
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _new_session(self):
+        with self._lock:
+            number = self._sessions
+            self._sessions += 1
+        session = _Session(self, number)
+        session.start()
+        return session
+
+    def _recycle(self, session):
+        """ True if a session must be replaced after a job
+        """
+        if not session.alive or session.jobs_done >= self.max_jobs:
+            return True
+        if self.max_memory_growth is None:
+            return False
+        memory = session.memory()
+        if memory is None:
+            return False
+        if session.baseline is None:
+            session.baseline = memory
+        return memory - session.baseline > self.max_memory_growth
+
+    def run_mos(self, mosFile, directory, modelica_exe=None, timeout=60, showGUI=False, showProgressBar=False,
+                fatal_patterns=None, watch=()):
+        """ Runs a script in a session of the pool. Same as :func:`modfmu.fmu_translator.run_mos`, ``modelica_exe``,
+        ``showGUI`` and ``showProgressBar`` being those of the pool.
+
+        The ``openModel`` statements of the packages loaded by the sessions, and the exit of the translator, are
+        removed from the script. The script is run in ``directory``, after the log of the session is cleared.
+
+        :return: a :class:`modfmu.fmu_translator.ProcessResult`
+        """
+        from modfmu import profiling, scheduler
+
+        if self._closed:
+            raise RuntimeError('The translator pool is closed')
+        with self._lock:
+            self._jobs += 1
+            job_id = self._jobs
+        with scheduler.admission():
+            session = self._idle.get()
+            try:
+                if session is None or not session.alive:
+                    session = self._new_session()
+                result = session.run(mosFile, directory, job_id, timeout=timeout, fatal_patterns=fatal_patterns,
+                                     watch=watch)
+                if self._recycle(session):
+                    session.stop()
+                    session = None
+                    self.recycled += 1
+            except BaseException:
+                if session is not None:
+                    session.stop(grace=0.)
+                session = None
+                raise
+            finally:
+                self._idle.put(session)
+        profiling.record('translator_runtime', 'TranslatorPool', result.duration, script=mosFile,
+                         returncode=result.returncode, timed_out=result.timed_out, aborted=result.aborted)
+        return result
+
+    async def _idle_session(self):
+        """ Waits for an idle session without blocking the event loop
+        """
+        import asyncio
+        import queue
+
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                await asyncio.sleep(0.01)
+
+    async def run_mos_async(self, mosFile, directory, modelica_exe=None, timeout=60, showGUI=False, fatal_patterns=None,
+                            watch=()):
+        """ Same as :meth:`run_mos`, without blocking the event loop.
+
+        The cancellation of the task kills the session running the script, which is replaced at the next job.
+        """
+        import asyncio
+        from modfmu import profiling, scheduler
+
+        if self._closed:
+            raise RuntimeError('The translator pool is closed')
+        with self._lock:
+            self._jobs += 1
+            job_id = self._jobs
+        loop = asyncio.get_running_loop()
+        async with scheduler.admission():
+            session = await self._idle_session()
+            try:
+                if session is None or not session.alive:
+                    session = self._new_session()
+                result = await session.run_async(mosFile, directory, job_id, timeout=timeout,
+                                                 fatal_patterns=fatal_patterns, watch=watch)
+                if self._recycle(session):
+                    await loop.run_in_executor(None, session.stop)
+                    session = None
+                    self.recycled += 1
+            except BaseException:
+                # e.g. asyncio.CancelledError: the session is in the middle of the job
+                if session is not None:
+                    await asyncio.shield(loop.run_in_executor(None, session.stop, 0.))
+                session = None
+                raise
+            finally:
+                self._idle.put(session)
+        profiling.record('translator_runtime', 'TranslatorPool', result.duration, script=mosFile,
+                         returncode=result.returncode, timed_out=result.timed_out, aborted=result.aborted)
+        return result
+
+    def close(self):
+        """ Stops the sessions
+        """
+        import shutil
+
+        self._closed = True
+        for i in range(self.size):
+            session = self._idle.get()
+            if session is not None:
+                session.stop()
+        if self._temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
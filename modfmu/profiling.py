@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Timing of the phases of the builds.
+
+Translations and imports report the time spent in each of their phases: ``package_scan``, ``script_write``,
+``process_spawn``, ``translator_runtime``, ``log_read``, ``import`` and ``total``. Each timing is an event sent to the
+registered sinks; nothing is measured while no sink is registered.
+
+Usage:
+    >>> from modfmu import profiling
+    >>> profiling.add_sink(profiling.JsonLinesSink('timings.jsonl'))
+    >>> profiling.add_sink(profiling.PrometheusSink('/var/lib/node_exporter/modfmu.prom'))
+    >>> profiling.enable_profilers(cprofile='build.pstats', tracemalloc='build_memory.txt')
+    >>> translate_package(pck, jobs=8)
+
+An event is a dictionary with the keys ``phase``, ``scope`` (the function or class that ran the phase), ``start``
+(time since the epoch), ``duration`` (seconds), ``pid``, ``thread`` and the labels of the enclosing phases, such as
+``model``, ``fmu`` or ``package``.
+"""
+
+import contextvars
+
+_sinks = list()
+_labels = contextvars.ContextVar('modfmu_profiling_labels', default=dict())
+_profilers = {'cprofile': None, 'tracemalloc': None, 'active': False}
+
+
+def add_sink(sink):
+    """ Registers a sink: an object with an ``emit(event)`` method, and optionally ``flush()`` and ``close()``
+    methods, or a callable taking the event
+    """
+    if not hasattr(sink, 'emit'):
+        sink = CallbackSink(sink)
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    """ Unregisters a sink, after flushing it
+    """
+    _sinks.remove(sink)
+    if hasattr(sink, 'close'):
+        sink.close()
+
+
+def enabled():
+    return bool(_sinks)
+
+
+def labels():
+    """ Labels of the phases enclosing the current context, e.g. ``model`` or ``package``
+    """
+    return dict(_labels.get())
+
+
+def record(phase, scope, duration, start=None, **labels):
+    """ Sends the timing of a phase to the sinks
+
+    :param phase: name of the phase, e.g. ``'script_write'``
+    :param scope: function or class that ran the phase, e.g. ``'FMUTranslator'``
+    :param duration: duration of the phase in seconds
+    :param start: start of the phase, as returned by ``time.time()``. Defaults to now minus ``duration``.
+    :param labels: labels of the event, added to the labels of the enclosing phases
+    """
+    import os
+    import threading
+    import time
+
+    if not _sinks:
+        return
+    event = dict(_labels.get())
+    event.update(labels)
+    event.update({'phase': phase, 'scope': scope, 'duration': duration,
+                  'start': start if start is not None else time.time() - duration,
+                  'pid': os.getpid(), 'thread': threading.get_ident()})
+    for sink in list(_sinks):
+        sink.emit(event)
+
+
+class phase(object):
+    """Context manager timing a phase. Its labels are also given to the phases run inside it.
+
+    Usage:
+        >>> with phase('script_write', 'FMUTranslator', model='MyLib.MyModel'):
+        ...     write_script()
+    """
+
+    def __init__(self, name, scope, **labels):
+        self._name = name
+        self._scope = scope
+        self._labels = labels
+        self._token = None
+
+    def __enter__(self):
+        import time
+
+        if self._labels:
+            labels = dict(_labels.get())
+            labels.update(self._labels)
+            self._token = _labels.set(labels)
+        self._start = time.time()
+        self._perf = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        import time
+
+        duration = time.perf_counter() - self._perf
+        if self._token is not None:
+            _labels.reset(self._token)
+        if _sinks:
+            labels = dict(self._labels)
+            if exc_type is not None:
+                labels['error'] = exc_type.__name__
+            record(self._name, self._scope, duration, start=self._start, **labels)
+        return False
+
+
+class build(phase):
+    """Context manager of a whole build, e.g. :func:`modfmu.fmu_translator.translate_package`: times its ``total``
+    phase, runs the profilers enabled with :func:`enable_profilers`, then flushes the sinks.
+
+    Nested builds are part of the enclosing one.
+    """
+
+    def __init__(self, scope, **labels):
+        super(build, self).__init__('total', scope, **labels)
+        self._outermost = False
+
+    def __enter__(self):
+        import tracemalloc
+
+        if not _profilers['active']:
+            self._outermost = True
+            _profilers['active'] = True
+            self._profile = None
+            if _profilers['cprofile'] is not None:
+                import cProfile
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+            self._tracing = False
+            if _profilers['tracemalloc'] is not None and not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._tracing = True
+        return super(build, self).__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        import tracemalloc
+
+        super(build, self).__exit__(exc_type, exc_value, traceback)
+        if not self._outermost:
+            return False
+        _profilers['active'] = False
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(_profilers['cprofile'])
+        if self._tracing:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(_profilers['tracemalloc'], 'w') as f:
+                f.write('{0}: current {1} B, peak {2} B\n\n'.format(self._scope, current, peak))
+                for stat in snapshot.statistics('traceback')[:25]:
+                    f.write('{}\n'.format(stat))
+                    for line in stat.traceback.format():
+                        f.write('{}\n'.format(line))
+            record('tracemalloc', self._scope, 0., peak_memory=peak, **self._labels)
+        for sink in list(_sinks):
+            if hasattr(sink, 'flush'):
+                sink.flush()
+        return False
+
+
+def enable_profilers(cprofile=None, tracemalloc=None):
+    """ Profiles the Python side of the next builds.
+
+    Only the thread running the build is seen by cProfile: with ``jobs`` greater than 1, the translations run by the
+    worker threads of :func:`modfmu.fmu_translator.translate_package` are not profiled.
+
+    :param cprofile: path of the ``pstats`` file written at the end of each build, or None
+    :param tracemalloc: path of the text file listing the largest memory allocations of each build, or None
+    """
+    _profilers['cprofile'] = cprofile
+    _profilers['tracemalloc'] = tracemalloc
+
+
+def disable_profilers():
+    enable_profilers(None, None)
+
+
+def run_in_context(function):
+    """ Wraps a function so that it runs with the labels of the calling context, e.g. in a thread pool
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return run
+
+
+class CallbackSink(object):
+    """Sink calling a function with each event
+    """
+
+    def __init__(self, callback):
+        self._callback = callback
+
+    def emit(self, event):
+        self._callback(event)
+
+
+class JsonLinesSink(object):
+    """Sink appending each event to a JSON lines file
+    """
+
+    def __init__(self, path):
+        import threading
+
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def emit(self, event):
+        import json
+
+        line = json.dumps(event) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusSink(object):
+    """Sink aggregating the events per phase and scope, written in the Prometheus text format, e.g. for the textfile
+    collector of the node exporter.
+
+    The file is written when the sink is flushed (at the end of each build), and at most every ``interval`` seconds
+    in between.
+    """
+
+    def __init__(self, path, interval=10., prefix='modfmu'):
+        import threading
+        import time
+
+        self._path = path
+        self._interval = interval
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._metrics = dict()  # (phase, scope) -> [count, total seconds, max seconds]
+        self._written = time.monotonic()
+
+    def emit(self, event):
+        import time
+
+        with self._lock:
+            m = self._metrics.setdefault((event['phase'], event['scope']), [0, 0., 0.])
+            m[0] += 1
+            m[1] += event['duration']
+            m[2] = max(m[2], event['duration'])
+            due = time.monotonic() - self._written >= self._interval
+        if due:
+            self.flush()
+
+    def _text(self):
+        lines = list()
+        for name, kind, index, help_text in (('phase_seconds_total', 'counter', 1, 'Time spent in each phase'),
+                                             ('phase_count_total', 'counter', 0, 'Number of runs of each phase'),
+                                             ('phase_seconds_max', 'gauge', 2, 'Longest run of each phase')):
+            lines.append('# HELP {0}_{1} {2}'.format(self._prefix, name, help_text))
+            lines.append('# TYPE {0}_{1} {2}'.format(self._prefix, name, kind))
+            for (phase_name, scope), m in sorted(self._metrics.items()):
+                lines.append('{0}_{1}{{phase="{2}",scope="{3}"}} {4}'.format(self._prefix, name, phase_name, scope,
+                                                                             repr(float(m[index])) if index else m[index]))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        import os
+        import time
+
+        with self._lock:
+            text = self._text()
+            self._written = time.monotonic()
+            tmp = '{}.{}.tmp'.format(self._path, os.getpid())
+            with open(tmp, 'w') as f:
+                f.write(text)
+            os.replace(tmp, self._path)
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Repacking of the translated FMUs: removal of the entries the simulations do not need, and recompression.
+
+The FMUs written by the translators carry binaries for every platform they were built for, their C sources and
+documentation, compressed at the level chosen by the tool. :func:`repack_fmu` rewrites an FMU without the entries
+dropped by a :class:`RepackPolicy`, recompressing its members in parallel, then checks the new archive before it
+replaces the original one.
+
+Usage:
+    >>> policy = RepackPolicy(platforms=[host_platform()], level=9)
+    >>> repack_fmu('FMUs/MyModel/MyModel.fmu', policy)
+
+or ``translate_package(pck, repack=policy)`` to repack each FMU after its translation.
+
+The members are read and compressed by chunks, each one spooled to a temporary file once it is large, so that the
+memory used does not depend on the size of the FMU.
+"""
+
+import zlib
+
+_chunk_size = 1024 ** 2
+# compressed members larger than this are spooled to disk while waiting to be written
+_spool_size = 8 * 1024 ** 2
+_zip64_limit = 0xFFFFFFFF
+
+_local_header = '<IHHHHHIIIHH'
+_central_header = '<IHHHHHHIIIHHHHHII'
+_end_of_central_directory = '<IHHHHIIH'
+
+
+class RepackError(Exception):
+    """Raised when an FMU cannot be repacked. The original FMU is left untouched.
+    """
+
+
+def host_platform():
+    """ Name of the directory of the binaries of the current platform in an FMU, e.g. ``'linux64'``
+    """
+    import struct
+    import sys
+
+    bits = 8 * struct.calcsize('P')
+    if sys.platform.startswith('win'):
+        return 'win{}'.format(bits)
+    if sys.platform == 'darwin':
+        return 'darwin{}'.format(bits)
+    return 'linux{}'.format(bits)
+
+
+class RepackPolicy(object):
+    """What is kept in the FMUs, and how they are compressed.
+
+    ``modelDescription.xml`` and the resources are always kept.
+    """
+
+    def __init__(self, platforms=None, keep_sources=None, keep_documentation=False, level=6, jobs=None, verify=True):
+        """
+
+        :param platforms: directories of ``binaries/`` that are kept, e.g. ``['linux64', 'win64']``. None keeps all
+            of them.
+        :param keep_sources: True to keep ``sources/``. If None, the sources are kept if the translator was asked to
+            include them (``FMUTranslator._include_src``).
+        :param keep_documentation: True to keep ``documentation/``
+        :param level: zlib compression level of the members, from 0 (stored) to 9
+        :param jobs: number of members compressed at once. Defaults to the number of CPUs.
+        :param verify: if True, the new FMU is read back and its checksums checked before it replaces the original one
+        """
+        if not 0 <= level <= 9:
+            raise ValueError('level must be between 0 and 9. Got {} instead'.format(level))
+        self.platforms = list(platforms) if platforms is not None else None
+        self.keep_sources = keep_sources
+        self.keep_documentation = keep_documentation
+        self.level = level
+        self.jobs = jobs
+        self.verify = verify
+
+    def keep(self, name, include_sources=False):
+        """ True if the entry ``name`` of an FMU is kept
+
+        :param include_sources: whether the translator was asked to include the sources, used when ``keep_sources``
+            is None
+        """
+        parts = name.split('/')
+        if parts[0] == 'binaries' and len(parts) > 2 and self.platforms is not None:
+            return parts[1] in self.platforms
+        if parts[0] == 'sources' and len(parts) > 1:
+            return self.keep_sources if self.keep_sources is not None else include_sources
+        if parts[0] == 'documentation' and len(parts) > 1:
+            return self.keep_documentation
+        return True
+
+    def to_dict(self):
+        return {'platforms': self.platforms, 'keep_sources': self.keep_sources,
+                'keep_documentation': self.keep_documentation, 'level': self.level, 'jobs': self.jobs,
+                'verify': self.verify}
+
+    def key(self):
+        """ String identifying the content of the FMUs repacked with this policy, e.g. for the FMU cache
+        """
+        return 'platforms={0};sources={1};documentation={2};level={3}'.format(
+            ','.join(sorted(self.platforms)) if self.platforms is not None else '*', self.keep_sources,
+            self.keep_documentation, self.level)
+
+    def __repr__(self):
+        return 'RepackPolicy({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.to_dict().items()))
+
+
+class RepackResult(object):
+    """Outcome of the repacking of an FMU.
+    """
+
+    def __init__(self, fmu_path, size_before, size_after, removed, duration):
+        """
+
+        :param removed: names of the entries that were dropped
+        :param duration: duration of the repacking, in seconds
+        """
+        self.fmu_path = fmu_path
+        self.size_before = size_before
+        self.size_after = size_after
+        self.removed = removed
+        self.duration = duration
+
+    def __repr__(self):
+        return 'RepackResult({!r}, {} -> {} bytes, {} entries removed)'.format(
+            self.fmu_path, self.size_before, self.size_after, len(self.removed))
+
+    def to_dict(self):
+        return {'fmu_path': self.fmu_path, 'size_before': self.size_before, 'size_after': self.size_after,
+                'removed': self.removed, 'duration': self.duration}
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (max(year, 1980) - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+def _compress_member(source, info, level):
+    """ Reads a member of an FMU and compresses it
+
+    :param source: function returning the ``zipfile.ZipFile`` of the FMU opened by the current thread
+    :return: tuple ``(method, crc, size, compressed file)``. The compressed file is positioned at its end.
+    """
+    import shutil
+    import tempfile
+    import zipfile
+
+    out = tempfile.SpooledTemporaryFile(max_size=_spool_size)
+    if info.is_dir():
+        return zipfile.ZIP_STORED, 0, 0, out
+
+    crc, size = 0, 0
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if level > 0 else None
+    with source().open(info) as f:
+        while True:
+            chunk = f.read(_chunk_size)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            out.write(compressor.compress(chunk) if compressor is not None else chunk)
+    if compressor is None:
+        return zipfile.ZIP_STORED, crc, size, out
+    out.write(compressor.flush())
+    if out.tell() < size:
+        return zipfile.ZIP_DEFLATED, crc, size, out
+
+    # members that do not shrink, e.g. already compressed resources, are stored
+    out.seek(0)
+    out.truncate()
+    with source().open(info) as f:
+        shutil.copyfileobj(f, out, _chunk_size)
+    return zipfile.ZIP_STORED, crc, size, out
+
+
+def _write_member(f, info, method, crc, size, data):
+    """ Writes the local header and the data of a member
+
+    :return: the central directory record of the member
+    """
+    import shutil
+    import struct
+
+    name = info.filename.encode('utf-8')
+    flags = 0x800 if any(c > 127 for c in name) else 0  # UTF-8 names
+    date, time = _dos_date_time(info.date_time)
+    compressed = data.tell()
+    offset = f.tell()
+    if max(size, compressed, offset) >= _zip64_limit:
+        raise RepackError('{} is too large to be repacked'.format(info.filename))
+
+    f.write(struct.pack(_local_header, 0x04034b50, 20, flags, method, time, date, crc, compressed, size, len(name), 0))
+    f.write(name)
+    data.seek(0)
+    shutil.copyfileobj(data, f, _chunk_size)
+    data.close()
+    return struct.pack(_central_header, 0x02014b50, 20, 20, flags, method, time, date, crc, compressed, size,
+                       len(name), 0, 0, 0, 0, info.external_attr, offset) + name
+
+
+def _verify(path, expected):
+    """ Reads back a repacked FMU and compares its members with the ones of the original FMU
+
+    :param expected: ``zipfile.ZipInfo`` of the members that were kept
+    """
+    import zipfile
+
+    try:
+        with zipfile.ZipFile(path) as z:
+            infos = z.infolist()
+            if [(i.filename, i.CRC, i.file_size) for i in infos] != \
+                    [(i.filename, i.CRC, i.file_size) for i in expected]:
+                raise RepackError('the members of {} differ from the original ones'.format(path))
+            bad = z.testzip()
+    except zipfile.BadZipFile as e:
+        raise RepackError('{0} is not a valid zip file: {1}'.format(path, e))
+    if bad is not None:
+        raise RepackError('{0} has a corrupted member: {1}'.format(path, bad))
+
+
+def repack_fmu(fmu_path, policy=None, include_sources=False, output_path=None):
+    """ Rewrites an FMU without the entries dropped by ``policy``, its members being recompressed in parallel
+
+    :param fmu_path: path of the FMU
+    :param policy: :class:`RepackPolicy`. Defaults to ``RepackPolicy()``, which only drops the sources and the
+        documentation.
+    :param include_sources: whether the translator was asked to include the sources, see
+        :attr:`RepackPolicy.keep_sources`
+    :param output_path: path of the repacked FMU. Defaults to ``fmu_path``, which is replaced once the repacked FMU
+        is verified.
+    :return: a :class:`RepackResult`
+    :raises RepackError: if the FMU cannot be repacked, e.g. if no binaries are left for the kept platforms. The
+        original FMU is left untouched.
+    """
+    import os
+    import struct
+    import threading
+    import time
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    start = time.monotonic()
+    policy = policy or RepackPolicy()
+    output_path = output_path or fmu_path
+    size_before = os.path.getsize(fmu_path)
+
+    try:
+        with zipfile.ZipFile(fmu_path) as z:
+            infos = z.infolist()
+    except zipfile.BadZipFile as e:
+        raise RepackError('{0} is not a valid zip file: {1}'.format(fmu_path, e))
+    kept = [i for i in infos if policy.keep(i.filename, include_sources)]
+    names = set(i.filename for i in kept)
+    removed = [i.filename for i in infos if i.filename not in names]
+    if 'modelDescription.xml' not in names:
+        raise RepackError('{} has no modelDescription.xml'.format(fmu_path))
+    binaries = [i.filename for i in infos if i.filename.startswith('binaries/') and not i.is_dir()]
+    if binaries and not names.intersection(binaries) and not any(n.startswith('sources/') for n in names):
+        raise RepackError('{0} has no binaries for the platforms {1}, nor sources'.format(fmu_path, policy.platforms))
+    if len(kept) >= 0xFFFF:
+        raise RepackError('{} has too many members to be repacked'.format(fmu_path))
+
+    # each thread reads the FMU through its own file object
+    local = threading.local()
+    readers = list()
+    lock = threading.Lock()
+
+    def source():
+        if not hasattr(local, 'zip'):
+            local.zip = zipfile.ZipFile(fmu_path)
+            with lock:
+                readers.append(local.zip)
+        return local.zip
+
+    tmp = '{}.{}.repack'.format(output_path, os.getpid())
+    jobs = policy.jobs or os.cpu_count() or 1
+    try:
+        with open(tmp, 'wb') as f, ThreadPoolExecutor(max_workers=jobs) as executor:
+            central = list()
+            # members are compressed ahead of the one being written, at most 2 per thread
+            pending = list()
+            for info in kept:
+                pending.append((info, executor.submit(_compress_member, source, info, policy.level)))
+                if len(pending) >= 2 * jobs:
+                    info, future = pending.pop(0)
+                    central.append(_write_member(f, info, *future.result()))
+            for info, future in pending:
+                central.append(_write_member(f, info, *future.result()))
+
+            offset = f.tell()
+            for record in central:
+                f.write(record)
+            size = f.tell() - offset
+            if offset + size >= _zip64_limit:
+                raise RepackError('{} is too large to be repacked'.format(fmu_path))
+            f.write(struct.pack(_end_of_central_directory, 0x06054b50, 0, 0, len(central), len(central), size, offset, 0))
+        for r in readers:
+            r.close()
+        if policy.verify:
+            _verify(tmp, kept)
+        os.replace(tmp, output_path)
+    except BaseException:
+        for r in readers:
+            r.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    return RepackResult(output_path, size_before, os.path.getsize(output_path), removed, time.monotonic() - start)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Removes the entries the simulations do not need from FMUs, and '
+                                                 'recompresses them.')
+    parser.add_argument('fmus', nargs='+', help='FMUs to repack, in place')
+    parser.add_argument('--platforms', nargs='+', default=None, help='platforms whose binaries are kept. Default: all')
+    parser.add_argument('--keep-sources', action='store_true')
+    parser.add_argument('--keep-documentation', action='store_true')
+    parser.add_argument('--level', type=int, default=9, help='zlib compression level')
+    parser.add_argument('--jobs', type=int, default=None, help='members compressed at once')
+    args = parser.parse_args()
+
+    policy = RepackPolicy(platforms=args.platforms, keep_sources=args.keep_sources,
+                          keep_documentation=args.keep_documentation, level=args.level, jobs=args.jobs)
+    status = 0
+    for fmu in args.fmus:
+        try:
+            print(repack_fmu(fmu, policy))
+        except RepackError as e:
+            print(e, file=sys.stderr)
+            status = 1
+    sys.exit(status)
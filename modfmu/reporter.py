@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Reporter writing the messages of the builds from a background thread.
+
+:class:`QueuedReporter` has the methods of the ``buildingspy`` reporter used by the translators (``writeOutput``,
+``writeWarning``, ``writeError``, ``getNumberOfErrors`` and ``getNumberOfWarnings``), so that it can be given
+wherever a reporter is expected. The messages are put in a bounded queue and written in batches by a background
+thread, so that the threads of a parallel build do not wait for each other to write the log. Each message is a
+record holding its time, level, thread and the labels of the job it belongs to (model, FMU, package, see
+:mod:`modfmu.profiling`), written as text or as JSON lines. The log file is rotated once it reaches ``max_bytes``.
+
+Usage:
+    >>> report = QueuedReporter('build.log', max_bytes=50 * 1024 ** 2, policy='drop')
+    >>> report.writeOutput('translating', phase='translation')
+    >>> report.close()
+
+:class:`Reporter` writes its messages at once, the way the ``buildingspy`` reporter does, without requiring
+``buildingspy``. It is the default reporter of the translators and importers.
+"""
+
+_levels = {'output': '', 'warning': '*** Warning: ', 'error': '*** Error: '}
+_stop = object()
+
+
+class Reporter(object):
+    """Reporter writing each message to the log file, and to the standard output (output messages) or the standard
+    error (warnings and errors), as the ``buildingspy`` reporter does.
+
+    Thread safe.
+    """
+
+    def __init__(self, fileName='modfmu.log'):
+        """
+
+        :param fileName: path of the log file, removed if it exists
+        """
+        import threading
+
+        self._logFil = fileName
+        self._lock = threading.Lock()
+        self._iWar = 0
+        self._iErr = 0
+        self.deleteLogFile()
+
+    @property
+    def path(self):
+        return self._logFil
+
+    def deleteLogFile(self):
+        """ Removes the log file if it exists
+        """
+        import os
+
+        try:
+            os.remove(self._logFil)
+        except FileNotFoundError:
+            pass
+
+    def getNumberOfErrors(self):
+        return self._iErr
+
+    def getNumberOfWarnings(self):
+        return self._iWar
+
+    def writeOutput(self, message):
+        import sys
+        self._write(sys.stdout, _levels['output'] + message)
+
+    def writeWarning(self, message):
+        import sys
+        with self._lock:
+            self._iWar += 1
+        self._write(sys.stderr, _levels['warning'] + message)
+
+    def writeError(self, message):
+        import sys
+        with self._lock:
+            self._iErr += 1
+        self._write(sys.stderr, _levels['error'] + message)
+
+    def _write(self, stream, message):
+        with self._lock:
+            with open(self._logFil, 'a', encoding='utf-8') as f:
+                f.write(message + '\n')
+        stream.write(message + '\n')
+
+
+class QueuedReporter(object):
+    """Reporter writing its records from a background thread, through a bounded queue.
+
+    When the queue is full, ``policy='block'`` makes the caller wait for room, while ``policy='drop'`` drops the
+    output messages; warnings and errors are never dropped. The number of dropped messages is written to the log.
+
+    Thread safe.
+    """
+
+    def __init__(self, fileName='modfmu.log', max_queue=10000, policy='block', max_bytes=10 * 1024 ** 2,
+                 backup_count=5, batch_size=1000, json=False, reset=False):
+        """
+
+        :param fileName: path of the log file, appended to unless ``reset`` is True
+        :param max_queue: maximum number of records waiting to be written
+        :param policy: ``'block'`` or ``'drop'``, what to do with an output message when the queue is full
+        :param max_bytes: size at which the log file is rotated, or None to let it grow. ``<fileName>.1`` is the
+            most recent of the ``backup_count`` previous files.
+        :param backup_count: number of previous files kept
+        :param batch_size: maximum number of records written between two flushes of the file
+        :param json: if True, the records are written as JSON lines instead of text
+        :param reset: if True, the log file is removed if it exists, e.g. at the start of a build
+        """
+        import atexit
+        import os
+        import queue
+        import threading
+
+        if policy not in ('block', 'drop'):
+            raise ValueError("policy must be 'block' or 'drop'. Got {} instead".format(policy))
+        self._logFil = fileName
+        if reset:
+            try:
+                os.remove(fileName)
+            except FileNotFoundError:
+                pass
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._policy = policy
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._batch_size = batch_size
+        self._json = json
+        self._lock = threading.Lock()
+        self._enqueued = threading.Condition(self._lock)
+        self._putting = 0  # items being put in the queue, waited for by close
+        self._counts = {'output': 0, 'warning': 0, 'error': 0, 'dropped': 0}
+        self._unreported_drops = 0
+        self._file = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='modfmu-reporter', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def path(self):
+        return self._logFil
+
+    def stats(self):
+        """ Number of records of each level, and of dropped records
+        """
+        with self._lock:
+            stats = dict(self._counts)
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
+
+    def getNumberOfErrors(self):
+        return self._counts['error']
+
+    def getNumberOfWarnings(self):
+        return self._counts['warning']
+
+    def writeOutput(self, message, **fields):
+        """ Writes an output message
+
+        :param fields: fields of the record, e.g. ``job`` or ``phase``, added to the labels of the current job
+        """
+        self._put('output', message, fields)
+
+    def writeWarning(self, message, **fields):
+        self._put('warning', message, fields)
+
+    def writeError(self, message, **fields):
+        self._put('error', message, fields)
+
+    def _put(self, level, message, fields):
+        import queue
+        import threading
+        import time
+        from modfmu import profiling
+
+        record = profiling.labels()
+        record.update(fields)
+        record.update({'time': time.time(), 'level': level, 'message': message,
+                       'thread': threading.current_thread().name})
+        with self._lock:
+            self._counts[level] += 1
+        try:
+            queued = self._enqueue(record, block=level != 'output' or self._policy == 'block')
+        except queue.Full:
+            with self._lock:
+                self._counts['dropped'] += 1
+                self._unreported_drops += 1
+            return
+        if not queued:
+            # messages written once the reporter is closed, e.g. by a translator kept by the caller
+            with self._lock:
+                with open(self._logFil, 'a') as f:
+                    f.write(self._format(record))
+
+    def _enqueue(self, item, block=True):
+        """ Puts an item in the queue, unless the reporter is closed. :meth:`close` waits for the items being put, so
+        that none of them lands behind the end of the queue.
+
+        :return: False if the reporter is closed
+        :raises queue.Full: if ``block`` is False and the queue is full
+        """
+        with self._lock:
+            if self._closed:
+                return False
+            self._putting += 1
+        try:
+            if block:
+                self._queue.put(item)
+            else:
+                self._queue.put_nowait(item)
+        finally:
+            with self._lock:
+                self._putting -= 1
+                self._enqueued.notify_all()
+        return True
+
+    def _format(self, record):
+        import json
+        import time
+
+        if self._json:
+            return json.dumps(record, default=str) + '\n'
+        job = record.get('model') or record.get('fmu') or record.get('batch') or record.get('job')
+        return '{0}.{1:03d} {2}{3}{4}\n'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['time'])),
+                                                int(record['time'] * 1000) % 1000,
+                                                '[{}] '.format(job) if job else '', _levels[record['level']],
+                                                record['message'])
+
+    def _rotate(self):
+        """ Renames the log file to ``<fileName>.1``, shifting the previous ones, and opens a new one
+        """
+        import os
+
+        self._file.close()
+        for i in range(self._backup_count - 1, 0, -1):
+            if os.path.exists('{}.{}'.format(self._logFil, i)):
+                os.replace('{}.{}'.format(self._logFil, i), '{}.{}'.format(self._logFil, i + 1))
+        if self._backup_count > 0:
+            os.replace(self._logFil, '{}.1'.format(self._logFil))
+        else:
+            os.remove(self._logFil)
+        self._file = open(self._logFil, 'a')
+
+    def _run(self):
+        """ Writes the records of the queue by batches, until the reporter is closed
+        """
+        import queue
+        import time
+
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self._batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            lines = list()
+            events = list()
+            stop = False
+            for record in batch:
+                if record is _stop:
+                    stop = True
+                elif isinstance(record, dict):
+                    lines.append(self._format(record))
+                else:
+                    events.append(record)  # threading.Event of a flush
+            with self._lock:
+                drops, self._unreported_drops = self._unreported_drops, 0
+            if drops:
+                lines.append(self._format({'time': time.time(), 'level': 'warning', 'thread': 'modfmu-reporter',
+                                           'message': '{} output messages dropped, as the log queue was full'.format(drops)}))
+            if lines:
+                try:
+                    if self._file is None:
+                        self._file = open(self._logFil, 'a')
+                    self._file.writelines(lines)
+                    self._file.flush()
+                    if self._max_bytes is not None and self._file.tell() >= self._max_bytes:
+                        self._rotate()
+                except OSError:
+                    # the build goes on without its log rather than failing
+                    pass
+            for e in events:
+                e.set()
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+    def flush(self, timeout=None):
+        """ Waits until the records written so far are in the log file
+
+        :return: False if they are not written after ``timeout`` seconds
+        """
+        import threading
+
+        done = threading.Event()
+        if not self._enqueue(done):
+            return True
+        return done.wait(timeout)
+
+    def close(self):
+        """ Writes the records left, and stops the background thread
+        """
+        import atexit
+
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # the records being put are written before the thread stops, the thread making room for them
+            while self._putting:
+                self._enqueued.wait()
+        atexit.unregister(self.close)
+        self._queue.put(_stop)
+        self._thread.join()
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Admission of the translator processes according to the resources of the machine.
+
+An :class:`AdmissionController` decides when the next translator process may start: a process is admitted if the
+number of running processes is below the concurrency limit, if the available memory is enough for the memory
+estimate of the job, and if the CPU load is below ``max_load``. The limit grows by one job at a time while the
+machine has room for more, and is halved when the machine runs out of memory or swaps.
+
+:func:`modfmu.fmu_translator.run_mos` and :func:`modfmu.fmu_translator.run_mos_async` wait for their admission when a
+controller is in use, either installed for the whole process, or for the current context:
+
+    >>> from modfmu import scheduler
+    >>> scheduler.install(scheduler.AdmissionController(max_jobs=16))
+    >>> translate_package(pck, jobs=16)
+
+or ``translate_package(pck, jobs='auto')``, which uses the installed controller, or a new one.
+
+Free memory, swap activity and load are read from ``/proc`` (Linux). Elsewhere, processes are only admitted
+according to the concurrency limit.
+"""
+
+import contextvars
+
+_current = contextvars.ContextVar('modfmu_admission_controller', default=None)
+_installed = [None]
+
+# pages swapped in or out between two samples above which the machine is considered as swapping
+_swap_threshold = 1024
+
+
+def install(controller):
+    """ Uses ``controller`` for all the translator processes of this process. ``None`` removes it.
+    """
+    _installed[0] = controller
+
+
+def current():
+    """ :class:`AdmissionController` in use in the current context, or None
+    """
+    controller = _current.get()
+    return controller if controller is not None else _installed[0]
+
+
+def resolve_jobs(jobs):
+    """ Number of jobs of a build, and controller to use, for its ``jobs`` argument: an integer, or ``'auto'``
+    to use the controller in use, or a new :class:`AdmissionController`
+
+    :return: tuple ``(jobs, controller or None)``
+    """
+    if jobs != 'auto':
+        return jobs, None
+    controller = current() or AdmissionController()
+    return controller.max_jobs, controller
+
+
+class use(object):
+    """Context manager using a controller for the translator processes started in the current context, e.g. by a
+    build. Nothing changes if the controller is None.
+    """
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._token = None
+
+    def __enter__(self):
+        if self._controller is not None:
+            self._token = _current.set(self._controller)
+        return self._controller
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._token is not None:
+            _current.reset(self._token)
+        return False
+
+
+class admission(object):
+    """Context manager waiting for the admission of a translator process by the controller in use, if any.
+    Usable with ``with`` and ``async with``.
+
+    :param memory: memory estimate of the job, in bytes. Defaults to the estimate of the controller.
+    """
+
+    def __init__(self, memory=None):
+        self._memory = memory
+        self._controller = None
+        self._ticket = None
+
+    def __enter__(self):
+        self._controller = current()
+        if self._controller is not None:
+            self._ticket = self._controller.acquire(self._memory)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._ticket is not None:
+            self._controller.release(self._ticket)
+        return False
+
+    async def __aenter__(self):
+        self._controller = current()
+        if self._controller is not None:
+            self._ticket = await self._controller.acquire_async(self._memory)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return self.__exit__(exc_type, exc_value, traceback)
+
+
+def _read_proc(path):
+    """ Dictionary of the integer values of a ``/proc`` file made of ``name value`` lines, or None
+    """
+    try:
+        with open(path, 'r') as f:
+            values = dict()
+            for line in f:
+                fields = line.replace(':', ' ').split()
+                if len(fields) >= 2 and fields[1].isdigit():
+                    values[fields[0]] = int(fields[1])
+            return values
+    except OSError:
+        return None
+
+
+class AdmissionController(object):
+    """Admission of translator processes, with a concurrency limit adapted to the free memory and the load of the
+    machine (additive increase, multiplicative decrease). Processes are admitted in the order they asked for it.
+
+    Thread safe, and usable from several event loops.
+
+    :param max_jobs: maximum number of processes. Defaults to the number of CPUs.
+    :param min_jobs: number of processes always admitted, whatever the load of the machine
+    :param initial_jobs: concurrency limit at start. Defaults to ``min_jobs``.
+    :param job_memory: memory estimate of a job, in bytes. If None, the estimate is the largest resident memory of
+        the child processes of this process seen so far, 2 GiB before the first job ends.
+    :param memory_reserve: fraction of the total memory left free
+    :param max_load: maximum load average per CPU at which processes are admitted
+    :param warmup: time in seconds a process takes to reach its memory use. Until then, the memory estimate of the
+        process is deducted from the available memory. The limit is not decreased twice within this time either.
+    :param interval: time in seconds between two samples of the state of the machine
+    :param increase_interval: minimum time in seconds between two increases of the limit
+    :param reporter: ``buildingspy`` reporter to which the changes of the limit are written, or None
+    """
+
+    def __init__(self, max_jobs=None, min_jobs=1, initial_jobs=None, job_memory=None, memory_reserve=0.1, max_load=1.,
+                 warmup=30., interval=1., increase_interval=2., reporter=None):
+        import collections
+        import os
+        import threading
+
+        self.max_jobs = max_jobs if max_jobs is not None else os.cpu_count() or 1
+        if not 1 <= min_jobs <= self.max_jobs:
+            raise ValueError('min_jobs must be between 1 and max_jobs. Got {} instead'.format(min_jobs))
+        self.min_jobs = min_jobs
+        self._limit = min(self.max_jobs, max(min_jobs, initial_jobs or min_jobs))
+        self._job_memory = job_memory
+        self._learned_memory = None
+        self._memory_reserve = memory_reserve
+        self._max_load = max_load
+        self._warmup = warmup
+        self._interval = interval
+        self._increase_interval = increase_interval
+        self._reporter = reporter
+
+        self._cond = threading.Condition()
+        self._queue = collections.deque()  # tickets waiting for their admission
+        self._jobs = dict()  # ticket -> (admission time, memory estimate)
+        self._sample_time = None
+        self._sample = {'memory_available': None, 'memory_total': None, 'swapping': False, 'load': None}
+        self._swapped = None
+        self._last_change = float('-inf')
+        self._counts = {'admitted': 0, 'increases': 0, 'decreases': 0}
+
+    @property
+    def limit(self):
+        """ Current concurrency limit
+        """
+        return self._limit
+
+    @property
+    def job_memory(self):
+        """ Memory estimate of a job, in bytes
+        """
+        if self._job_memory is not None:
+            return self._job_memory
+        return self._learned_memory or 2 * 1024 ** 3
+
+    def stats(self):
+        """ State of the controller: ``queue_depth`` (jobs waiting), ``running``, ``limit``, ``admitted``,
+        ``increases`` and ``decreases`` of the limit, and the last sample of the machine
+        """
+        with self._cond:
+            stats = {'queue_depth': len(self._queue), 'running': len(self._jobs), 'limit': self._limit,
+                     'job_memory': self.job_memory}
+            stats.update(self._counts)
+            stats.update(self._sample)
+            return stats
+
+    def _read_machine(self, now):
+        """ Samples the free memory, swap activity and load of the machine, at most every ``interval`` seconds
+        """
+        import os
+
+        if self._sample_time is not None and now - self._sample_time < self._interval:
+            return self._sample
+        self._sample_time = now
+        meminfo = _read_proc('/proc/meminfo')
+        if meminfo and 'MemAvailable' in meminfo:
+            self._sample['memory_available'] = meminfo['MemAvailable'] * 1024
+            self._sample['memory_total'] = meminfo['MemTotal'] * 1024
+        vmstat = _read_proc('/proc/vmstat')
+        if vmstat and 'pswpin' in vmstat:
+            swapped = vmstat['pswpin'] + vmstat.get('pswpout', 0)
+            self._sample['swapping'] = self._swapped is not None and swapped - self._swapped > _swap_threshold
+            self._swapped = swapped
+        try:
+            self._sample['load'] = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            pass
+        return self._sample
+
+    def _set_limit(self, limit, now, reason):
+        if self._reporter is not None:
+            self._reporter.writeOutput('Concurrency limit of the translators changed from {0} to {1}: {2}'.format(
+                self._limit, limit, reason))
+        self._counts['increases' if limit > self._limit else 'decreases'] += 1
+        self._limit = limit
+        self._last_change = now
+
+    def _try_admit(self, ticket, memory):
+        """ Admits the job of ``ticket`` if it is the first one in the queue and the machine has room for it.
+        Adapts the limit on the way. Called with the lock held.
+        """
+        import time
+
+        now = time.monotonic()
+        sample = self._read_machine(now)
+        running = len(self._jobs)
+
+        available = sample['memory_available']
+        reserve = self._memory_reserve * sample['memory_total'] if available is not None else 0
+        pressure = sample['swapping'] or (available is not None and available < reserve)
+        if available is not None:
+            # the jobs admitted recently do not use their memory yet
+            available -= sum(m for t, m in self._jobs.values() if now - t < self._warmup)
+        if pressure and self._limit > self.min_jobs and now - self._last_change >= self._warmup:
+            self._set_limit(max(self.min_jobs, self._limit // 2), now,
+                            'the machine swaps' if sample['swapping'] else 'not enough free memory')
+
+        if self._queue[0] is not ticket:
+            return False
+        room = (available is None or available - memory >= reserve) and \
+            (sample['load'] is None or sample['load'] < self._max_load)
+        if running >= self._limit and room and not pressure and self._limit < self.max_jobs and \
+                now - self._last_change >= self._increase_interval:
+            self._set_limit(self._limit + 1, now, 'the machine has room for more jobs')
+        if running >= self._limit or running >= self.min_jobs and not room:
+            return False
+
+        self._queue.popleft()
+        self._jobs[ticket] = (now, memory)
+        self._counts['admitted'] += 1
+        self._cond.notify_all()
+        return True
+
+    def _enqueue(self, memory):
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+        return ticket, memory if memory is not None else self.job_memory
+
+    def _cancel(self, ticket):
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+            self._cond.notify_all()
+
+    def _admitted(self, ticket, wait):
+        from modfmu import profiling
+
+        if profiling.enabled():
+            stats = self.stats()
+            profiling.record('admission_wait', 'AdmissionController', wait, queue_depth=stats['queue_depth'],
+                             running=stats['running'], limit=stats['limit'])
+        return ticket
+
+    def acquire(self, memory=None):
+        """ Waits until a job is admitted
+
+        :param memory: memory estimate of the job, in bytes. Defaults to :attr:`job_memory`.
+        :return: ticket of the job, to give to :meth:`release` when it ends
+        """
+        import time
+
+        start = time.monotonic()
+        ticket, memory = self._enqueue(memory)
+        try:
+            with self._cond:
+                while not self._try_admit(ticket, memory):
+                    self._cond.wait(self._interval)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+        return self._admitted(ticket, time.monotonic() - start)
+
+    async def acquire_async(self, memory=None):
+        """ Same as :meth:`acquire`, without blocking the event loop
+        """
+        import asyncio
+        import time
+
+        start = time.monotonic()
+        ticket, memory = self._enqueue(memory)
+        try:
+            while True:
+                with self._cond:
+                    if self._try_admit(ticket, memory):
+                        break
+                await asyncio.sleep(min(self._interval, 0.1))
+        except BaseException:
+            self._cancel(ticket)
+            raise
+        return self._admitted(ticket, time.monotonic() - start)
+
+    def release(self, ticket):
+        """ Ends a job admitted by :meth:`acquire`
+        """
+        with self._cond:
+            self._jobs.pop(ticket, None)
+            if self._job_memory is None:
+                try:
+                    import resource
+                    import sys
+                    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+                    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+                    if rss > 0:
+                        self._learned_memory = max(self._learned_memory or 0, rss)
+                except ImportError:
+                    pass
+            self._cond.notify_all()
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter variants of a model.
+
+A modifier such as ``(k=2, sub(p={1, 2}), redeclare package Medium = MyMedium)`` is split into its structural
+part, which needs a translation of its own, and its parameter-only part: the modifications giving a literal value
+to a parameter. Variants of a model that only differ by their parameters share a single translation; their FMU is
+a copy of the translated one, with the start values of the parameters rewritten in ``modelDescription.xml``.
+"""
+
+import re
+
+_literal = re.compile(r'^(?:[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|true|false|"(?:[^"\\]|\\.)*")$')
+_assignment = re.compile(r'^(\w+)\s*=\s*(.+)$', re.S)
+_modification = re.compile(r'^(\w+)\s*\((.*)\)$', re.S)
+_structural_prefixes = ('redeclare', 'final', 'each', 'replaceable', 'inner', 'outer')
+_attributes = ('start', 'fixed', 'min', 'max', 'nominal', 'unit', 'displayUnit', 'quantity', 'stateSelect')
+
+
+def _split_arguments(text):
+    """ Splits a comma separated list at top level, i.e. not inside parentheses, braces or strings
+    """
+    args = list()
+    depth = 0
+    start = 0
+    in_string = False
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if in_string:
+            if c == '\\':
+                i += 1
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in '({[':
+            depth += 1
+        elif c in ')}]':
+            depth -= 1
+            if depth < 0:
+                raise ValueError('Unbalanced parentheses in modifier "{}"'.format(text))
+        elif c == ',' and depth == 0:
+            args.append(text[start:i].strip())
+            start = i + 1
+        i += 1
+    if depth != 0 or in_string:
+        raise ValueError('Unbalanced parentheses or quotes in modifier "{}"'.format(text))
+    if text[start:].strip():
+        args.append(text[start:].strip())
+    return args
+
+
+def _parse_literal(value):
+    """ Python value of a Modelica literal, a list for a one dimensional array of literals, or None
+    """
+    value = value.strip()
+    if value.startswith('{') and value.endswith('}'):
+        items = [_parse_literal(v) for v in _split_arguments(value[1:-1])]
+        if not items or any(v is None or isinstance(v, list) for v in items):
+            return None
+        return items
+    if not _literal.match(value):
+        return None
+    if value in ('true', 'false'):
+        return value == 'true'
+    if value.startswith('"'):
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _split(arguments, prefix):
+    """ Splits the arguments of a modification into structural arguments and parameter values
+
+    :param prefix: name of the modified component followed by a dot, or an empty string at top level
+    """
+    structural = list()
+    parameters = dict()
+    for arg in arguments:
+        m = _assignment.match(arg)
+        if m and m.group(1) in _attributes:
+            # modification of the attributes of a variable, e.g. k(start=1, fixed=false): its other arguments
+            # belong to the same modification, which is kept as a whole
+            return list(arguments), dict()
+    for arg in arguments:
+        if arg.split(None, 1)[0] in _structural_prefixes:
+            structural.append(arg)
+            continue
+        m = _assignment.match(arg)
+        if m:
+            value = _parse_literal(m.group(2))
+            if value is None:
+                structural.append(arg)
+            elif isinstance(value, list):
+                for i, v in enumerate(value):
+                    parameters['{}{}[{}]'.format(prefix, m.group(1), i + 1)] = v
+            else:
+                parameters[prefix + m.group(1)] = value
+            continue
+        m = _modification.match(arg)
+        if m:
+            sub_structural, sub_parameters = _split(_split_arguments(m.group(2)), prefix + m.group(1) + '.')
+            if sub_structural:
+                structural.append('{}({})'.format(m.group(1), ', '.join(sub_structural)))
+            parameters.update(sub_parameters)
+            continue
+        # e.g. modification of an attribute and of the value at once: k(fixed=false)=2
+        structural.append(arg)
+    return structural, parameters
+
+
+def split_modifier(modifier):
+    """ Splits a modifier into its structural part and its parameter-only part.
+
+    Usage:
+        >>> split_modifier('(k=2, sub(p={1, 2}, redeclare model M = N))')
+        ('(sub(redeclare model M = N))', {'k': 2, 'sub.p[1]': 1, 'sub.p[2]': 2})
+
+    :param modifier: modifier of a model, as given to :class:`modfmu.fmu_translator.FMUTranslator`,
+        e.g. ``'(k=2)'``, or an empty string
+    :return: tuple ``(structural, parameters)`` where ``structural`` is the modifier without the parameter-only
+        modifications (an empty string if none is left) and ``parameters`` maps the name of each scalar parameter
+        to its value
+    """
+    modifier = modifier.strip()
+    if not modifier:
+        return '', dict()
+    if not (modifier.startswith('(') and modifier.endswith(')')):
+        raise ValueError('A modifier must be enclosed in parentheses. Got "{}" instead'.format(modifier))
+    structural, parameters = _split(_split_arguments(modifier[1:-1]), '')
+    return '({})'.format(', '.join(structural)) if structural else '', parameters
+
+
+def group_variants(variants):
+    """ Groups variants by structural modifier, in the order they are given.
+
+    :param variants: dictionary mapping the name of each variant to its modifier
+    :return: list of tuples ``(structural, [(name, parameters), ...])``
+    """
+    groups = dict()
+    for name, modifier in variants.items():
+        structural, parameters = split_modifier(modifier)
+        groups.setdefault(structural, list()).append((name, parameters))
+    return list(groups.items())
+
+
+def _format_start(value, type_tag):
+    if type_tag == 'Boolean':
+        if not isinstance(value, bool):
+            raise ValueError('{!r} is not a Boolean value'.format(value))
+        return 'true' if value else 'false'
+    if type_tag == 'Integer':
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError('{!r} is not an Integer value'.format(value))
+        return str(value)
+    if type_tag == 'Real':
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError('{!r} is not a Real value'.format(value))
+        return repr(float(value))
+    if type_tag == 'String':
+        if not isinstance(value, str):
+            raise ValueError('{!r} is not a String value'.format(value))
+        return value
+    raise ValueError('Start values of type {} cannot be rewritten'.format(type_tag))
+
+
+def _settable_variables(root):
+    """ Variables of a model description whose start value is used at instantiation: name -> type element
+    """
+    variables = dict()
+    fmi1 = root.get('fmiVersion', '').startswith('1')
+    for sv in root.iter('ScalarVariable'):
+        if fmi1:
+            settable = sv.get('variability') == 'parameter' and sv.get('causality', 'internal') in ('internal', 'input')
+        else:
+            settable = sv.get('causality') == 'parameter' and sv.get('variability', 'continuous') in ('fixed', 'tunable')
+        if settable and len(sv):
+            variables[sv.get('name')] = sv[0]
+    return variables
+
+
+def missing_parameters(fmu_path, parameters):
+    """ Parameters whose start value cannot be rewritten in a FMU: absent from its model description (e.g. evaluated
+    during the translation), or not settable at instantiation.
+
+    :param fmu_path: path of the FMU
+    :param parameters: dictionary mapping parameter names to values
+    :return: list of the names of these parameters
+    """
+    import xml.etree.ElementTree as ET
+    import zipfile
+
+    with zipfile.ZipFile(fmu_path) as z:
+        root = ET.fromstring(z.read('modelDescription.xml'))
+    variables = _settable_variables(root)
+    missing = list()
+    for name, value in parameters.items():
+        if name not in variables:
+            missing.append(name)
+            continue
+        try:
+            _format_start(value, variables[name].tag)
+        except ValueError:
+            missing.append(name)
+    return missing
+
+
+def fmi_version(fmu_path):
+    """ FMI version of a FMU, e.g. ``'2.0'``
+    """
+    import xml.etree.ElementTree as ET
+    import zipfile
+
+    with zipfile.ZipFile(fmu_path) as z:
+        return ET.fromstring(z.read('modelDescription.xml')).get('fmiVersion', '')
+
+
+def write_variant(fmu_path, variant_path, parameters, model_identifier=None):
+    """ Writes a copy of a FMU with new start values for some of its parameters.
+
+    The binaries are left untouched, so the GUID of the FMU is kept. With ``model_identifier`` set, the shared
+    libraries of the FMU are renamed, so that several variants can be imported side by side.
+
+    :param fmu_path: path of the translated FMU
+    :param variant_path: path of the FMU to write, which may be ``fmu_path`` itself
+    :param parameters: dictionary mapping parameter names to values
+    :param model_identifier: new model identifier of the FMU, if any
+    :raises ValueError: if a model identifier is given for a FMI 1 FMU, whose shared libraries export functions
+        prefixed by the model identifier and cannot be renamed
+    """
+    import os
+    import shutil
+    import xml.etree.ElementTree as ET
+    import zipfile
+
+    with zipfile.ZipFile(fmu_path) as zin:
+        root = ET.fromstring(zin.read('modelDescription.xml'))
+        variables = _settable_variables(root)
+        for name, value in parameters.items():
+            if name not in variables:
+                raise ValueError('Parameter {} cannot be set in {}'.format(name, fmu_path))
+            variables[name].set('start', _format_start(value, variables[name].tag))
+
+        renamed = dict()
+        if model_identifier is not None and root.get('fmiVersion', '').startswith('1'):
+            raise ValueError('The model identifier of {} cannot be changed: the functions of a FMI 1 FMU are '
+                             'prefixed by its model identifier'.format(fmu_path))
+        if model_identifier is not None:
+            # FMI 1 stores the model identifier in the root element, FMI 2 in the CoSimulation and ModelExchange ones
+            old_identifiers = set()
+            for e in [root] + list(root):
+                if e.get('modelIdentifier'):
+                    old_identifiers.add(e.get('modelIdentifier'))
+                    e.set('modelIdentifier', model_identifier)
+            for info in zin.infolist():
+                parts = info.filename.split('/')
+                if parts[0] == 'binaries' and os.path.splitext(parts[-1])[0] in old_identifiers:
+                    parts[-1] = model_identifier + os.path.splitext(parts[-1])[1]
+                    renamed[info.filename] = '/'.join(parts)
+
+        tmp = '{}.{}.tmp'.format(variant_path, os.getpid())
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename == 'modelDescription.xml':
+                    zout.writestr(info, ET.tostring(root, encoding='UTF-8', xml_declaration=True))
+                    continue
+                out_info = zipfile.ZipInfo(renamed.get(info.filename, info.filename), date_time=info.date_time)
+                out_info.compress_type = info.compress_type
+                out_info.external_attr = info.external_attr
+                with zin.open(info) as src, zout.open(out_info, 'w') as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp, variant_path)
+
+
+def write_parameter_set(path, model_name, fmu_path, parameters):
+    """ Writes the parameters of a variant as JSON, to be applied to the FMU at instantiation
+
+    :param path: path of the JSON file
+    :param model_name: modelica name of the variant
+    :param fmu_path: FMU the parameters apply to
+    :param parameters: dictionary mapping parameter names to values
+    """
+    import json
+    import xml.etree.ElementTree as ET
+    import zipfile
+
+    with zipfile.ZipFile(fmu_path) as z:
+        guid = ET.fromstring(z.read('modelDescription.xml')).get('guid')
+    with open(path, 'w') as f:
+        json.dump({'model_name': model_name, 'fmu_path': fmu_path, 'guid': guid, 'parameters': parameters}, f, indent=1)
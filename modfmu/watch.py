@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+"""
+Watch mode: the FMUs of a package are translated and imported again as the Modelica files of the library change.
+
+The library is watched with inotify (Linux), or by polling the modification times of its files elsewhere. The
+changes are debounced, mapped to the models of the package depending on the changed files (see
+:class:`modfmu.dependencies.DependencyGraph`), and only these models are translated and imported again. A model
+whose files change again while it is translated is stopped and translated again with the new files. Models whose
+dependencies did not change since their last successful translation are skipped, see
+:class:`modfmu.dependencies.BuildState`.
+
+Usage:
+    >>> watch_package(Package('/path/to/MyLib/Sub'))  # until interrupted
+
+or ``python -m modfmu.watch /path/to/MyLib/Sub``.
+"""
+
+# inotify constants, see inotify(7)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_watch_mask = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+
+
+def _is_watched_dir(name):
+    # hidden directories, e.g. .git, do not hold the Modelica files of the library
+    return not name.startswith('.')
+
+
+class _InotifyWatcher(object):
+    """Changes of the ``.mo`` files of a directory tree, through inotify.
+    """
+    kind = 'inotify'
+
+    def __init__(self, root, exclude=()):
+        """
+
+        :param root: directory to watch, with its sub directories
+        :param exclude: directories not to watch
+        :raises OSError: if inotify is not available, or if there are not enough inotify watches left
+        """
+        import ctypes
+        import ctypes.util
+        import os
+
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            init = self._libc.inotify_init1
+        except (OSError, AttributeError):
+            raise OSError('inotify is not available')
+        self._fd = init(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._exclude = set(os.path.realpath(e) for e in exclude)
+        self._dirs = dict()  # watch descriptor -> directory
+        try:
+            self._add_tree(os.path.realpath(root))
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, top):
+        """ Watches a directory and its sub directories
+
+        :return: the ``.mo`` files found in them
+        """
+        import ctypes
+        import errno
+        import os
+
+        files = set()
+        stack = [top]
+        while stack:
+            d = stack.pop()
+            if d in self._exclude:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d), _watch_mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # removed in the meantime
+                raise OSError(err, 'inotify_add_watch failed for {}'.format(d))
+            self._dirs[wd] = d
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            for e in entries:
+                if e.is_dir(follow_symlinks=False):
+                    if _is_watched_dir(e.name):
+                        stack.append(e.path)
+                elif e.name.endswith('.mo'):
+                    files.add(e.path)
+        return files
+
+    def wait(self, timeout):
+        """ Waits for changes
+
+        :param timeout: maximum time to wait, in seconds
+        :return: set of the ``.mo`` files that changed, empty if none changed within ``timeout``, or None if the
+            changes were lost, e.g. because the inotify queue overflowed
+        """
+        import os
+        import select
+        import struct
+
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self._fd, 1024 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        lost = False
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += 16 + length
+            if mask & _IN_Q_OVERFLOW:
+                lost = True
+                continue
+            d = self._dirs.get(wd)
+            if d is None:
+                continue
+            if mask & _IN_IGNORED:
+                del self._dirs[wd]
+                continue
+            path = os.path.join(d, name) if name else d
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO) and _is_watched_dir(name):
+                    # files created before the directory is watched are seen by the scan of the new directory
+                    try:
+                        changed.update(self._add_tree(path))
+                    except OSError:
+                        lost = True
+                elif mask & _IN_MOVED_FROM:
+                    # the files of the directory disappeared with it
+                    changed.add(path)
+            elif name.endswith('.mo'):
+                changed.add(path)
+        return None if lost else changed
+
+    def close(self):
+        import os
+
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class _PollingWatcher(object):
+    """Changes of the ``.mo`` files of a directory tree, found by comparing their modification times and sizes.
+    """
+    kind = 'polling'
+
+    def __init__(self, root, exclude=(), interval=1.):
+        """
+
+        :param root: directory to watch, with its sub directories
+        :param exclude: directories not to watch
+        :param interval: time between two scans of the tree, in seconds
+        """
+        import os
+
+        self._root = os.path.realpath(root)
+        self._exclude = set(os.path.realpath(e) for e in exclude)
+        self._interval = interval
+        self._files = self._snapshot()
+
+    def _snapshot(self):
+        """ Modification time and size of each ``.mo`` file of the tree
+        """
+        import os
+
+        files = dict()
+        stack = [self._root]
+        while stack:
+            d = stack.pop()
+            if d in self._exclude:
+                continue
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            for e in entries:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if _is_watched_dir(e.name):
+                            stack.append(e.path)
+                    elif e.name.endswith('.mo'):
+                        st = e.stat()
+                        files[e.path] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+        return files
+
+    def wait(self, timeout):
+        """ Waits for changes, see :meth:`_InotifyWatcher.wait`
+        """
+        import time
+
+        deadline = time.monotonic() + timeout
+        while True:
+            files = self._snapshot()
+            changed = set(p for p in files.keys() | self._files.keys() if files.get(p) != self._files.get(p))
+            self._files = files
+            left = deadline - time.monotonic()
+            if changed or left <= 0:
+                return changed
+            time.sleep(min(self._interval, left))
+
+    def close(self):
+        pass
+
+
+def _file_watcher(root, exclude=(), polling=False, poll_interval=1.):
+    """ inotify watcher of a directory tree, or a polling one if inotify is not available
+    """
+    if not polling:
+        try:
+            return _InotifyWatcher(root, exclude=exclude)
+        except OSError:
+            pass
+    return _PollingWatcher(root, exclude=exclude, interval=poll_interval)
+
+
+class PackageWatcher(object):
+    """Translation and import of the models of a package as their files change.
+
+    Each model is translated by its own translator process, up to ``jobs`` at once, and its FMU is imported once
+    translated. Its translation is stopped as soon as the files it depends on change again; the import of its FMU,
+    once started, is not, so that the FMU package is never left half modified.
+    """
+    _model_kinds = ('model', 'block')
+    # time between two checks of the end of the watch, in seconds
+    _wait_interval = 0.5
+
+    def __init__(self, pck, fmu_dir_name='FMUs', jobs=1, debounce=0.5, max_delay=10., polling=False,
+                 poll_interval=1., cache=None, reporter=None, on_result=None):
+        """
+
+        :param pck: package whose models are translated
+        :type pck: modfmu.modelica.Package
+        :param jobs: maximum number of translations running at once
+        :param debounce: time without changes after which the changes are taken into account, in seconds
+        :param max_delay: maximum time the changes are held back by the debounce, in seconds
+        :param polling: if True, the files are polled instead of being watched with inotify
+        :param poll_interval: time between two scans of the library when polling, in seconds
+        :param cache: :class:`modfmu.cache.FMUCache` in which FMUs are looked up and stored
+        :param reporter: reporter of the translations. Defaults to a :class:`modfmu.reporter.QueuedReporter`
+            writing ``package_fmu_translation.log``.
+        :param on_result: function called with the :class:`modfmu.fmu_translator.TranslationResult` of each
+            translation that went to its end
+        """
+        if jobs < 1:
+            raise ValueError('jobs must be a positive integer. Got {} instead'.format(jobs))
+        self.pck = pck
+        self.fmu_dir_name = fmu_dir_name
+        self.jobs = jobs
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.polling = polling
+        self.poll_interval = poll_interval
+        self.cache = cache
+        self.on_result = on_result
+        self._report = reporter
+        self._graph = None
+        self._jobs = dict()  # modelica name -> asyncio task of its translation and import
+        self._digests = dict()  # modelica name -> dependencies digest of its last translation task
+
+    def model_name(self, model_file):
+        import os
+        return '.'.join([self.pck._modelica_name, os.path.splitext(model_file)[0]])
+
+    async def run(self):
+        """ Translates the models of the package that are not up to date, then the ones depending on the files that
+        change, until the task is cancelled. The running translations are then stopped.
+        """
+        import asyncio
+        import os
+        from concurrent.futures import ThreadPoolExecutor
+        from modfmu.dependencies import BuildState
+        from modfmu.fmu_translator import _is_reporter
+        from modfmu.modelica import Package
+        from modfmu.reporter import QueuedReporter
+
+        pck = self.pck
+        own_report = not _is_reporter(self._report)
+        if own_report:
+            self._report = QueuedReporter(os.path.join(pck.path, "package_fmu_translation.log"), reset=True)
+        pck.add_subpackage(self.fmu_dir_name, order='first')
+        fmu_dir = os.path.join(pck.path, self.fmu_dir_name)
+        self._fmu_pck = Package(fmu_dir)
+        self._state = BuildState(fmu_dir)
+        self._slots = asyncio.Semaphore(self.jobs)
+        self._import_lock = asyncio.Lock()
+
+        # the imported FMUs are written in the FMU package, which is not watched
+        watcher = _file_watcher(pck.adam, exclude=[fmu_dir], polling=self.polling, poll_interval=self.poll_interval)
+        self._report.writeOutput('watching the files of {0} ({1})'.format(pck.adam, watcher.kind))
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            self._schedule(None, await loop.run_in_executor(executor, self._update_graph, None))
+            while True:
+                changed = await loop.run_in_executor(executor, watcher.wait, self._wait_interval)
+                if changed is not None and not changed:
+                    continue
+                # a burst of changes, e.g. the files written by a save all, is taken into account at once
+                first = loop.time()
+                while changed is not None and loop.time() - first < self.max_delay:
+                    more = await loop.run_in_executor(executor, watcher.wait, self.debounce)
+                    if more is None:
+                        changed = None
+                    elif not more:
+                        break
+                    else:
+                        changed |= more
+                # the library is read in the thread of the watcher, not to block the translations
+                self._schedule(changed, await loop.run_in_executor(executor, self._update_graph, changed))
+        finally:
+            jobs = [t for t in self._jobs.values() if not t.done()]
+            for t in jobs:
+                t.cancel()
+            if jobs:
+                await asyncio.wait(jobs)
+            executor.shutdown(wait=True)
+            watcher.close()
+            if own_report:
+                self._report.close()
+
+    def _update_graph(self, changed):
+        """ Refreshes the library index, and updates the dependency graph for the changed files
+
+        :param changed: paths of the changed files, or None if any file may have changed
+        :return: the new dependency graph
+        """
+        import os
+        from modfmu.dependencies import DependencyGraph
+
+        index = self.pck.index
+        index.refresh()
+        if changed is None or self._graph is None:
+            return DependencyGraph.from_package(self.pck)
+        files = index.files()
+        changed = self._with_removed_files(changed)
+        return self._graph.updated(files, changed, index.parse_files(f for f in files if os.path.realpath(f) in changed))
+
+    def _with_removed_files(self, changed):
+        """ The changed files, with the files of the directories that were removed
+        """
+        import os
+
+        removed = tuple(p + os.path.sep for p in changed if not p.endswith('.mo'))
+        if not removed:
+            return set(changed)
+        return set(changed) | set(f for f in self._graph.files if f.startswith(removed))
+
+    def _schedule(self, changed, graph):
+        """ Starts the translation of the models depending on the changed files, stopping the ones running with
+        previous versions of these files
+
+        :param changed: paths of the changed files, or None if any file may have changed
+        :param graph: dependency graph of the library with the changed files, see :meth:`_update_graph`
+        """
+        import asyncio
+        import os
+        from modfmu.fmu_translator import _package_model_files
+
+        pck = self.pck
+        model_files, _ = _package_model_files(pck, self._model_kinds)
+        paths = {os.path.realpath(os.path.join(pck.path, m)): m for m in model_files}
+        if changed is None:
+            affected = set(paths)
+        else:
+            if self._graph is not None:
+                # the files of the directories that were removed
+                changed = self._with_removed_files(changed)
+            affected = graph.dependents(changed)
+            if self._graph is not None:
+                # the models depending on the files that were removed
+                affected |= self._graph.dependents(changed)
+        self._graph = graph
+
+        names = set(self.model_name(m) for m in model_files)
+        for name, job in list(self._jobs.items()):
+            if name not in names:
+                job.cancel()  # the model was removed
+                del self._jobs[name]
+
+        for path in sorted(affected & paths.keys(), key=lambda p: model_files.index(paths[p])):
+            m = paths[path]
+            name = self.model_name(m)
+            digest = graph.closure_digest(path)
+            job = self._jobs.get(name)
+            running = job is not None and not job.done()
+            if running and self._digests[name] == digest:
+                continue
+            if running:
+                self._report.writeOutput('{} changed during its translation, which is stopped'.format(name))
+                job.cancel()
+            if self._state.is_up_to_date(name, digest):
+                if running:
+                    self._jobs[name] = asyncio.ensure_future(self._rebuild(m, name, digest, graph.closure(path),
+                                                                           previous=job, translate=False))
+                continue
+            self._digests[name] = digest
+            self._jobs[name] = asyncio.ensure_future(self._rebuild(m, name, digest, graph.closure(path),
+                                                                   previous=job if running else None))
+
+    async def _rebuild(self, model_file, name, digest, source_files, previous=None, translate=True):
+        """ Translates a model and imports its FMU
+
+        :param previous: cancelled task of the model, waited for before the model is translated
+        :param translate: if False, only waits for ``previous``
+        :return: the :class:`modfmu.fmu_translator.TranslationResult` of the model
+        """
+        import asyncio
+        from modfmu.fmu_translator import FMUImport, _package_translator
+
+        if previous is not None:
+            await asyncio.wait([previous])
+        if not translate:
+            return None
+        async with self._slots:
+            self._report.writeOutput('translating {}'.format(name))
+            trans = _package_translator(self.pck, model_file, self._report, fmu_dir_name=self.fmu_dir_name,
+                                        cache=self.cache, source_files=source_files)
+            result = await trans.translate_fmu_async()
+            if result.success:
+                fmu_import = FMUImport(self._fmu_pck, trans.fmu_path, reporter=self._report)
+                task = asyncio.ensure_future(self._import(fmu_import))
+                try:
+                    result.import_result = await asyncio.shield(task)
+                except asyncio.CancelledError:
+                    # the import goes on, so that the FMU package is not left half modified
+                    await asyncio.wait([task])
+                    raise
+            else:
+                self._report.writeWarning('Something went wrong. check Dymola log file for more details.')
+
+        self._state.update(name, digest, result.fmu_path if result.success else None)
+        self._state.save()
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+    async def _import(self, fmu_import):
+        async with self._import_lock:
+            return await fmu_import.import_fmu_async()
+
+
+def watch_package(pck, fmu_dir_name='FMUs', jobs=1, debounce=0.5, polling=False, poll_interval=1., cache=None,
+                  reporter=None, on_result=None):
+    """
+    Keeps the FMUs of the models of a package up to date with the files of the library, until interrupted
+    (``KeyboardInterrupt``). See :class:`PackageWatcher` for the parameters.
+    """
+    import asyncio
+
+    watcher = PackageWatcher(pck, fmu_dir_name=fmu_dir_name, jobs=jobs, debounce=debounce, polling=polling,
+                             poll_interval=poll_interval, cache=cache, reporter=reporter, on_result=on_result)
+    try:
+        asyncio.run(watcher.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+    from modfmu.modelica import Package
+
+    parser = argparse.ArgumentParser(description='Translates and imports the models of a package again as the files '
+                                                 'of its library change.')
+    parser.add_argument('package', help='directory of the package')
+    parser.add_argument('--fmu-dir', default='FMUs', help='name of the sub package of the FMUs')
+    parser.add_argument('--jobs', type=int, default=1, help='maximum number of translations running at once')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='time without changes after which they are taken into account, in seconds')
+    parser.add_argument('--poll', action='store_true', help='poll the files instead of using inotify')
+    args = parser.parse_args()
+
+    def _print_result(result):
+        print('{0}: {1}{2}'.format(result.model_name, result.status,
+                                   '' if not result.success or result.import_result else ', import failed'))
+
+    watch_package(Package(args.package), fmu_dir_name=args.fmu_dir, jobs=args.jobs, debounce=args.debounce,
+                  polling=args.poll, on_result=_print_result)
@@ -7,6 +7,10 @@ setup(
     author_email='vincent.reinbold@gmail.com',
     license='GNU GENERAL PUBLIC LICENSE',
     packages=['modfmu'],
-    install_requires=['matplotlib', 'numpy', 'pandas', 'buildingspy'],
+    # the translation and import of FMUs need only the standard library
+    install_requires=[],
+    extras_require={'index': ['numpy'],  # modfmu.fmu_index
+                    'results': ['numpy'],  # modfmu.mat_reader
+                    'dataframes': ['numpy', 'pandas']},  # to_dataframe methods
     classifiers=[	"Programming Language :: Python :: 3.5",
 					"Programming Language :: Python :: 3.6"])
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+
+@pytest.fixture
+def fake_translator(tmp_path, monkeypatch):
+    """ Directory of a fake ``Dymola`` executable (see ``benchmarks/fake_dymola.py``), first on the PATH
+    """
+    from benchmarks.run_benchmarks import _fake_translator
+
+    directory = tmp_path / 'bin'
+    directory.mkdir()
+    # restored by monkeypatch once the test is over
+    monkeypatch.setenv('PATH', os.environ.get('PATH', ''))
+    _fake_translator(str(directory))
+    return str(directory)
+
+
+@pytest.fixture
+def library(tmp_path):
+    """ Synthetic library of 3 models: ``(root directory, [directory of its package P0])``
+    """
+    from benchmarks.synthetic import make_library
+
+    return make_library(str(tmp_path / 'lib'), 3)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import sys
+
+import pytest
+
+from modfmu.fmu_translator import _package_translator, _process_group_alive, run_mos_async, translate_package_async
+from modfmu.modelica import Package
+from modfmu.reporter import Reporter
+
+
+@pytest.fixture
+def processes(monkeypatch):
+    """ Translator processes started by the event loop
+    """
+    started = list()
+    create = asyncio.create_subprocess_exec
+
+    async def create_subprocess_exec(*args, **kwargs):
+        pro = await create(*args, **kwargs)
+        started.append(pro)
+        return pro
+
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', create_subprocess_exec)
+    return started
+
+
+async def _cancel(coroutine, delay=1.):
+    """ Cancels a task once its translators are started
+    """
+    task = asyncio.ensure_future(coroutine)
+    await asyncio.sleep(delay)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='process groups of POSIX')
+def test_cancelled_run_mos_async_kills_the_translator(tmp_path, fake_translator, processes, monkeypatch):
+    monkeypatch.setenv('MODFMU_BENCH_COMPILE_TIME', '30')
+    mos = tmp_path / 'M.mos'
+    mos.write_text('translateModelFMU("M", "M");\nModelica.Utilities.System.exit();\n')
+
+    asyncio.run(_cancel(run_mos_async(str(mos), str(tmp_path), timeout=60)))
+    assert len(processes) == 1
+    assert processes[0].returncode is not None
+    assert not _process_group_alive(processes[0].pid)
+    assert not (tmp_path / 'M.fmu').exists()
+
+
+def test_translate_fmu_async(library, fake_translator, tmp_path):
+    root, packages = library
+    trans = _package_translator(Package(packages[0]), 'M0.mo', Reporter(str(tmp_path / 'translation.log')))
+
+    result = asyncio.run(trans.translate_fmu_async())
+    assert result.status == 'translated'
+    assert result.process.returncode == 0 and not result.process.timed_out
+    assert os.path.isfile(result.fmu_path)
+
+
+def test_translate_package_async(library, fake_translator, processes):
+    root, packages = library
+
+    results = asyncio.run(translate_package_async(Package(packages[0]), jobs=2, history=False))
+    assert sorted(results) == ['BenchLib.P0.M0', 'BenchLib.P0.M1', 'BenchLib.P0.M2']
+    assert all(r.success and r.import_result for r in results.values())
+    # one translation and one import of each model
+    assert len(processes) == 6
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='process groups of POSIX')
+def test_cancelled_translate_package_async_kills_the_translators(library, fake_translator, processes, monkeypatch):
+    monkeypatch.setenv('MODFMU_BENCH_COMPILE_TIME', '30')
+    root, packages = library
+
+    asyncio.run(_cancel(translate_package_async(Package(packages[0]), jobs=2, history=False)))
+    assert len(processes) == 2
+    assert all(p.returncode is not None and not _process_group_alive(p.pid) for p in processes)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import os
+
+from modfmu.cache import FMUCache
+
+
+def test_entries_stored_by_another_process_are_restored(tmp_path):
+    first = FMUCache(str(tmp_path / 'cache'), translator_id='test')
+    other = FMUCache(str(tmp_path / 'cache'), translator_id='test')
+    fmu = tmp_path / 'M.fmu'
+    fmu.write_bytes(b'fmu')
+    key = 'ab' * 32
+
+    other.store(key, str(fmu))
+    restored = tmp_path / 'out' / 'M.fmu'
+    restored.parent.mkdir()
+    assert first.fetch(key, str(restored))
+    assert restored.read_bytes() == b'fmu'
+    assert first.stats['hits'] == 1 and first.stats['entries'] == 1 and first.size == 3
+
+
+def test_entries_removed_by_another_process_are_missed(tmp_path):
+    first = FMUCache(str(tmp_path / 'cache'), translator_id='test')
+    fmu = tmp_path / 'M.fmu'
+    fmu.write_bytes(b'fmu')
+    key = 'cd' * 32
+
+    first.store(key, str(fmu))
+    FMUCache(str(tmp_path / 'cache'), translator_id='test').clear()
+    assert not first.fetch(key, str(tmp_path / 'restored.fmu'))
+    assert not os.path.exists(str(tmp_path / 'restored.fmu'))
+    assert first.stats['misses'] == 1 and first.stats['entries'] == 0
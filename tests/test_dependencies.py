@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from modfmu import dependencies
+from modfmu.dependencies import DependencyGraph
+from modfmu.fmu_translator import translate_package
+from modfmu.library_index import LibraryIndex
+from modfmu.modelica import Package
+
+_files = {
+    'Lib/package.mo': 'package Lib\n  constant Real g = 9.81;\nend Lib;\n',
+    'Lib/package.order': 'Base\nP\n',
+    'Lib/Base/package.mo': 'within Lib;\npackage Base\nend Base;\n',
+    'Lib/Base/package.order': 'Partial\nInterfaces\n',
+    'Lib/Base/Partial.mo': 'within Lib.Base;\npartial model Partial\n  Real x;\nend Partial;\n',
+    'Lib/Base/Interfaces.mo': 'within Lib.Base;\npackage Interfaces\n  connector Pin\n    Real v;\n  end Pin;\n'
+                              'end Interfaces;\n',
+    'Lib/P/package.mo': 'within Lib;\npackage P\nend P;\n',
+    'Lib/P/package.order': 'A\nB\nC\nD\n',
+    # enclosing scope: Base is found in Lib
+    'Lib/P/A.mo': 'within Lib.P;\nmodel A\n  extends Base.Partial;\nequation\n  x = g;\nend A;\n',
+    # alias of an import, and nested class
+    'Lib/P/B.mo': 'within Lib.P;\nmodel B\n  import I = Lib.Base.Interfaces;\n  I.Pin p;\nend B;\n',
+    # wildcard import, and class of the same package
+    'Lib/P/C.mo': 'within Lib.P;\nmodel C\n  import Lib.Base.Interfaces.*;\n  Pin p;\n  A a;\nend C;\n',
+    # names outside of the library
+    'Lib/P/D.mo': 'within Lib.P;\nmodel D\n  Real y = Modelica.Constants.pi;\nend D;\n',
+}
+
+
+@pytest.fixture
+def lib(tmp_path, monkeypatch):
+    """ Real path of the directory of the library
+    """
+    monkeypatch.setattr(LibraryIndex, 'refresh_interval', 0.)
+    for name, text in _files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    return os.path.realpath(str(tmp_path / 'Lib'))
+
+
+def _relative(lib, files):
+    return sorted(os.path.relpath(f, lib).replace(os.path.sep, '/') for f in files)
+
+
+def _edit(path, text):
+    """ Rewrites a file, with another modification time
+    """
+    with open(path, 'a') as f:
+        f.write(text)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_name_resolution(lib):
+    graph = DependencyGraph.from_package(Package(os.path.join(lib, 'P')))
+    deps = lambda m: _relative(lib, graph.dependencies(os.path.join(lib, 'P', m + '.mo')))
+
+    assert deps('A') == ['Base/Partial.mo', 'P/package.mo', 'package.mo']
+    assert deps('B') == ['Base/Interfaces.mo', 'P/package.mo', 'package.mo']
+    assert deps('C') == ['Base/Interfaces.mo', 'P/A.mo', 'P/package.mo', 'package.mo']
+    assert deps('D') == ['P/package.mo', 'package.mo']
+    assert graph.class_file('Lib.Base.Interfaces.Pin') == os.path.join(lib, 'Base', 'Interfaces.mo')
+    assert graph.class_name(os.path.join(lib, 'P', 'C.mo')) == 'Lib.P.C'
+    assert _relative(lib, graph.dependents([os.path.join(lib, 'Base', 'Partial.mo')])) == \
+        ['Base/Partial.mo', 'P/A.mo', 'P/C.mo']
+
+
+def test_files_are_parsed_once(lib, monkeypatch):
+    parsed = list()
+    parse = dependencies.parse_modelica_file
+    monkeypatch.setattr(dependencies, 'parse_modelica_file', lambda path: parsed.append(path) or parse(path))
+    pck = Package(os.path.join(lib, 'P'))
+
+    first = DependencyGraph.from_package(pck)
+    assert len(parsed) == len([f for f in _files if f.endswith('.mo')])
+    del parsed[:]
+    assert DependencyGraph.from_package(pck).closure_digest(os.path.join(lib, 'P', 'C.mo')) == \
+        first.closure_digest(os.path.join(lib, 'P', 'C.mo'))
+    assert parsed == list()
+
+    _edit(os.path.join(lib, 'P', 'D.mo'), '// edited\n')
+    pck.index.refresh()
+    DependencyGraph.from_package(pck)
+    assert parsed == [os.path.join(lib, 'P', 'D.mo')]
+
+
+def test_updated_graph(lib, monkeypatch):
+    pck = Package(os.path.join(lib, 'P'))
+    graph = DependencyGraph.from_package(pck)
+    d = os.path.join(lib, 'P', 'D.mo')
+    with open(d, 'w') as f:
+        f.write('within Lib.P;\nmodel D\n  B b;\nend D;\n')
+    e = os.path.join(lib, 'P', 'E.mo')
+    with open(e, 'w') as f:
+        f.write('within Lib.P;\nmodel E\n  D d;\nend E;\n')
+    pck.index.refresh()
+
+    parsed = list()
+    parse = dependencies.parse_modelica_file
+    monkeypatch.setattr(dependencies, 'parse_modelica_file', lambda path: parsed.append(path) or parse(path))
+    updated = graph.updated(pck.index.files(), [d, e])
+    assert sorted(parsed) == [d, e]
+    assert _relative(lib, updated.dependencies(d)) == ['P/B.mo', 'P/package.mo', 'package.mo']
+    assert _relative(lib, updated.dependencies(e)) == ['P/D.mo', 'P/package.mo', 'package.mo']
+    assert _relative(lib, updated.dependents([os.path.join(lib, 'Base', 'Interfaces.mo')])) == \
+        ['Base/Interfaces.mo', 'P/B.mo', 'P/C.mo', 'P/D.mo', 'P/E.mo']
+    # the previous graph is left as it is
+    assert _relative(lib, graph.dependencies(d)) == ['P/package.mo', 'package.mo']
+    assert updated.closure_digest(os.path.join(lib, 'P', 'A.mo')) == graph.closure_digest(os.path.join(lib, 'P', 'A.mo'))
+    assert updated.closure_digest(d) != graph.closure_digest(d)
+
+
+def test_incremental_build_translates_the_dependents_only(lib, fake_translator):
+    statuses = lambda results: {name.split('.')[-1]: r.status for name, r in results.items()}
+    build = lambda: statuses(translate_package(Package(os.path.join(lib, 'P')), incremental=True, history=False))
+
+    assert build() == dict.fromkeys('ABCD', 'translated')
+    assert build() == dict.fromkeys('ABCD', 'up-to-date')
+    _edit(os.path.join(lib, 'Base', 'Partial.mo'), '// edited\n')
+    assert build() == {'A': 'translated', 'B': 'up-to-date', 'C': 'translated', 'D': 'up-to-date'}
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import threading
+import time
+
+from modfmu.distributed import Coordinator, Worker, run_worker, _JobQueue
+from modfmu.modelica import Package
+
+
+def _wait_for(condition, timeout=30.):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.05)
+
+
+def test_local_workers_translate_the_package(library, fake_translator):
+    root, packages = library
+    coordinator = Coordinator(Package(packages[0]), history=False)
+    results = coordinator.run(local_workers=2, poll_interval=0.1)
+
+    assert sorted(results) == ['BenchLib.P0.M0', 'BenchLib.P0.M1', 'BenchLib.P0.M2']
+    for r in results.values():
+        assert r.success and r.import_result
+        assert os.path.isfile(r.fmu_path)
+    workers = set(r.process.cmd[-1] for r in results.values())
+    assert workers <= {'(local-0)', '(local-1)'}
+
+
+def test_jobs_of_a_killed_worker_are_queued_again(library, fake_translator, monkeypatch):
+    root, packages = library
+    coordinator = Coordinator(Package(packages[0]), batch_size=3, lease_timeout=1., history=False)
+    outcome = dict()
+    thread = threading.Thread(target=lambda: outcome.update(coordinator.run(poll_interval=0.1)), daemon=True)
+    thread.start()
+    _wait_for(lambda: coordinator._listener is not None)
+    context = multiprocessing.get_context('spawn')
+
+    # the worker holding the only job is killed while it translates it
+    monkeypatch.setenv('MODFMU_BENCH_COMPILE_TIME', '3')
+    lost = context.Process(target=run_worker, args=(coordinator.address, coordinator.authkey, root),
+                           kwargs={'worker_id': 'lost', 'poll_interval': 0.1}, daemon=True)
+    lost.start()
+    _wait_for(lambda: any(w == 'lost' for w, _ in coordinator._queue._leases.values()))
+    lost.kill()
+    lost.join()
+
+    monkeypatch.setenv('MODFMU_BENCH_COMPILE_TIME', '0')
+    worker = context.Process(target=run_worker, args=(coordinator.address, coordinator.authkey, root),
+                             kwargs={'worker_id': 'second', 'poll_interval': 0.1}, daemon=True)
+    worker.start()
+    thread.join(timeout=60)
+    worker.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert sorted(outcome) == ['BenchLib.P0.M0', 'BenchLib.P0.M1', 'BenchLib.P0.M2']
+    assert all(r.success and r.process.cmd[-1] == '(second)' for r in outcome.values())
+    with open(os.path.join(packages[0], 'package_fmu_translation.log')) as f:
+        assert 'worker lost was lost, job 0 is queued again' in f.read()
+
+
+def test_workers_are_accepted_after_one_is_lost_during_the_handshake(library, fake_translator, tmp_path):
+    import socket
+
+    root, packages = library
+    coordinator = Coordinator(Package(packages[0]), batch_size=3, history=False)
+    outcome = dict()
+    thread = threading.Thread(target=lambda: outcome.update(coordinator.run(poll_interval=0.1)), daemon=True)
+    thread.start()
+    _wait_for(lambda: coordinator._listener is not None)
+
+    socket.create_connection(coordinator.address).close()
+    worker = Worker(coordinator.address, coordinator.authkey, root, work_dir=str(tmp_path / 'work'), worker_id='w')
+    threading.Thread(target=worker.run, daemon=True).start()
+    thread.join(timeout=30)
+
+    assert not thread.is_alive()
+    assert sorted(outcome) == ['BenchLib.P0.M0', 'BenchLib.P0.M1', 'BenchLib.P0.M2']
+
+
+def test_job_fails_when_the_translator_is_missing(library, tmp_path):
+    root, packages = library
+    coordinator = Coordinator(Package(packages[0]), batch_size=3, max_attempts=1, history=False)
+    outcome = dict()
+    thread = threading.Thread(target=lambda: outcome.update(coordinator.run(poll_interval=0.1)), daemon=True)
+    thread.start()
+    _wait_for(lambda: coordinator._listener is not None)
+
+    worker = Worker(coordinator.address, coordinator.authkey, root, work_dir=str(tmp_path / 'work'),
+                    modelica_exe='missing-translator', worker_id='w', poll_interval=0.1)
+    threading.Thread(target=worker.run, daemon=True).start()
+    thread.join(timeout=30)
+
+    assert not thread.is_alive()
+    assert sorted(outcome) == ['BenchLib.P0.M0', 'BenchLib.P0.M1', 'BenchLib.P0.M2']
+    assert not any(r.success for r in outcome.values())
+    with open(os.path.join(packages[0], 'package_fmu_translation.log')) as f:
+        assert "Did not find executable 'missing-translator'" in f.read()
+
+
+def test_lease_expiry():
+    jobs = _JobQueue({0: {'translators': []}}, lease_timeout=0.2, max_attempts=2)
+    assert jobs.get_job('a')['id'] == 0
+    assert jobs.get_job('b') is None
+    assert jobs.heartbeat('a', 0)
+    assert jobs.expire() == []
+
+    time.sleep(0.3)
+    assert jobs.expire() == [(0, 'a')]
+    # the job is handed to another worker, and the lost worker does not hold its lease any more
+    assert jobs.get_job('b')['id'] == 0
+    assert not jobs.heartbeat('a', 0)
+
+    time.sleep(0.3)
+    assert jobs.expire() == [(0, 'b')]
+    job_id, worker_id, outcome = jobs.results.get_nowait()
+    assert (job_id, worker_id) == (0, None) and 'Gave up after 2 attempts' in outcome
+    assert jobs.get_job('c') is None
+
+
+def test_first_outcome_of_a_job_is_kept():
+    jobs = _JobQueue({0: {'translators': []}}, lease_timeout=0.1)
+    jobs.get_job('a')
+    time.sleep(0.2)
+    jobs.expire()
+    jobs.get_job('b')
+    assert jobs.submit('a', 0, ['from a'])
+    assert not jobs.submit('b', 0, ['from b'])
+    assert jobs.results.get_nowait() == (0, 'a', ['from a'])
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+import pytest
+
+from modfmu.dymola_log import fatal_patterns
+from modfmu.fmu_translator import run_mos, run_mos_async
+
+
+def _script(tmp_path, line):
+    """ Script writing a line to the log of the translator, then translating for a long time
+    """
+    log = tmp_path / 'dymola_translate.log'
+    mos = tmp_path / 'translate.mos'
+    mos.write_text('Modelica.Utilities.Streams.print("{}", "{}");\ntranslateModelFMU("P.M", "M");\n'
+                   .format(line, log.as_posix()))
+    return str(mos), str(log)
+
+
+@pytest.fixture(params=['run_mos', 'run_mos_async'])
+def run(request):
+    if request.param == 'run_mos':
+        return run_mos
+    return lambda *args, **kwargs: asyncio.run(run_mos_async(*args, **kwargs))
+
+
+def test_translator_is_stopped_on_a_fatal_error(tmp_path, fake_translator, monkeypatch, run):
+    monkeypatch.setenv('MODFMU_BENCH_COMPILE_TIME', '30')
+    mos, log = _script(tmp_path, 'License error: the license server is down')
+
+    start = time.monotonic()
+    result = run(mos, str(tmp_path), timeout=60, fatal_patterns=fatal_patterns, watch=[log])
+    assert time.monotonic() - start < 15
+    assert result.aborted and not result.timed_out
+    assert result.fatal_errors == [('license', 'License error: the license server is down')]
+
+
+def test_other_lines_do_not_stop_the_translator(tmp_path, fake_translator, monkeypatch, run):
+    monkeypatch.setenv('MODFMU_BENCH_COMPILE_TIME', '0.5')
+    mos, log = _script(tmp_path, 'Warning: the license expires in 10 days')
+
+    result = run(mos, str(tmp_path), timeout=60, fatal_patterns=fatal_patterns, watch=[log])
+    assert result.returncode == 0 and not result.aborted
+    assert result.fatal_errors == list()
+    assert (tmp_path / 'M.fmu').exists()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import math
+import os
+import zipfile
+
+import pytest
+
+from modfmu.fmu_index import FMUIndex, read_model_description
+
+_fmi2 = '''<?xml version="1.0" encoding="UTF-8"?>
+<fmiModelDescription fmiVersion="2.0" modelName="{model}" guid="{{guid-{model}}}">
+<CoSimulation modelIdentifier="{model}"/>
+<ModelVariables>
+<ScalarVariable name="k" valueReference="1" causality="parameter" variability="tunable" description="gain">
+<Real start="2.5"/></ScalarVariable>
+<ScalarVariable name="on" valueReference="2" causality="input" variability="discrete"><Boolean start="true"/>
+</ScalarVariable>
+<ScalarVariable name="{output}" valueReference="3" causality="output"><Real/></ScalarVariable>
+</ModelVariables>
+</fmiModelDescription>
+'''
+
+_fmi3 = '''<?xml version="1.0" encoding="UTF-8"?>
+<fmiModelDescription fmiVersion="3.0" modelName="{model}" instantiationToken="{{token-{model}}}">
+<CoSimulation modelIdentifier="{model}"/>
+<ModelVariables>
+<Float64 name="k" valueReference="1" causality="parameter" variability="tunable" start="4"/>
+<Int32 name="n" valueReference="2" causality="parameter" variability="fixed" start="3"/>
+<Float64 name="{output}" valueReference="3" causality="output"/>
+</ModelVariables>
+</fmiModelDescription>
+'''
+
+
+def _fmu(directory, model, template=_fmi2, output='y'):
+    path = os.path.join(str(directory), model, model + '.fmu')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('modelDescription.xml', template.format(model=model, output=output))
+    # another modification time, whatever the resolution of the file system
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    return os.path.realpath(path)
+
+
+def test_read_model_description(tmp_path):
+    description, variables = read_model_description(_fmu(tmp_path, 'A'))
+    assert description['guid'] == '{guid-A}'
+    assert variables == [('k', 'parameter', 'tunable', 'Real', '1', '2.5', 'gain'),
+                         ('on', 'input', 'discrete', 'Boolean', '2', 'true', ''),
+                         ('y', 'output', 'continuous', 'Real', '3', None, '')]
+
+    description, variables = read_model_description(_fmu(tmp_path, 'B', _fmi3))
+    assert description['instantiationToken'] == '{token-B}'
+    assert variables == [('k', 'parameter', 'tunable', 'Float64', '1', '4', ''),
+                         ('n', 'parameter', 'fixed', 'Int32', '2', '3', ''),
+                         ('y', 'output', 'continuous', 'Float64', '3', None, '')]
+
+
+def test_query(tmp_path):
+    a = _fmu(tmp_path, 'A')
+    b = _fmu(tmp_path, 'B', _fmi3)
+    index = FMUIndex(str(tmp_path))
+
+    assert sorted(index.fmus_with_variable('k')) == [a, b]
+    k = index.query(name='k', fmu='B')
+    assert k == [{'fmu': b, 'guid': '{token-B}', 'name': 'k', 'causality': 'parameter', 'variability': 'tunable',
+                  'type': 'Float64', 'value_reference': 1, 'start': '4', 'start_value': 4., 'description': ''}]
+    assert [(v['name'], v['start_value']) for v in index.query(fmu=a, causality='input')] == [('on', 1.)]
+    assert math.isnan(index.query(fmu='A', name='y')[0]['start_value'])
+    assert [v['name'] for v in index.parameters(tunable=False) if v['fmu'] == b] == ['k', 'n']
+
+
+def test_dataframe_paths_are_the_ones_of_query(tmp_path):
+    pytest.importorskip('pandas')
+    _fmu(tmp_path, 'A')
+    _fmu(tmp_path, 'B', _fmi3)
+    index = FMUIndex(str(tmp_path))
+
+    frame = index.to_dataframe(pattern='k|n')
+    assert sorted(zip(frame['fmu'], frame['name'])) == sorted((v['fmu'], v['name']) for v in index.query(pattern='k|n'))
+    assert list(frame['causality'].unique()) == ['parameter']
+
+
+def test_incremental_refresh(tmp_path):
+    a = _fmu(tmp_path, 'A', output='ya')
+    b = _fmu(tmp_path, 'B', output='yb')
+    index = FMUIndex(str(tmp_path))
+    assert FMUIndex(str(tmp_path), refresh=False).fmus['path'].tolist() == index.fmus['path'].tolist()
+    assert index.refresh() == (0, 0)
+
+    # B changed, C added: A keeps its code, the variables of B and C point to their new codes
+    _fmu(tmp_path, 'B', _fmi3, output='yb')
+    c = _fmu(tmp_path, 'C', output='yc')
+    assert index.refresh() == (2, 0)
+    assert index.fmus_with_variable('ya') == [a]
+    assert index.fmus_with_variable('yb') == [b]
+    assert index.fmus_with_variable('yc') == [c]
+    assert index.query(fmu=b, name='k')[0]['type'] == 'Float64'
+
+    # A removed: the codes of B and C are shifted
+    os.remove(a)
+    assert index.refresh() == (0, 1)
+    assert index.fmus_with_variable('ya') == []
+    assert index.fmus_with_variable('yb') == [b]
+    assert sorted(index.fmus_with_variable('k')) == [b, c]
+    assert len(index.variables['name']) == 6
+
+    # the saved index is the refreshed one
+    names = lambda i: [(v['fmu'], v['name'], v['type']) for v in i.query()]
+    assert names(FMUIndex(str(tmp_path), refresh=False)) == names(index)
+
+
+def test_unreadable_fmu_is_reported(tmp_path):
+    path = tmp_path / 'Bad' / 'Bad.fmu'
+    path.parent.mkdir()
+    path.write_bytes(b'not a zip file')
+    index = FMUIndex(str(tmp_path))
+    assert list(index.errors) == [os.path.realpath(str(path))]
+    assert index.query(fmu=str(path)) == []
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import itertools
+import time
+
+import pytest
+
+from modfmu.history import BuildHistory
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    # runs recorded one second apart
+    clock = itertools.count(1000)
+    monkeypatch.setattr(time, 'time', lambda: float(next(clock)))
+    history = BuildHistory(str(tmp_path / 'FMUs'), default_timeout=100., min_timeout=30., max_timeout=3600.,
+                           timeout_factor=3., keep=3)
+    yield history
+    history.close()
+
+
+def test_timeouts(history):
+    assert history.timeout('Lib.New') == 100.
+    history.record('Lib.Small', 'translated', 1.)
+    assert history.timeout('Lib.Small') == 30.
+    history.record_many([('Lib.Medium', 'translated', 40., 100.), ('Lib.Medium', 'failed', 200., 100.),
+                         ('Lib.Large', 'translated', 2000., 100.)])
+    assert history.timeout('Lib.Medium') == 120.
+    assert history.timeout('Lib.Large') == 3600.
+    # runs that timed out double the time out, up to max_timeout
+    history.record('Lib.Slow', 'timeout', 100., timeout=100.)
+    assert history.timeout('Lib.Slow') == 200.
+    history.record('Lib.Slow', 'timeout', 200., timeout=2000.)
+    assert history.timeout('Lib.Slow') == 3600.
+    assert history.expected_duration('Lib.Slow') == 2000.
+    # imports have a history of their own
+    assert history.timeout('Lib.Medium', kind='import') == 100.
+
+
+def test_only_the_last_runs_are_kept(history):
+    for duration in (500., 10., 10., 10.):
+        history.record('Lib.M', 'translated', duration)
+    assert history.runs('Lib.M') == [('translated', 10., None)] * 3
+    assert history.timeout('Lib.M') == 30.
+    assert history.expected_duration('Lib.M') == 10.
+
+
+def test_longest_first(history):
+    history.record_many([('Lib.A', 'translated', 10., None), ('Lib.B', 'translated', 300., None),
+                         ('Lib.C', 'translated', 60., None), ('Lib.C', 'translated', 20., None),
+                         ('Lib.D', 'timeout', 100., 100.)])
+    assert history.expected_duration('Lib.C') == 40.
+    # models without history first, in their order
+    assert history.longest_first(['Lib.A', 'Lib.New2', 'Lib.B', 'Lib.C', 'Lib.D', 'Lib.New1']) == \
+        ['Lib.New2', 'Lib.New1', 'Lib.B', 'Lib.D', 'Lib.C', 'Lib.A']
+
+
+def test_history_is_kept_in_the_file(history, tmp_path):
+    history.record('Lib.M', 'translated', 50.)
+    other = BuildHistory(str(tmp_path / 'FMUs'))
+    try:
+        assert other.runs('Lib.M') == [('translated', 50., None)]
+        assert other.timeout('Lib.M') == 150.
+    finally:
+        other.close()
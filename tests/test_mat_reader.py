@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import struct
+
+import numpy as np
+import pytest
+
+from modfmu.mat_reader import DymolaResult
+
+_precisions = {'f8': 0, 'f4': 1, 'i4': 2, 'u1': 5}
+
+# name, description, data matrix, signed row
+_variables = [('Time', 'Time in [s]', 0, 1),
+              ('k', 'gain', 1, 2),
+              ('minus_k', '', 1, -2),
+              ('x', 'state', 2, 2),
+              ('y', 'alias of x', 2, 2),
+              ('z', 'negated alias of x', 2, -2),
+              ('w', '', 2, 3)]
+_time = np.array([0., 0.5, 1., 1.5, 2., 2.5, 3.])
+
+
+def _text(strings):
+    width = max(len(s) for s in strings)
+    return np.array([[ord(c) for c in s.ljust(width)] for s in strings], dtype='u1')
+
+
+def _write_matrix(f, name, matrix):
+    matrix = np.atleast_2d(matrix)
+    text = matrix.dtype == np.dtype('u1')
+    f.write(struct.pack('<5i', _precisions[matrix.dtype.str[1:]] * 10 + text, matrix.shape[0], matrix.shape[1], 0,
+                        len(name) + 1))
+    f.write(name.encode('ascii') + b'\0')
+    # MATLAB stores the matrices column by column
+    f.write(matrix.astype(matrix.dtype.newbyteorder('<')).tobytes(order='F'))
+
+
+def _write_result(path, transposed):
+    """ Dymola result file of the variables of _variables, the matrices being transposed in the binTrans layout
+    """
+    layout = (lambda m: m.T) if transposed else (lambda m: m)
+    data_1 = np.array([[0., 2.], [3., 2.]])  # time, k at the start and at the end
+    data_2 = np.stack([_time, np.sin(_time), 10 * _time], axis=1)  # time, x, w at each time step
+    info = np.array([[m, r, 0, -1] for n, d, m, r in _variables], dtype='i4')
+    with open(path, 'wb') as f:
+        _write_matrix(f, 'Aclass', _text(['Atrajectory', '1.1', '', 'binTrans' if transposed else 'binNormal']))
+        _write_matrix(f, 'name', layout(_text([n for n, d, m, r in _variables])))
+        _write_matrix(f, 'description', layout(_text([d for n, d, m, r in _variables])))
+        _write_matrix(f, 'dataInfo', layout(info))
+        _write_matrix(f, 'data_1', layout(data_1))
+        _write_matrix(f, 'data_2', layout(data_2.astype('f4')))
+    return path
+
+
+@pytest.fixture(params=[False, True], ids=['binNormal', 'binTrans'])
+def result(request, tmp_path):
+    with DymolaResult(_write_result(str(tmp_path / 'dsres.mat'), request.param)) as res:
+        yield res
+
+
+def test_names_and_descriptions(result):
+    assert result.names == [n for n, d, m, r in _variables]
+    assert len(result) == len(_variables) and 'x' in result and 'v' not in result
+    assert result.descriptions()['x'] == 'state'
+    with pytest.raises(KeyError):
+        result.values('v')
+
+
+def test_aliases(result):
+    x = np.sin(_time).astype('f4')
+    assert result.alias_of('x') == ('x', False)
+    assert result.alias_of('y') == ('x', False)
+    assert result.alias_of('z') == ('x', True)
+    np.testing.assert_array_equal(result.values('y'), x)
+    np.testing.assert_array_equal(result.values('z'), -x)
+    arrays = result.arrays(['x', 'z', 'w'])
+    np.testing.assert_array_equal(arrays['x'], x)
+    np.testing.assert_array_equal(arrays['z'], -x)
+    np.testing.assert_array_equal(arrays['w'], 10 * _time)
+
+
+def test_parameters(result):
+    assert result.is_parameter('k') and not result.is_parameter('x')
+    np.testing.assert_array_equal(result.values('k'), np.full(len(_time), 2.))
+    np.testing.assert_array_equal(result.values('minus_k', start=1., stop=2.), np.full(3, -2.))
+
+
+def test_time_window(result):
+    np.testing.assert_array_equal(result.time(), _time)
+    np.testing.assert_array_equal(result.time(start=1., stop=2.), [1., 1.5, 2.])
+    np.testing.assert_array_equal(result.values('w', start=0.7), 10 * _time[2:])
+    np.testing.assert_array_equal(result.values('w', stop=0.7), [0., 5.])
+    assert len(result.values('x', start=4.)) == 0
+
+
+def test_views_are_read_only(result):
+    view = result.values('x', start=1., copy=False)
+    np.testing.assert_array_equal(view, np.sin(_time[2:]).astype('f4'))
+    assert not view.flags.writeable
+    assert not result.values('k', copy=False).flags.writeable
+    # the values of a negated alias, and the copies, are arrays of their own
+    assert result.values('z', copy=False).flags.writeable
+    copy = result.values('x')
+    copy[0] = 1.
+    assert result.values('x')[0] == 0.
+
+
+def test_dataframe(result):
+    pytest.importorskip('pandas')
+    frame = result.to_dataframe(['x', 'z', 'k'], start=1.)
+    assert list(frame.columns) == ['x', 'z', 'k']
+    assert frame.index.name == 'Time' and list(frame.index) == list(_time[2:])
+    np.testing.assert_array_equal(frame['z'], -frame['x'])
+
+
+def test_not_a_result_file(tmp_path):
+    path = tmp_path / 'other.mat'
+    with open(str(path), 'wb') as f:
+        _write_matrix(f, 'A', np.eye(2))
+    with pytest.raises(ValueError, match='no name matrix'):
+        DymolaResult(str(path))
+    with open(str(path), 'ab') as f:
+        f.write(b'\0' * 7)
+    with pytest.raises(ValueError, match='truncated'):
+        DymolaResult(str(path))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import pytest
+
+from modfmu import modelica
+from modfmu.library_index import LibraryIndex
+from modfmu.modelica import Package, _write_atomic
+
+
+def test_write_atomic_leaves_no_temporary_file_on_error(tmp_path, monkeypatch):
+    path = tmp_path / 'package.order'
+    path.write_text('A\n')
+    _write_atomic(str(path), 'B\n')
+    assert path.read_text() == 'B\n'
+
+    def replace(src, dst):
+        raise OSError('disk full')
+    monkeypatch.setattr(os, 'replace', replace)
+    with pytest.raises(OSError):
+        _write_atomic(str(path), 'C\n')
+    assert path.read_text() == 'B\n'
+    assert os.listdir(str(tmp_path)) == ['package.order']
+
+
+@pytest.fixture
+def pck(tmp_path):
+    """ Package Lib.P with the sub packages A and B
+    """
+    lib = Package(str(tmp_path / 'Lib'))
+    lib.add_subpackage('P')
+    pck = Package(str(tmp_path / 'Lib' / 'P'))
+    pck.add_subpackage('A')
+    pck.add_subpackage('B')
+    return pck
+
+
+def _order(pck):
+    with open(pck._order_file) as f:
+        return f.read().split()
+
+
+def test_transaction(pck, monkeypatch):
+    index = pck.index
+    writes = list()
+    refreshes = list()
+    write = modelica._write_atomic
+    refresh = LibraryIndex.refresh
+    monkeypatch.setattr(modelica, '_write_atomic', lambda path, content: writes.append(path) or write(path, content))
+    monkeypatch.setattr(LibraryIndex, 'refresh', lambda self: refreshes.append(self) or refresh(self))
+
+    with pck.transaction() as t:
+        pck.add_subpackage('C')
+        pck.add_subpackage('D', order='first')
+        pck.rm_subpackage('A')
+        t.reorder(['C', 'B'])
+        assert t.order == ['C', 'B', 'D']
+        # nothing is written before the commit
+        assert _order(pck) == ['A', 'B']
+        assert not os.path.exists(os.path.join(pck.path, 'C'))
+
+    assert _order(pck) == ['C', 'B', 'D']
+    assert not os.path.exists(os.path.join(pck.path, 'A'))
+    assert all(Package.is_modelica_package(os.path.join(pck.path, n)) for n in 'BCD')
+    # package.mo and package.order of C and D, and package.order of P
+    assert sorted(writes) == sorted([os.path.join(pck.path, n, f) for n in 'CD' for f in ('package.mo', 'package.order')] +
+                                    [pck._order_file])
+    assert len(writes) == len(set(writes))
+    assert refreshes == [index]
+    assert index.children('Lib.P') == ['Lib.P.C', 'Lib.P.B', 'Lib.P.D']
+    assert sorted(pck.children) == [os.path.join(pck.path, n) for n in 'BCD']
+
+
+def test_transaction_is_discarded_on_error(pck):
+    with pytest.raises(ValueError):
+        with pck.transaction():
+            pck.add_subpackage('C')
+            pck.rm_subpackage('A')
+            raise ValueError()
+    assert _order(pck) == ['A', 'B']
+    assert Package.is_modelica_package(os.path.join(pck.path, 'A'))
+    assert not os.path.exists(os.path.join(pck.path, 'C'))
+    # the package is edited directly again
+    pck.add_subpackage('C')
+    assert _order(pck) == ['A', 'B', 'C']
+
+
+def _touch(path):
+    """ Writes a file, and gives its directory another modification time
+    """
+    with open(path, 'w') as f:
+        f.write('model M\nend M;\n')
+    directory = os.path.dirname(path)
+    st = os.stat(directory)
+    os.utime(directory, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_files_added_on_disk_are_seen_after_scan_interval(pck, monkeypatch):
+    scans = list()
+    scan = Package.scan_children
+    monkeypatch.setattr(Package, 'scan_children', lambda self: scans.append(self) or scan(self))
+    pck.scan_interval = 0.2
+    assert pck.models == {os.path.join(pck.path, n, 'package.mo') for n in ('', 'A', 'B')}
+    assert len(scans) == 1
+
+    m = os.path.join(pck.path, 'A', 'M.mo')
+    _touch(m)
+    assert m not in pck.models
+    time.sleep(0.3)
+    assert m in pck.models
+    assert len(scans) == 2
+    # the tree is scanned again only when it changes
+    time.sleep(0.3)
+    assert m in pck.models
+    assert len(scans) == 2
+
+
+def test_transaction_updates_the_scan(pck, monkeypatch):
+    scans = list()
+    scan = Package.scan_children
+    monkeypatch.setattr(Package, 'scan_children', lambda self: scans.append(self) or scan(self))
+    assert sorted(pck.children) == [os.path.join(pck.path, n) for n in 'AB']
+
+    with pck.transaction():
+        pck.add_subpackage('C')
+        pck.rm_subpackage('A')
+    # seen at once, without waiting for scan_interval
+    assert sorted(pck.children) == [os.path.join(pck.path, n) for n in 'BC']
+    assert os.path.join(pck.path, 'C', 'package.mo') in pck.models
+    assert os.path.join(pck.path, 'A', 'package.mo') not in pck.models
+    # nor scanning the tree again
+    pck.scan_interval = 0.
+    assert sorted(pck.children) == [os.path.join(pck.path, n) for n in 'BC']
+    assert len(scans) == 1
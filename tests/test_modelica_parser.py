@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from modfmu.dependencies import parse_modelica_file
+from modfmu.library_index import parse_classes
+from modfmu.modelica_parser import class_definitions, strip_comments
+
+_code = '''within Lib.P;
+partial model Base "a model // not a comment"
+  // model Commented
+  /* block Hidden
+  end Hidden; */
+  replaceable function f = Lib.Functions.f;
+  expandable connector Bus
+  end Bus;
+  impure function g
+    input Real x;
+  end g;
+  redeclare model extends Inner
+  end Inner;
+end Base;
+'''
+
+
+def test_strip_comments():
+    code = strip_comments(_code)
+    assert 'Commented' not in code and 'Hidden' not in code and 'not a comment' not in code
+    assert len(code.splitlines()) == len(_code.splitlines()) - 1
+
+
+def test_class_definitions():
+    assert class_definitions(strip_comments(_code)) == [('Base', 'model', True), ('f', 'function', False),
+                                                        ('Bus', 'expandable connector', False),
+                                                        ('g', 'function', False)]
+
+
+def test_index_and_dependencies_share_the_parsing(tmp_path):
+    path = tmp_path / 'Base.mo'
+    path.write_text(_code)
+    within, classes, imports, names = parse_modelica_file(str(path))
+    assert within == 'Lib.P'
+    assert classes == [name for name, kind, partial in parse_classes(str(path))] == ['Base', 'f', 'Bus', 'g']
+    assert 'Lib.Functions.f' in names and 'Commented' not in names
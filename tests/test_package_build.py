@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+
+from modfmu.fmu_translator import _package_model_files, translate_package
+from modfmu.modelica import Package
+
+
+def _add_model_to_package_mo(pck_dir):
+    with open(os.path.join(pck_dir, 'package.mo'), 'w') as f:
+        f.write('within BenchLib;\npackage P0\n  extends Modelica.Icons.Package;\n'
+                '  model Inline\n    Real x;\n  equation\n    x = 1;\n  end Inline;\nend P0;\n')
+    with open(os.path.join(pck_dir, 'package.order'), 'a') as f:
+        f.write('Inline\n')
+
+
+def test_models_of_package_mo_are_not_model_files(library):
+    root, packages = library
+    _add_model_to_package_mo(packages[0])
+    model_files, others = _package_model_files(Package(packages[0]))
+    assert model_files == ['M0.mo', 'M1.mo', 'M2.mo']
+    assert 'BenchLib.P0.Inline' in others
+
+
+def test_translate_package(library, fake_translator):
+    root, packages = library
+    _add_model_to_package_mo(packages[0])
+    results = translate_package(Package(packages[0]), history=False)
+    assert sorted(results) == ['BenchLib.P0.M0', 'BenchLib.P0.M1', 'BenchLib.P0.M2']
+    assert all(r.success and r.import_result for r in results.values())
+
+
+def test_build_log_is_started_anew(library, fake_translator):
+    root, packages = library
+    translate_package(Package(packages[0]), history=False)
+    translate_package(Package(packages[0]), history=False)
+    with open(os.path.join(packages[0], 'package_fmu_translation.log')) as f:
+        assert f.read().count('Initialisation of the log file') == 1
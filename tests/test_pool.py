@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from modfmu import pool as pool_module
+from modfmu.fmu_translator import _process_group_alive
+from modfmu.pool import TranslatorPool, _Session
+
+backends = pytest.mark.parametrize('backend', ['directory', 'stdin'])
+
+
+def _script(directory, model, package):
+    """ Script of a job, as written by the translators
+    """
+    os.makedirs(str(directory), exist_ok=True)
+    path = os.path.join(str(directory), model + '.mos')
+    with open(path, 'w') as f:
+        f.write('openModel("{0}");\ncd("{1}");\ntranslateModelFMU("{2}", "{2}");\nsavelog("{2}.log");\n'
+                'Modelica.Utilities.System.exit();\n'.format(package, str(directory), model))
+    return path
+
+
+@pytest.fixture
+def package(tmp_path):
+    path = tmp_path / 'Lib' / 'package.mo'
+    path.parent.mkdir()
+    path.write_text('package Lib\nend Lib;\n')
+    return str(path)
+
+
+@backends
+def test_jobs_are_handed_to_the_same_session(tmp_path, fake_translator, package, backend):
+    with TranslatorPool('Dymola', size=1, packages=[package], directory=str(tmp_path / 'pool'), backend=backend) as pool:
+        pids = list()
+        for model in ('M0', 'M1', 'M2'):
+            work = tmp_path / model
+            result = pool.run_mos(_script(work, model, package), str(work), timeout=30)
+            assert result.returncode == 0 and not result.timed_out
+            assert (work / (model + '.fmu')).is_file()
+            # the log of the session is cleared before each job
+            assert (work / (model + '.log')).read_text().count('Translation of') == 1
+            pids.append(pool._idle.queue[-1]._process.pid)
+        assert len(set(pids)) == 1
+        assert pool._sessions == 1
+
+
+@backends
+def test_session_is_recycled_after_max_jobs(tmp_path, fake_translator, package, backend):
+    with TranslatorPool('Dymola', size=1, packages=[package], directory=str(tmp_path / 'pool'), backend=backend,
+                        max_jobs=2) as pool:
+        for model in ('M0', 'M1', 'M2'):
+            work = tmp_path / model
+            assert pool.run_mos(_script(work, model, package), str(work), timeout=30).returncode == 0
+        assert pool.recycled == 1
+        assert pool._sessions == 2
+
+
+@backends
+def test_session_is_killed_on_timeout(tmp_path, fake_translator, package, backend, monkeypatch):
+    monkeypatch.setenv('MODFMU_BENCH_COMPILE_TIME', '30')
+    with TranslatorPool('Dymola', size=1, packages=[package], directory=str(tmp_path / 'pool'), backend=backend) as pool:
+        work = tmp_path / 'M0'
+        session = pool._new_session()
+        pool._idle.get()
+        pool._idle.put(session)
+        result = pool.run_mos(_script(work, 'M0', package), str(work), timeout=0.5)
+        assert result.timed_out
+        assert not session.alive
+        assert pool.recycled == 1
+        assert pool._idle.queue[-1] is None  # a new session is started by the next job
+        assert session._process.poll() is not None
+        assert not _process_group_alive(session._process.pid)
+
+
+def test_job_script_strips_the_library_loading_and_exit(tmp_path, package):
+    pool = TranslatorPool('Dymola', packages=[package], directory=str(tmp_path / 'pool'))
+    session = _Session(pool, 0)
+    mos = tmp_path / 'job.mos'
+    mos.write_text('openModel("{0}");\nopenModel("{1}");\nopenModel("Other/package.mo");\n'
+                   'translateModelFMU("M", "M");\nModelica.Utilities.System.exit();\n'.format(
+                       package, package.replace(os.path.sep, '/')))
+    script = session._job_script(str(mos), str(tmp_path / 'work'), 7, str(tmp_path / 'done'))
+
+    lines = script.splitlines()
+    assert lines[0] == '// modfmu job 7'
+    assert 'clearlog();' in lines
+    assert 'cd("{}");'.format(str(tmp_path / 'work').replace(os.path.sep, '/')) in lines
+    assert not any(package.replace(os.path.sep, '/') in l or package in l for l in lines if l.startswith('openModel'))
+    assert 'openModel("Other/package.mo");' in lines
+    assert 'translateModelFMU("M", "M");' in lines
+    assert not any('exit()' in l for l in lines)
+    assert lines[-1] == 'Modelica.Utilities.Streams.print("7", "{}");'.format(
+        str(tmp_path / 'done').replace(os.path.sep, '/'))
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='POSIX shell command')
+def test_idle_session_waits_in_one_command(tmp_path, package, monkeypatch):
+    monkeypatch.setattr(pool_module, '_job_wait', 0.5)
+    session = _Session(TranslatorPool('Dymola', packages=[package], directory=str(tmp_path / 'pool')), 0)
+    command = session._wait_command().replace('\\"', '"')
+    assert 'Modelica.Utilities.System.command("{}");'.format(session._wait_command()) in session._directory_loop()
+
+    start = time.monotonic()
+    subprocess.check_call(command, shell=True)
+    assert time.monotonic() - start >= 0.4
+
+    open(os.path.join(session.directory, 'job.mos'), 'w').close()
+    start = time.monotonic()
+    subprocess.check_call(command, shell=True)
+    assert time.monotonic() - start < 0.4
+
+
+@backends
+def test_run_mos_async(tmp_path, fake_translator, package, backend):
+    async def run(pool):
+        return await asyncio.gather(*(pool.run_mos_async(_script(tmp_path / m, m, package), str(tmp_path / m),
+                                                         timeout=30) for m in ('M0', 'M1', 'M2')))
+
+    with TranslatorPool('Dymola', size=2, packages=[package], directory=str(tmp_path / 'pool'), backend=backend) as pool:
+        results = asyncio.run(run(pool))
+        assert all(r.returncode == 0 and not r.timed_out for r in results)
+        assert all((tmp_path / m / (m + '.fmu')).is_file() for m in ('M0', 'M1', 'M2'))
+        assert pool._sessions == 2
+
+
+@backends
+def test_cancellation_kills_the_session(tmp_path, fake_translator, package, backend, monkeypatch):
+    monkeypatch.setenv('MODFMU_BENCH_COMPILE_TIME', '30')
+
+    async def run(pool):
+        task = asyncio.ensure_future(pool.run_mos_async(_script(tmp_path / 'M0', 'M0', package),
+                                                        str(tmp_path / 'M0'), timeout=60))
+        await asyncio.sleep(1.)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with TranslatorPool('Dymola', size=1, packages=[package], directory=str(tmp_path / 'pool'), backend=backend) as pool:
+        session = pool._new_session()
+        pool._idle.get()
+        pool._idle.put(session)
+        asyncio.run(run(pool))
+        assert pool._idle.queue[-1] is None
+        assert session._process.poll() is not None
+        assert not _process_group_alive(session._process.pid)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import subprocess
+import sys
+import time
+
+import pytest
+
+from modfmu.fmu_translator import _kill_process_group, _kill_process_group_async, _process_group_alive, \
+    _popen_process_group_kwargs
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='process groups of POSIX')
+
+# a leader stopped by SIGTERM, with a child ignoring it, e.g. a compiler started by the translator
+_command = ['sh', '-c', "(trap '' TERM; sleep 30) & exec sleep 30"]
+
+
+def _group_ended(pgid, timeout=2.):
+    """ True once the killed processes of the group are reaped by their new parent
+    """
+    deadline = time.monotonic() + timeout
+    while _process_group_alive(pgid):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_children_ignoring_sigterm_are_killed():
+    pro = subprocess.Popen(_command, **_popen_process_group_kwargs())
+    time.sleep(0.2)
+    start = time.monotonic()
+    _kill_process_group(pro, grace=0.5)
+    assert 0.4 < time.monotonic() - start < 5.
+    assert _group_ended(pro.pid)
+
+
+def test_group_exiting_on_sigterm_is_not_waited_for():
+    pro = subprocess.Popen(['sleep', '30'], **_popen_process_group_kwargs())
+    start = time.monotonic()
+    _kill_process_group(pro, grace=5.)
+    assert time.monotonic() - start < 1.
+    assert _group_ended(pro.pid)
+
+
+def test_children_ignoring_sigterm_are_killed_async():
+    async def run():
+        pro = await asyncio.create_subprocess_exec(*_command, **_popen_process_group_kwargs())
+        await asyncio.sleep(0.2)
+        await _kill_process_group_async(pro, grace=0.5)
+        return pro.pid
+
+    assert _group_ended(asyncio.run(run()))
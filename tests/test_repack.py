@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os
+import zipfile
+
+import pytest
+
+from modfmu import repack
+from modfmu.repack import RepackError, RepackPolicy, repack_fmu
+
+_members = {'modelDescription.xml': b'<?xml version="1.0"?>\n<fmiModelDescription fmiVersion="2.0"/>\n',
+            'binaries/linux64/M.so': os.urandom(20000),  # does not shrink: stored
+            'binaries/win64/M.dll': os.urandom(1000),
+            'sources/M.c': b'int x = 0;\n' * 1000,
+            'documentation/index.html': b'<html></html>\n',
+            'resources/table.txt': b'0 1\n' * 1000}
+
+
+@pytest.fixture
+def fmu(tmp_path):
+    path = str(tmp_path / 'M.fmu')
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        z.writestr('binaries/', b'')
+        for name, data in _members.items():
+            z.writestr(name, data)
+    return path
+
+
+def _content(path):
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        return {i.filename: (i.compress_type, z.read(i)) for i in z.infolist()}
+
+
+def test_entries_are_removed_and_recompressed(fmu):
+    result = repack_fmu(fmu, RepackPolicy(platforms=['linux64'], level=9, jobs=2))
+
+    assert sorted(result.removed) == ['binaries/win64/M.dll', 'documentation/index.html', 'sources/M.c']
+    content = _content(fmu)
+    assert sorted(content) == ['binaries/', 'binaries/linux64/M.so', 'modelDescription.xml', 'resources/table.txt']
+    assert all(content[n][1] == _members[n] for n in content if n != 'binaries/')
+    assert content['binaries/linux64/M.so'][0] == zipfile.ZIP_STORED
+    assert content['resources/table.txt'][0] == zipfile.ZIP_DEFLATED
+    assert result.size_after == os.path.getsize(fmu) < result.size_before
+    assert not [f for f in os.listdir(os.path.dirname(fmu)) if f != 'M.fmu']
+
+
+def test_level_0_stores_the_members(fmu, tmp_path):
+    output = str(tmp_path / 'stored.fmu')
+    repack_fmu(fmu, RepackPolicy(level=0), include_sources=True, output_path=output)
+
+    content = _content(output)
+    assert all(method == zipfile.ZIP_STORED for method, data in content.values())
+    # the sources are kept as the translator included them, the documentation is dropped
+    assert 'sources/M.c' in content and 'documentation/index.html' not in content
+    assert 'binaries/win64/M.dll' in content
+    assert len(_content(fmu)) == len(_members) + 1  # the original FMU is left as it is
+
+
+def test_fmu_without_binaries_for_the_platforms_is_not_repacked(fmu):
+    before = _content(fmu)
+    with pytest.raises(RepackError):
+        repack_fmu(fmu, RepackPolicy(platforms=['darwin64']))
+    assert _content(fmu) == before
+
+
+def test_too_large_fmu_is_not_repacked(fmu, monkeypatch):
+    # stands for the 4 GiB limit of the zip format without its ZIP64 extension
+    monkeypatch.setattr(repack, '_zip64_limit', 10000)
+    before = _content(fmu)
+    with pytest.raises(RepackError, match='too large'):
+        repack_fmu(fmu, RepackPolicy(platforms=['linux64']))
+    assert _content(fmu) == before
+    assert os.listdir(os.path.dirname(fmu)) == ['M.fmu']
+
+
+def test_policy_key():
+    key = RepackPolicy(platforms=['win64', 'linux64'], level=9).key()
+    assert key == 'platforms=linux64,win64;sources=None;documentation=False;level=9'
+    assert RepackPolicy(platforms=['linux64', 'win64'], level=9, jobs=4, verify=False).key() == key
+    assert RepackPolicy().key() == 'platforms=*;sources=None;documentation=False;level=6'
+    assert len({RepackPolicy(keep_sources=True).key(), RepackPolicy(keep_documentation=True).key(),
+                RepackPolicy(level=1).key(), RepackPolicy().key()}) == 4
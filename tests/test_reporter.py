@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from modfmu.reporter import QueuedReporter
+
+
+def _delay_puts(reporter, monkeypatch):
+    """ Delays the records put in the queue of the reporter, so that it is closed while they are being put
+
+    :return: the event set once a record is being put
+    """
+    putting = threading.Event()
+    put = reporter._queue.put
+
+    def slow_put(item, *args, **kwargs):
+        putting.set()
+        threading.Event().wait(0.3)
+        return put(item, *args, **kwargs)
+
+    monkeypatch.setattr(reporter._queue, 'put', slow_put)
+    return putting
+
+
+@pytest.mark.parametrize('max_queue', [1, 10000])
+def test_records_put_while_closing_are_written(tmp_path, monkeypatch, max_queue):
+    log = tmp_path / 'build.log'
+    report = QueuedReporter(str(log), max_queue=max_queue, policy='block')
+    report.writeOutput('first')
+    putting = _delay_puts(report, monkeypatch)
+    writer = threading.Thread(target=report.writeError, args=('written while closing',))
+    writer.start()
+    assert putting.wait(5)
+    report.close()
+    writer.join(5)
+
+    assert not writer.is_alive()
+    assert log.read_text().splitlines()[-1].endswith('*** Error: written while closing')
+    assert report.getNumberOfErrors() == 1
+
+
+def test_records_written_once_closed(tmp_path):
+    log = tmp_path / 'build.log'
+    report = QueuedReporter(str(log))
+    report.writeOutput('before')
+    report.close()
+    report.writeWarning('after')
+
+    assert report.flush(1)
+    lines = log.read_text().splitlines()
+    assert [l.split(' ', 2)[-1] for l in lines] == ['before', '*** Warning: after']
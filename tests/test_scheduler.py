@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import time
+
+import pytest
+
+from modfmu import scheduler
+from modfmu.scheduler import AdmissionController
+
+_GiB = 1024 ** 3
+
+
+class _Machine(object):
+    """Fake ``/proc`` files and load average of a machine of 4 CPUs and 16 GiB
+    """
+
+    def __init__(self):
+        self.available = 12 * _GiB
+        self.swapped = 0
+        self.swap_rate = 0
+        self.load = 0.
+
+    def read_proc(self, path):
+        if path == '/proc/meminfo':
+            return {'MemTotal': 16 * _GiB // 1024, 'MemAvailable': self.available // 1024}
+        self.swapped += self.swap_rate
+        return {'pswpin': self.swapped, 'pswpout': 0}
+
+    def getloadavg(self):
+        return self.load * 4, self.load * 4, self.load * 4
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    machine = _Machine()
+    monkeypatch.setattr(scheduler, '_read_proc', machine.read_proc)
+    monkeypatch.setattr(os, 'getloadavg', machine.getloadavg)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    return machine
+
+
+def _controller():
+    return AdmissionController(max_jobs=4, job_memory=_GiB, warmup=0., interval=0.01, increase_interval=0.)
+
+
+def _admitted(controller, timeout=0.3):
+    """ True if a job is admitted within ``timeout`` seconds. A job not admitted leaves the queue.
+    """
+    try:
+        asyncio.run(asyncio.wait_for(controller.acquire_async(), timeout))
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def test_limit_grows_while_the_machine_has_room(machine):
+    controller = _controller()
+    tickets = [controller.acquire() for i in range(4)]
+    assert controller.limit == 4 and controller.stats()['increases'] == 3
+    assert not _admitted(controller)
+    controller.release(tickets.pop())
+    assert _admitted(controller)
+    assert controller.stats()['queue_depth'] == 0
+
+
+def test_limit_decreases_under_memory_pressure_and_grows_back(machine):
+    controller = _controller()
+    tickets = [controller.acquire() for i in range(4)]
+
+    machine.available = _GiB  # below the reserve of 10 % of the memory
+    assert not _admitted(controller)
+    stats = controller.stats()
+    assert stats['limit'] == 1 and stats['decreases'] == 2 and stats['memory_available'] == _GiB
+    for ticket in tickets:
+        controller.release(ticket)
+    # min_jobs are admitted whatever the memory
+    tickets = [controller.acquire()]
+    assert not _admitted(controller)
+
+    machine.available = 12 * _GiB
+    tickets += [controller.acquire() for i in range(3)]
+    assert controller.limit == 4 and controller.stats()['increases'] == 6
+
+
+def test_limit_decreases_when_the_machine_swaps(machine):
+    controller = _controller()
+    tickets = [controller.acquire() for i in range(2)]
+    machine.swap_rate = 10 * scheduler._swap_threshold
+    # the next sample of the machine is a new one
+    time.sleep(0.05)
+    assert not _admitted(controller)
+    assert controller.limit == 1 and controller.stats()['swapping']
+    controller.release(tickets.pop())
+    machine.swap_rate = 0
+    assert _admitted(controller)
+
+
+def test_limit_does_not_grow_under_load(machine):
+    controller = _controller()
+    machine.load = 2.
+    controller.acquire()
+    assert not _admitted(controller)
+    assert controller.limit == 1 and controller.stats()['increases'] == 0
+
+
+def test_resolve_jobs(machine, monkeypatch):
+    monkeypatch.setattr(scheduler, '_installed', [None])
+    assert scheduler.resolve_jobs(3) == (3, None)
+
+    jobs, controller = scheduler.resolve_jobs('auto')
+    assert jobs == 4 and isinstance(controller, AdmissionController)
+    assert scheduler.current() is None
+
+    installed = AdmissionController(max_jobs=8)
+    scheduler.install(installed)
+    assert scheduler.resolve_jobs('auto') == (8, installed)
+    used = AdmissionController(max_jobs=2)
+    with scheduler.use(used):
+        assert scheduler.resolve_jobs('auto') == (2, used)
+    assert scheduler.current() is installed
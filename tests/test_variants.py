@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import zipfile
+
+import pytest
+
+from modfmu.variants import split_modifier, write_variant
+
+
+def test_parameters_are_split_from_structural_modifications():
+    assert split_modifier('(k=2, sub(p={1, 2}, redeclare model M = N))') == \
+        ('(sub(redeclare model M = N))', {'k': 2, 'sub.p[1]': 1, 'sub.p[2]': 2})
+    assert split_modifier('') == ('', {})
+
+
+def test_attribute_modification_is_kept_with_all_its_arguments():
+    assert split_modifier('(x(start=1, fixed=true), k=2)') == ('(x(start=1, fixed=true))', {'k': 2})
+    assert split_modifier('(sub(p=2, start=3))') == ('(sub(p=2, start=3))', {})
+
+
+def test_nested_attribute_modification():
+    assert split_modifier('(a(b(start=1, c=2), d=3), e=true)') == ('(a(b(start=1, c=2)))', {'a.d': 3, 'e': True})
+    assert split_modifier('(a(b(c=2, fixed=false)), redeclare package Medium = M)') == \
+        ('(a(b(c=2, fixed=false)), redeclare package Medium = M)', {})
+
+
+def test_attribute_modification_and_value_at_once_is_structural():
+    assert split_modifier('(k(fixed=false)=2, p=1)') == ('(k(fixed=false)=2)', {'p': 1})
+
+
+def _fmu(path, fmi_version):
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('modelDescription.xml',
+                   '<fmiModelDescription fmiVersion="{}" modelIdentifier="M" guid="g">'
+                   '<ModelVariables><ScalarVariable name="k" variability="parameter"><Real start="1"/></ScalarVariable>'
+                   '</ModelVariables></fmiModelDescription>'.format(fmi_version))
+        z.writestr('binaries/linux64/M.so', b'')
+    return str(path)
+
+
+def test_fmi1_variant_cannot_be_renamed(tmp_path):
+    fmu = _fmu(tmp_path / 'M.fmu', '1.0')
+    with pytest.raises(ValueError):
+        write_variant(fmu, str(tmp_path / 'V.fmu'), {'k': 2.}, model_identifier='V')
+    write_variant(fmu, str(tmp_path / 'V.fmu'), {'k': 2.})
+    with zipfile.ZipFile(str(tmp_path / 'V.fmu')) as z:
+        assert 'binaries/linux64/M.so' in z.namelist()
+        assert b'start="2.0"' in z.read('modelDescription.xml')
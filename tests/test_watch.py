@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+from modfmu import dependencies
+from modfmu.library_index import LibraryIndex
+from modfmu.modelica import Package
+from modfmu.watch import PackageWatcher
+
+
+def test_graph_is_updated_for_the_changed_files(library, monkeypatch):
+    monkeypatch.setattr(LibraryIndex, 'refresh_interval', 0.)
+    root, packages = library
+    sub = os.path.realpath(os.path.join(packages[0], 'Sub'))
+    Package(sub)
+    with open(os.path.join(sub, 'S.mo'), 'w') as f:
+        f.write('within BenchLib.P0.Sub;\nmodel S\nend S;\n')
+    watcher = PackageWatcher(Package(packages[0]))
+    watcher._graph = watcher._update_graph(None)
+    files = watcher._graph.files
+    assert os.path.join(sub, 'S.mo') in files
+
+    parsed = list()
+    parse = dependencies.parse_modelica_file
+    monkeypatch.setattr(dependencies, 'parse_modelica_file', lambda path: parsed.append(path) or parse(path))
+    changed = os.path.realpath(os.path.join(packages[0], 'M1.mo'))
+    with open(changed, 'a') as f:
+        f.write('// edited\n')
+    graph = watcher._update_graph({changed})
+    assert parsed == [changed]
+    assert graph.files == files
+
+    # the files of a removed directory are removed from the graph
+    watcher._graph = graph
+    shutil.rmtree(sub)
+    assert watcher._update_graph({sub}).files == [f for f in files if not f.startswith(sub + os.path.sep)]